@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib import messages as dj_messages
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count
+from django.utils import timezone
 from .models import (
     Servicio,
     Profesional,
@@ -16,24 +18,88 @@ from .models import (
     PerfilUsuario,
     EmailVerificationToken,
     EmailFailureLog,
+    Tarea,
+    Candado,
+    CorridaRecordatorios,
+    NotificacionMP,
 )
+from .tasks import encolar
 
 admin.site.register(MedioDePago)
 admin.site.register(Categoria)
 admin.site.register(PerfilUsuario)
 admin.site.register(HorarioLaboral)
-admin.site.register(DiaNoDisponible)
 admin.site.register(SubServicio)
 
 admin.site.register(EmailVerificationToken)
 
 
+@admin.action(description="Reintentar envío de los seleccionados")
+def reintentar_envios(modeladmin, request, queryset):
+    ids = list(queryset.filter(resolved=False).values_list('id', flat=True))
+    if not ids:
+        modeladmin.message_user(request, 'No hay correos pendientes en la selección.', dj_messages.WARNING)
+        return
+    EmailFailureLog.objects.filter(id__in=ids).update(next_retry_at=timezone.now())
+    encolar('emails.reintentar_fallidos', ids=ids)
+    modeladmin.message_user(request, f'{len(ids)} correos encolados para reintentar.', dj_messages.SUCCESS)
+
+
 @admin.register(EmailFailureLog)
 class EmailFailureLogAdmin(admin.ModelAdmin):
-    list_display = ('created_at', 'event_type', 'recipient', 'subject', 'resolved', 'retry_count')
-    list_filter = ('event_type', 'resolved', 'created_at')
-    search_fields = ('recipient', 'subject', 'error_message')
-    readonly_fields = ('created_at', 'event_type', 'recipient', 'subject', 'html_content', 'error_message', 'retry_count')
+    list_display = ('created_at', 'event_type', 'recipient', 'subject', 'resolved', 'resolution', 'retry_count', 'next_retry_at')
+    list_filter = ('event_type', 'resolved', 'resolution', 'created_at')
+    search_fields = ('recipient', 'subject', 'error_message', 'idempotency_key')
+    readonly_fields = (
+        'created_at', 'event_type', 'recipient', 'subject', 'html_content', 'error_message', 'retry_count',
+        'idempotency_key', 'resolution',
+    )
+    actions = [reintentar_envios]
+
+
+@admin.action(description="Reencolar tareas seleccionadas")
+def reencolar_tareas(modeladmin, request, queryset):
+    queryset.exclude(estado=Tarea.EN_CURSO).update(
+        estado=Tarea.PENDIENTE, intentos=0, disponible_desde=timezone.now(), terminada=None,
+    )
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nombre', 'estado', 'intentos', 'max_intentos', 'disponible_desde', 'creada', 'terminada')
+    list_filter = ('estado', 'nombre')
+    search_fields = ('nombre', 'ultimo_error')
+    readonly_fields = ('creada', 'terminada', 'tomada_por', 'bloqueada_hasta', 'ultimo_error')
+    actions = [reencolar_tareas]
+
+
+@admin.register(Candado)
+class CandadoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'token', 'vence', 'adquirido', 'titular')
+    readonly_fields = ('nombre', 'titular', 'token', 'adquirido')
+
+
+@admin.register(CorridaRecordatorios)
+class CorridaRecordatoriosAdmin(admin.ModelAdmin):
+    list_display = ('id', 'estado', 'activa', 'creada', 'iniciada', 'terminada')
+    list_filter = ('estado',)
+    readonly_fields = ('creada', 'iniciada', 'terminada', 'contadores', 'error')
+
+
+@admin.action(description="Volver a procesar las notificaciones seleccionadas")
+def reprocesar_notificaciones(modeladmin, request, queryset):
+    cantidad = queryset.update(estado=NotificacionMP.PENDIENTE, intentos=0, procesada=None)
+    encolar('mercadopago.notificaciones')
+    modeladmin.message_user(request, f'{cantidad} notificaciones encoladas para procesar.', dj_messages.SUCCESS)
+
+
+@admin.register(NotificacionMP)
+class NotificacionMPAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topico', 'recurso_id', 'accion', 'estado', 'intentos', 'recibida', 'procesada')
+    list_filter = ('estado', 'topico')
+    search_fields = ('recurso_id', 'notificacion_id')
+    readonly_fields = ('notificacion_id', 'cuerpo', 'recibida', 'procesada', 'ultimo_error')
+    actions = [reprocesar_notificaciones]
 
 
 @admin.action(description="Activar servicios seleccionados (pago recibido)")
@@ -72,6 +138,19 @@ class ProfesionalAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'servicio', 'activo')
     list_filter = ('servicio',)
     search_fields = ('nombre', 'email')
+    list_select_related = ('servicio',)
+
+
+@admin.register(DiaNoDisponible)
+class DiaNoDisponibleAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'profesional', 'fecha_inicio', 'fecha_fin', 'motivo')
+    list_filter = ('fecha_inicio',)
+    list_select_related = ('profesional__servicio',)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'profesional':
+            kwargs['queryset'] = Profesional.objects.select_related('servicio')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 def _servicio_plan_del_propietario_text(obj):
     if obj is None or not getattr(obj, 'pk', None):
@@ -105,6 +184,7 @@ class ServicioAdmin(admin.ModelAdmin):
     )
     list_filter = ('esta_activo',)
     search_fields = ('nombre', 'propietario__username')
+    list_select_related = ('propietario__suscripcion__plan',)
     actions = [activar_servicios, desactivar_servicios]
     prepopulated_fields = {'slug': ('nombre',)}
 
@@ -126,11 +206,21 @@ class TurnoAdmin(admin.ModelAdmin):
     list_display = ('id', 'servicio', 'cliente', 'fecha', 'hora', 'estado')
     list_filter = ('estado', 'fecha', 'servicio')
     search_fields = ('cliente__username', 'servicio__nombre')
+    # Turno.__str__ usa cliente y servicio.
+    list_select_related = ('servicio', 'cliente')
 
 @admin.register(Reseña)
 class ReseñaAdmin(admin.ModelAdmin):
     list_display = ('turno', 'usuario', 'calificacion', 'fecha_creacion')
     list_filter = ('calificacion',)
+    # Reseña.__str__ (checkbox de acciones) usa servicio y usuario; la columna turno, cliente y servicio.
+    list_select_related = ('servicio', 'usuario', 'turno__cliente', 'turno__servicio')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # El <select> de turnos llama a Turno.__str__ por cada opción.
+        if db_field.name == 'turno':
+            kwargs['queryset'] = Turno.objects.select_related('cliente', 'servicio')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Plan)
 class PlanAdmin(admin.ModelAdmin):
@@ -176,6 +266,9 @@ class SuscripcionAdmin(admin.ModelAdmin):
     list_select_related = ('usuario', 'plan')
     actions = [qa_forzar_plan_pro_activo]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(cantidad_servicios=Count('usuario__servicios_propios'))
+
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         fld = form.base_fields.get('is_active')
@@ -187,6 +280,6 @@ class SuscripcionAdmin(admin.ModelAdmin):
             )
         return form
 
-    @admin.display(description='Servicios del usuario')
+    @admin.display(description='Servicios del usuario', ordering='cantidad_servicios')
     def servicios_propios_usuario(self, obj):
-        return obj.usuario.servicios_propios.count()
\ No newline at end of file
+        return obj.cantidad_servicios
\ No newline at end of file
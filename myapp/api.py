@@ -3,12 +3,12 @@ from .models import Servicio, Turno
 from .serializers import ServicioSerializer, TurnoSerializer
 
 class ServicioViewSet(viewsets.ModelViewSet):
-    queryset = Servicio.objects.all()
+    queryset = Servicio.objects.prefetch_related('favoritos', 'medios_de_pago_aceptados')
     serializer_class = ServicioSerializer
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
 
 class TurnoViewSet(viewsets.ModelViewSet):
-    queryset = Turno.objects.all()
+    queryset = Turno.objects.select_related('cliente')
     serializer_class = TurnoSerializer
     
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -6,4 +6,9 @@ class MyappConfig(AppConfig):
     name = 'myapp'
     
     def ready(self):
+        import myapp.checks
         import myapp.signals
+        # Registran sus tareas (emails.reintentar_fallidos, recordatorios.*, mercadopago.notificaciones).
+        import myapp.email_retry
+        import myapp.mp_notifications
+        import myapp.reminders
@@ -0,0 +1,450 @@
+"""
+Motor de disponibilidad de turnos.
+
+Cada día de un profesional se representa como un bitmap por minuto: un ``int`` de
+1440 bits donde el bit ``m`` vale 1 si el minuto ``m`` del día está libre. Se arma
+con los períodos de trabajo de las reglas de HorarioLaboral (el descanso queda
+afuera) y se le restan los bloqueos (DiaNoDisponible) y los turnos activos junto
+con el ``duracion_buffer_minutos`` del servicio.
+
+Los huecos para una ``duracion`` se buscan con una sola pasada de ventana
+deslizante bit a bit (AND desplazado, O(log duracion) operaciones sobre el int),
+en lugar de recorrer todos los turnos y bloqueos por cada slot candidato.
+
+Los inicios libres de cada (profesional, fecha, duracion) se guardan en la caché
+de Django con claves versionadas; ``signals.py`` sube la versión del día, del
+profesional o del servicio cuando cambia algo que los afecta.
+"""
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import cache_versions
+from .models import DiaNoDisponible, HorarioLaboral, Turno
+
+MINUTOS_DIA = 24 * 60
+PASO_SLOT_MINUTOS = 15
+DIAS_SEMANA = ('lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo')
+ESTADOS_QUE_OCUPAN = ('pendiente', 'confirmado')
+# Valor de ``profesional_id`` para pedir la unión de todo el equipo.
+PROFESIONAL_CUALQUIERA = 'cualquiera'
+# Tope del endpoint de rango: ~6 semanas cubren el mes visible del calendario.
+MAX_DIAS_RANGO = 42
+
+
+def minuto_del_dia(hora, redondear_arriba=False):
+    """Minutos desde las 00:00. Con ``redondear_arriba`` los segundos cuentan como minuto entero."""
+    minuto = hora.hour * 60 + hora.minute
+    if redondear_arriba and (hora.second or hora.microsecond):
+        minuto += 1
+    return minuto
+
+
+def formatear_minuto(minuto):
+    return f'{minuto // 60:02d}:{minuto % 60:02d}'
+
+
+def mascara_rango(inicio, fin):
+    """Máscara con los bits ``[inicio, fin)`` encendidos, recortada a los límites del día."""
+    inicio = max(0, inicio)
+    fin = min(MINUTOS_DIA, fin)
+    if fin <= inicio:
+        return 0
+    return ((1 << (fin - inicio)) - 1) << inicio
+
+
+def ventanas_libres(libres, duracion):
+    """
+    Devuelve una máscara donde el bit ``m`` está encendido si y sólo si los minutos
+    ``[m, m + duracion)`` están todos libres en ``libres``.
+    Duplica el ancho cubierto en cada paso, así que son ~log2(duracion) AND.
+    """
+    if duracion <= 0:
+        return libres
+    ventana = libres
+    cubierto = 1
+    while cubierto < duracion:
+        salto = min(cubierto, duracion - cubierto)
+        ventana &= ventana >> salto
+        cubierto += salto
+    return ventana
+
+
+def periodos_de_trabajo(regla):
+    """Períodos ``(inicio, fin)`` en minutos de una regla, partiendo la jornada si hay descanso."""
+    apertura = minuto_del_dia(regla.horario_apertura)
+    cierre = minuto_del_dia(regla.horario_cierre)
+    if regla.tiene_descanso and regla.descanso_inicio and regla.descanso_fin:
+        return [
+            (apertura, minuto_del_dia(regla.descanso_inicio)),
+            (minuto_del_dia(regla.descanso_fin), cierre),
+        ]
+    return [(apertura, cierre)]
+
+
+def regla_aplica(regla, fecha):
+    return regla.activo and getattr(regla, DIAS_SEMANA[fecha.weekday()])
+
+
+def bloqueo_aplica(bloqueo, fecha):
+    """Un bloqueo sin ``fecha_fin`` cubre sólo su ``fecha_inicio``."""
+    fin = bloqueo.fecha_fin or bloqueo.fecha_inicio
+    return bloqueo.fecha_inicio <= fecha <= fin
+
+
+def filtro_bloqueos(desde, hasta):
+    """Q para los DiaNoDisponible que tocan algún día de ``[desde, hasta]``."""
+    return Q(fecha_inicio__lte=hasta) & (
+        Q(fecha_fin__gte=desde) | Q(fecha_fin__isnull=True, fecha_inicio__gte=desde)
+    )
+
+
+class MapaDia:
+    """Bitmap de minutos libres de un profesional en un día concreto."""
+
+    __slots__ = ('libres', 'periodos')
+
+    def __init__(self, periodos=()):
+        self.periodos = sorted(set(periodos))
+        self.libres = 0
+        for inicio, fin in self.periodos:
+            self.libres |= mascara_rango(inicio, fin)
+
+    @classmethod
+    def desde_datos(cls, reglas, bloqueos, turnos, buffer_minutos):
+        """
+        ``reglas``: HorarioLaboral que aplican ese día. ``bloqueos``: DiaNoDisponible del día.
+        ``turnos``: pares ``(hora, duracion_total)`` de los turnos que ocupan agenda.
+        """
+        mapa = cls(periodo for regla in reglas for periodo in periodos_de_trabajo(regla))
+        for bloqueo in bloqueos:
+            mapa.ocupar_bloqueo(bloqueo)
+        for hora, duracion in turnos:
+            mapa.ocupar_turno(hora, duracion, buffer_minutos)
+        return mapa
+
+    def ocupar(self, inicio, fin):
+        self.libres &= ~mascara_rango(inicio, fin)
+
+    def ocupar_bloqueo(self, bloqueo):
+        if bloqueo.hora_inicio is None:
+            self.libres = 0
+            return
+        fin = minuto_del_dia(bloqueo.hora_fin, redondear_arriba=True) if bloqueo.hora_fin else MINUTOS_DIA
+        self.ocupar(minuto_del_dia(bloqueo.hora_inicio), fin)
+
+    def ocupar_turno(self, hora, duracion, buffer_minutos=0):
+        inicio = minuto_del_dia(hora)
+        self.ocupar(inicio, inicio + duracion + buffer_minutos)
+
+    def esta_libre(self, inicio, duracion):
+        mascara = mascara_rango(inicio, inicio + duracion)
+        return inicio + duracion <= MINUTOS_DIA and self.libres & mascara == mascara
+
+    def inicios_libres(self, duracion, desde_minuto=0, paso=PASO_SLOT_MINUTOS):
+        """
+        Minutos de inicio (alineados a ``paso`` desde el comienzo de cada período de
+        trabajo) donde entra un turno de ``duracion`` minutos sin pisar nada.
+        """
+        ventana = ventanas_libres(self.libres, duracion)
+        if not ventana:
+            return []
+        inicios = set()
+        for inicio_periodo, fin_periodo in self.periodos:
+            for minuto in range(inicio_periodo, fin_periodo - duracion + 1, paso):
+                if minuto >= desde_minuto and (ventana >> minuto) & 1:
+                    inicios.add(minuto)
+        return sorted(inicios)
+
+
+def primer_minuto_reservable(fecha, ahora=None):
+    """Para hoy descarta los slots que ya empezaron; los días pasados no tienen ninguno."""
+    ahora = ahora or timezone.localtime()
+    hoy = ahora.date()
+    if fecha > hoy:
+        return 0
+    if fecha < hoy:
+        return MINUTOS_DIA
+    return minuto_del_dia(ahora.time(), redondear_arriba=True)
+
+
+def mapa_profesional(profesional, fecha, buffer_minutos):
+    """Arma el MapaDia de un profesional con 3 consultas (reglas, bloqueos, turnos)."""
+    reglas = list(profesional.horarios.filter(activo=True, **{DIAS_SEMANA[fecha.weekday()]: True}))
+    if not reglas:
+        return MapaDia()
+    bloqueos = DiaNoDisponible.objects.filter(profesional=profesional).filter(filtro_bloqueos(fecha, fecha))
+    turnos = Turno.objects.filter(
+        profesional=profesional, fecha=fecha, estado__in=ESTADOS_QUE_OCUPAN,
+    ).values_list('hora', 'duracion_total')
+    return MapaDia.desde_datos(reglas, bloqueos, turnos, buffer_minutos)
+
+
+def iterar_fechas(desde, hasta):
+    fecha = desde
+    while fecha <= hasta:
+        yield fecha
+        fecha += timedelta(days=1)
+
+
+def mapas_rango(profesional_ids, desde, hasta, buffer_minutos):
+    """
+    ``{(profesional_id, fecha): MapaDia}`` para todos los días de ``[desde, hasta]``.
+    Hace siempre 3 consultas (reglas, bloqueos, turnos), sea cual sea el largo del rango
+    o la cantidad de profesionales; el reparto por día se hace en memoria.
+    Los días sin regla activa no aparecen en el resultado.
+    """
+    profesional_ids = list(profesional_ids)
+    reglas_por_prof = defaultdict(list)
+    for regla in HorarioLaboral.objects.filter(profesional_id__in=profesional_ids, activo=True):
+        reglas_por_prof[regla.profesional_id].append(regla)
+    if not reglas_por_prof:
+        return {}
+
+    bloqueos_por_prof = defaultdict(list)
+    bloqueos = DiaNoDisponible.objects.filter(profesional_id__in=reglas_por_prof).filter(
+        filtro_bloqueos(desde, hasta)
+    )
+    for bloqueo in bloqueos:
+        bloqueos_por_prof[bloqueo.profesional_id].append(bloqueo)
+
+    turnos_por_dia = defaultdict(list)
+    turnos = Turno.objects.filter(
+        profesional_id__in=reglas_por_prof,
+        fecha__gte=desde,
+        fecha__lte=hasta,
+        estado__in=ESTADOS_QUE_OCUPAN,
+    ).values_list('profesional_id', 'fecha', 'hora', 'duracion_total')
+    for profesional_id, fecha, hora, duracion in turnos:
+        turnos_por_dia[(profesional_id, fecha)].append((hora, duracion))
+
+    mapas = {}
+    for fecha in iterar_fechas(desde, hasta):
+        for profesional_id, reglas in reglas_por_prof.items():
+            reglas_del_dia = [regla for regla in reglas if regla_aplica(regla, fecha)]
+            if not reglas_del_dia:
+                continue
+            mapas[(profesional_id, fecha)] = MapaDia.desde_datos(
+                reglas_del_dia,
+                [b for b in bloqueos_por_prof[profesional_id] if bloqueo_aplica(b, fecha)],
+                turnos_por_dia[(profesional_id, fecha)],
+                buffer_minutos,
+            )
+    return mapas
+
+
+# --- Caché de inicios libres ---------------------------------------------------
+
+_PREFIJO_CACHE = 'slots'
+_CLAVE_HITS = f'{_PREFIJO_CACHE}:stats:hits'
+_CLAVE_MISSES = f'{_PREFIJO_CACHE}:stats:misses'
+
+_contadores_locales = {'hits': 0, 'misses': 0}
+_contadores_lock = threading.Lock()
+
+
+def _clave_version_servicio(servicio_id):
+    return f'{_PREFIJO_CACHE}:v:s:{servicio_id}'
+
+
+def _clave_version_profesional(profesional_id):
+    return f'{_PREFIJO_CACHE}:v:p:{profesional_id}'
+
+
+def _clave_version_dia(profesional_id, fecha):
+    return f'{_PREFIJO_CACHE}:v:d:{profesional_id}:{fecha.isoformat()}'
+
+
+def invalidar_dias(profesional_id, fechas):
+    """Turnos y bloqueos: sólo los días tocados de ese profesional."""
+    if profesional_id:
+        cache_versions.subir(_clave_version_dia(profesional_id, fecha) for fecha in set(fechas) if fecha)
+
+
+def invalidar_profesional(profesional_id):
+    """Reglas de HorarioLaboral: todas las fechas del profesional."""
+    if profesional_id:
+        cache_versions.subir([_clave_version_profesional(profesional_id)])
+
+
+def invalidar_servicio(servicio_id):
+    """Cambio de ``duracion_buffer_minutos``: todos los profesionales del servicio."""
+    if servicio_id:
+        cache_versions.subir([_clave_version_servicio(servicio_id)])
+
+
+def _contar(hits, misses):
+    with _contadores_lock:
+        _contadores_locales['hits'] += hits
+        _contadores_locales['misses'] += misses
+    for clave, valor in ((_CLAVE_HITS, hits), (_CLAVE_MISSES, misses)):
+        if not valor:
+            continue
+        cache.add(clave, 0, None)
+        try:
+            cache.incr(clave, valor)
+        except ValueError:
+            cache.set(clave, valor, None)
+
+
+def estadisticas_cache():
+    """Hits/misses compartidos (todos los procesos que usan la misma caché) y los de este proceso."""
+    valores = cache.get_many([_CLAVE_HITS, _CLAVE_MISSES])
+    hits = valores.get(_CLAVE_HITS, 0)
+    misses = valores.get(_CLAVE_MISSES, 0)
+    total = hits + misses
+    with _contadores_lock:
+        locales = dict(_contadores_locales)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'proceso': locales,
+    }
+
+
+def reiniciar_estadisticas_cache():
+    cache.delete_many([_CLAVE_HITS, _CLAVE_MISSES])
+    with _contadores_lock:
+        _contadores_locales.update(hits=0, misses=0)
+
+
+def inicios_por_dia(servicio_id, profesional_ids, desde, hasta, duracion, buffer_minutos):
+    """
+    ``{(profesional_id, fecha): [minutos]}`` de todo el rango, sin filtrar la hora actual
+    (así la entrada de hoy sigue sirviendo durante el día). Lee la caché en dos
+    ``get_many`` (más un ``add`` por versión que falte) y calcula los faltantes juntos con
+    ``mapas_rango``.
+    """
+    profesional_ids = list(profesional_ids)
+    fechas = list(iterar_fechas(desde, hasta))
+    claves_version = [_clave_version_servicio(servicio_id)]
+    claves_version += [_clave_version_profesional(pid) for pid in profesional_ids]
+    claves_version += [_clave_version_dia(pid, fecha) for pid in profesional_ids for fecha in fechas]
+    versiones = cache_versions.vigentes(claves_version)
+    version_servicio = versiones.get(_clave_version_servicio(servicio_id))
+
+    claves = {}
+    for pid in profesional_ids:
+        version_prof = versiones.get(_clave_version_profesional(pid))
+        for fecha in fechas:
+            version_dia = versiones.get(_clave_version_dia(pid, fecha))
+            claves[(pid, fecha)] = (
+                f'{_PREFIJO_CACHE}:{servicio_id}:{pid}:{fecha.isoformat()}:{duracion}:'
+                f'{version_servicio}.{version_prof}.{version_dia}'
+            )
+
+    cacheados = cache.get_many(claves.values())
+    resultado = {}
+    faltantes = []
+    for dia, clave in claves.items():
+        if clave in cacheados:
+            resultado[dia] = cacheados[clave]
+        else:
+            faltantes.append(dia)
+    _contar(len(resultado), len(faltantes))
+
+    if faltantes:
+        mapas = mapas_rango(
+            {pid for pid, _ in faltantes},
+            min(fecha for _, fecha in faltantes),
+            max(fecha for _, fecha in faltantes),
+            buffer_minutos,
+        )
+        nuevos = {}
+        for dia in faltantes:
+            mapa = mapas.get(dia)
+            inicios = mapa.inicios_libres(duracion) if mapa else []
+            resultado[dia] = inicios
+            nuevos[claves[dia]] = inicios
+        cache.set_many(nuevos, getattr(settings, 'SLOTS_CACHE_TIMEOUT', 300))
+    return resultado
+
+
+def slots_disponibles(profesional, fecha, duracion, buffer_minutos, ahora=None):
+    """
+    Horarios libres (``'HH:MM'``) de ``profesional`` en ``fecha`` para un turno de
+    ``duracion`` minutos. Si hay varias reglas activas para ese día se usa su unión.
+    """
+    inicios = inicios_por_dia(
+        profesional.servicio_id, [profesional.pk], fecha, fecha, duracion, buffer_minutos,
+    )[(profesional.pk, fecha)]
+    desde_minuto = primer_minuto_reservable(fecha, ahora)
+    return [formatear_minuto(minuto) for minuto in inicios if minuto >= desde_minuto]
+
+
+def slots_rango(servicio_id, profesional_ids, desde, hasta, duracion, buffer_minutos, ahora=None):
+    """``{fecha: {profesional_id: ['HH:MM', ...]}}`` para cada día del rango (listas vacías incluidas)."""
+    ahora = ahora or timezone.localtime()
+    profesional_ids = list(profesional_ids)
+    inicios = inicios_por_dia(servicio_id, profesional_ids, desde, hasta, duracion, buffer_minutos)
+    resultado = {}
+    for fecha in iterar_fechas(desde, hasta):
+        desde_minuto = primer_minuto_reservable(fecha, ahora)
+        resultado[fecha] = {
+            profesional_id: [
+                formatear_minuto(minuto)
+                for minuto in inicios[(profesional_id, fecha)]
+                if minuto >= desde_minuto
+            ]
+            for profesional_id in profesional_ids
+        }
+    return resultado
+
+
+# --- "Cualquier profesional" ----------------------------------------------------
+
+def profesionales_candidatos(servicio, sub_servicio_ids=()):
+    """
+    IDs de los profesionales activos del servicio que ofrecen todos los
+    ``sub_servicio_ids`` pedidos, en una consulta. Quien no tiene sub-servicios
+    cargados (p. ej. el perfil del propietario creado al dar de alta el negocio)
+    se considera que ofrece todo el catálogo.
+    """
+    sub_servicio_ids = set(sub_servicio_ids)
+    qs = servicio.profesionales.filter(activo=True)
+    if sub_servicio_ids:
+        qs = qs.annotate(
+            total_ofrecidos=Count('sub_servicios_ofrecidos', distinct=True),
+            coincidencias=Count(
+                'sub_servicios_ofrecidos',
+                filter=Q(sub_servicios_ofrecidos__in=sub_servicio_ids),
+                distinct=True,
+            ),
+        ).filter(Q(total_ofrecidos=0) | Q(coincidencias=len(sub_servicio_ids)))
+    return list(qs.order_by('id').values_list('id', flat=True))
+
+
+def unir_slots(slots_por_profesional):
+    """Unión ordenada de los ``'HH:MM'`` de varios profesionales."""
+    return sorted({slot for slots in slots_por_profesional.values() for slot in slots})
+
+
+def elegir_profesional(servicio, profesional_ids, fecha, hora, duracion):
+    """
+    Entre ``profesional_ids``, el que tiene libre ``[hora, hora + duracion)`` en ``fecha``
+    y menos minutos reservados ese día (a igualdad, el de menor id). ``None`` si nadie
+    tiene el hueco. Consultas fijas: las 3 de ``mapas_rango`` más la carga del día.
+    """
+    profesional_ids = list(profesional_ids)
+    if not profesional_ids:
+        return None
+    mapas = mapas_rango(profesional_ids, fecha, fecha, servicio.duracion_buffer_minutos)
+    inicio = minuto_del_dia(hora)
+    libres = [
+        pid for pid in profesional_ids
+        if (pid, fecha) in mapas and mapas[(pid, fecha)].esta_libre(inicio, duracion)
+    ]
+    if not libres:
+        return None
+    carga = dict(
+        Turno.objects.filter(
+            profesional_id__in=libres, fecha=fecha, estado__in=ESTADOS_QUE_OCUPAN,
+        ).values('profesional_id').annotate(minutos=Sum('duracion_total')).values_list('profesional_id', 'minutos')
+    )
+    return min(libres, key=lambda pid: (carga.get(pid) or 0, pid))
@@ -0,0 +1,57 @@
+"""
+Alta de turnos con control de solapamiento.
+
+La grilla de slots que ve el cliente puede estar vieja para cuando llega el POST, y el
+``unique_together`` de Turno sólo frena dos turnos a la misma hora exacta (no un 10:15
+encima de un 10:00 de una hora). Por eso el alta vuelve a mirar la agenda *dentro* de una
+transacción, con las filas de los profesionales candidatos bloqueadas (SELECT ... FOR
+UPDATE): dos reservas que compiten por el mismo profesional se serializan y la segunda ve
+el turno de la primera.
+
+Las reglas de ocupación son las mismas que usa ``availability`` para armar los slots:
+cada turno existente ocupa su duración más el buffer del servicio.
+"""
+from django.db import IntegrityError, transaction
+
+from .availability import elegir_profesional
+from .models import Profesional
+
+
+class TurnoNoDisponible(Exception):
+    """El hueco pedido ya no está libre para ninguno de los profesionales posibles."""
+
+
+def reservar_turno(turno, profesional_ids, sub_servicios=()):
+    """
+    Guarda ``turno`` (sin guardar, con servicio, cliente, fecha, hora y duracion_total
+    cargados) asignándole uno de ``profesional_ids`` que tenga el hueco libre: el único
+    si es uno solo, o el menos cargado si son varios ("cualquier profesional").
+
+    Los profesionales se bloquean en orden de id para que dos reservas con candidatos
+    cruzados no se traben entre sí. Levanta ``TurnoNoDisponible`` si nadie tiene el hueco.
+    En bases sin ``select_for_update`` (SQLite) el bloqueo es un no-op y la última
+    defensa sigue siendo el ``unique_together``.
+    """
+    servicio = turno.servicio
+    with transaction.atomic():
+        bloqueados = list(
+            Profesional.objects.select_for_update()
+            .filter(id__in=list(profesional_ids), servicio=servicio)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        elegido_id = elegir_profesional(
+            servicio, bloqueados, turno.fecha, turno.hora, turno.duracion_total,
+        )
+        if elegido_id is None:
+            raise TurnoNoDisponible()
+
+        turno.profesional_id = elegido_id
+        try:
+            with transaction.atomic():
+                turno.save()
+        except IntegrityError as exc:
+            raise TurnoNoDisponible() from exc
+        if sub_servicios:
+            turno.sub_servicios_solicitados.set(sub_servicios)
+    return turno
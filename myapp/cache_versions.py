@@ -0,0 +1,36 @@
+"""
+Claves de versión para las cachés invalidables (disponibilidad, métricas, estado del usuario).
+
+Cada dato cacheado lleva en su clave las versiones de lo que lo afecta; invalidar es subir
+esas versiones, así que lo viejo queda inalcanzable y expira solo. Las versiones son
+``time.time_ns()`` y no vencen.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def subir(claves):
+    """
+    Sube las versiones de ``claves`` tras el commit: si se subieran antes, otra request
+    podría volver a cachear el estado viejo (todavía visible) bajo la versión nueva.
+    """
+    claves = list(claves)
+    if claves:
+        transaction.on_commit(lambda: cache.set_many({clave: time.time_ns() for clave in claves}, None))
+
+
+def vigentes(claves):
+    """
+    ``{clave: versión}`` con un ``get_many``. Si una no está (nunca se subió o la caché la
+    descartó) se crea con ``cache.add`` y una versión nueva: asumir un valor fijo podía
+    revivir datos cacheados antes de una invalidación cuya versión se perdió.
+    """
+    versiones = cache.get_many(claves)
+    faltantes = [clave for clave in claves if clave not in versiones]
+    if faltantes:
+        for clave in faltantes:
+            cache.add(clave, time.time_ns(), None)
+        versiones.update(cache.get_many(faltantes))
+    return versiones
@@ -0,0 +1,30 @@
+"""System checks de despliegue propios de la app."""
+from django.conf import settings
+from django.core.checks import Error, register
+
+_CACHES_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def cache_compartida(app_configs, **kwargs):
+    """
+    Gunicorn, process_tasks y run_reminder_scheduler son procesos distintos: las versiones que
+    sube uno (estado de cuenta al pagar por webhook, slots, métricas) y el circuit breaker de
+    Pidgeon viven en la caché, y con locmem cada proceso tiene la suya.
+    """
+    if not settings.CACHE_COMPARTIDA_REQUERIDA:
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in _CACHES_LOCALES:
+        return []
+    return [Error(
+        f'La caché por defecto ({backend}) es local al proceso y el worker corre aparte.',
+        hint=(
+            'Configurá CACHE_URL con una caché compartida (redis://... o dbcache://cache_compartida '
+            'más `manage.py createcachetable`) o, con un único proceso, CACHE_COMPARTIDA_REQUERIDA=0.'
+        ),
+        id='myapp.E001',
+    )]
@@ -1,29 +1,22 @@
-from .models import Suscripcion
+from .entitlements import capacidades_request
+from .user_state import estado_usuario
 
 
 def plan_sidebar_flags(request):
     """
     Alinea iconos del menú lateral con la misma regla que las vistas (is_active + flags del plan).
+    También expone ``estado_cuenta`` (ver user_state) para la navbar y ``capacidades`` del
+    usuario (ver entitlements) para que los templates del panel no las pidan por servicio o turno.
     """
     if not getattr(request, 'user', None).is_authenticated:
         return {}
-    try:
-        suscripcion = Suscripcion.objects.select_related('plan').get(usuario_id=request.user.pk)
-    except Suscripcion.DoesNotExist:
-        return {
-            'plan_sidebar_metrics_locked': True,
-            'plan_sidebar_apariencia_locked': True,
-        }
-    plan = suscripcion.plan
-    if not plan:
-        return {
-            'plan_sidebar_metrics_locked': True,
-            'plan_sidebar_apariencia_locked': True,
-        }
-    ok = suscripcion.is_active
+    estado = estado_usuario(request)
+    plan = capacidades_request(request)
     return {
-        'plan_sidebar_metrics_locked': not (ok and plan.allow_metrics),
-        'plan_sidebar_apariencia_locked': not (ok and plan.allow_customization),
+        'estado_cuenta': estado,
+        'capacidades': plan,
+        'plan_sidebar_metrics_locked': not plan.metricas,
+        'plan_sidebar_apariencia_locked': not plan.personalizacion,
     }
 
 
@@ -38,17 +31,5 @@ def dashboard_premium_celebration_flag(request):
         or not path.startswith('/dashboard')
     ):
         return {'mostrar_animacion': False}
-    try:
-        suscripcion = Suscripcion.objects.select_related('plan').get(
-            usuario_id=request.user.pk
-        )
-        plan = suscripcion.plan
-        mostrar_animacion = bool(
-            suscripcion.is_active
-            and plan
-            and plan.slug != 'free'
-            and not suscripcion.ha_visto_animacion_premium
-        )
-    except Suscripcion.DoesNotExist:
-        mostrar_animacion = False
-    return {'mostrar_animacion': mostrar_animacion}
+    estado = estado_usuario(request)
+    return {'mostrar_animacion': estado.plan_de_pago_activo and not estado.ha_visto_animacion_premium}
@@ -0,0 +1,186 @@
+"""
+Reintento automático de los correos que quedaron en EmailFailureLog.
+
+Las filas con ``resolved=False`` se acumulaban y sólo se reenviaban a mano. ``reintentar_fallidos``
+las drena por lotes (``manage.py retry_failed_emails``, la tarea ``emails.reintentar_fallidos``
+que ``process_tasks`` encola cada ``EMAIL_RETRY_INTERVAL_SECONDS`` y la acción del admin):
+
+- Cierra (``expired``) los recordatorios cuyo turno ya empezó, se canceló o ya no existe: un
+  "es en 15 minutos" no sirve horas después. El turno sale de la idempotency key
+  (``reminder-client-<id>`` / ``reminder-pro-<id>``).
+- Colapsa duplicados pendientes: una sola fila por destinatario, evento e idempotency
+  key (en ``verification`` una por destinatario: cada envío nuevo invalida el token anterior).
+- Toma cada fila con un UPDATE condicional sobre ``next_retry_at``, así dos corridas a la vez no
+  mandan el mismo correo, y lo reenvía con el ``html_content`` guardado y su idempotency key.
+- Si vuelve a fallar suma ``retry_count`` y corre ``next_retry_at`` con backoff exponencial;
+  con ``EMAIL_RETRY_MAX_COUNT`` deja de reintentarse sola.
+- Con el circuito de Pidgeon abierto corta la corrida sin gastar reintentos.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import pidgeon
+from .email_service import email_retry_delay, send_email_via_pidgeon
+from .models import EmailFailureLog, Turno
+from .tasks import tarea
+
+logger = logging.getLogger(__name__)
+
+# Mientras una corrida reintenta la fila, ninguna otra la toma.
+_RESERVA = timedelta(minutes=5)
+_UNO_POR_DESTINATARIO = {'verification'}
+_PREFIJOS_RECORDATORIO = {'reminder_client': 'reminder-client-', 'reminder_pro': 'reminder-pro-'}
+
+
+def _clave_duplicado(event_type, recipient, idempotency_key):
+    if event_type in _UNO_POR_DESTINATARIO:
+        return (event_type, recipient.lower())
+    if idempotency_key:
+        return (event_type, recipient.lower(), idempotency_key)
+    return None
+
+
+def colapsar_duplicados(ids=None):
+    """Marca resueltas (``duplicate``) las pendientes repetidas; queda la más nueva. Devuelve cuántas."""
+    pendientes = EmailFailureLog.objects.filter(resolved=False)
+    if ids is not None:
+        pendientes = pendientes.filter(id__in=ids)
+    vistas = set()
+    duplicadas = []
+    filas = pendientes.order_by('-created_at', '-id').values_list('id', 'event_type', 'recipient', 'idempotency_key')
+    for fila_id, event_type, recipient, idempotency_key in filas.iterator():
+        clave = _clave_duplicado(event_type, recipient, idempotency_key)
+        if clave is None:
+            continue
+        if clave in vistas:
+            duplicadas.append(fila_id)
+        else:
+            vistas.add(clave)
+    if duplicadas:
+        EmailFailureLog.objects.filter(id__in=duplicadas).update(resolved=True, resolution='duplicate')
+    return len(duplicadas)
+
+
+def _turno_del_recordatorio(event_type, idempotency_key):
+    prefijo = _PREFIJOS_RECORDATORIO[event_type]
+    turno_id = idempotency_key[len(prefijo):] if idempotency_key.startswith(prefijo) else ''
+    return int(turno_id) if turno_id.isdigit() else None
+
+
+def cerrar_recordatorios_vencidos(ahora, ids=None):
+    """Marca resueltos (``expired``) los recordatorios pendientes que ya no corresponde mandar. Devuelve cuántos."""
+    pendientes = EmailFailureLog.objects.filter(resolved=False, event_type__in=_PREFIJOS_RECORDATORIO)
+    if ids is not None:
+        pendientes = pendientes.filter(id__in=ids)
+    filas = {
+        fila_id: _turno_del_recordatorio(event_type, idempotency_key)
+        for fila_id, event_type, idempotency_key in pendientes.values_list('id', 'event_type', 'idempotency_key')
+    }
+    if not filas:
+        return 0
+    inicios = {
+        turno.id: turno.inicio_en_timezone()
+        for turno in Turno.objects.filter(
+            pk__in={turno_id for turno_id in filas.values() if turno_id}, estado='confirmado',
+        ).only('id', 'fecha', 'hora')
+    }
+    vencidas = [
+        fila_id for fila_id, turno_id in filas.items()
+        if turno_id is not None and (turno_id not in inicios or inicios[turno_id] <= ahora)
+    ]
+    if vencidas:
+        EmailFailureLog.objects.filter(id__in=vencidas).update(resolved=True, resolution='expired', next_retry_at=None)
+    return len(vencidas)
+
+
+def _listas(ahora, ids):
+    filas = EmailFailureLog.objects.filter(
+        Q(next_retry_at__isnull=True) | Q(next_retry_at__lte=ahora), resolved=False,
+    )
+    if ids is not None:
+        # Pedido explícito (admin): sin tope de reintentos.
+        return filas.filter(id__in=ids)
+    return filas.filter(retry_count__lt=settings.EMAIL_RETRY_MAX_COUNT)
+
+
+def _tomar(fila, ahora):
+    return EmailFailureLog.objects.filter(
+        Q(next_retry_at__isnull=True) | Q(next_retry_at__lte=ahora), pk=fila.pk, resolved=False,
+    ).update(next_retry_at=ahora + _RESERVA) == 1
+
+
+def reintentar(fila):
+    """Reenvía una fila ya tomada. Devuelve ``reenviados``, ``fallidos`` o ``agotados``."""
+    ok, info = send_email_via_pidgeon(
+        fila.recipient,
+        fila.subject,
+        fila.html_content,
+        fila.event_type,
+        idempotency_key=fila.idempotency_key or None,
+        log_failure=False,
+    )
+    if ok:
+        EmailFailureLog.objects.filter(pk=fila.pk).update(
+            resolved=True, resolution='resent', next_retry_at=None,
+        )
+        return 'reenviados'
+    intentos = fila.retry_count + 1
+    EmailFailureLog.objects.filter(pk=fila.pk).update(
+        retry_count=F('retry_count') + 1,
+        error_message=info[:10000],
+        next_retry_at=timezone.now() + email_retry_delay(intentos),
+    )
+    return 'agotados' if intentos >= settings.EMAIL_RETRY_MAX_COUNT else 'fallidos'
+
+
+def _reintentar_en_hilo(fila):
+    close_old_connections()
+    try:
+        return reintentar(fila)
+    finally:
+        connections.close_all()
+
+
+def reintentar_fallidos(lote=50, limite=None, ids=None, ejecutor=None):
+    """
+    Drena las filas listas en lotes de ``lote`` (hasta ``limite`` en total; ``ids`` restringe a
+    esas filas). Con ``ejecutor`` los reenvíos de cada lote van en paralelo. Devuelve contadores.
+    """
+    inicio = time.perf_counter()
+    contadores = Counter(
+        vencidos=cerrar_recordatorios_vencidos(timezone.now(), ids),
+        duplicados=colapsar_duplicados(ids),
+    )
+    while limite is None or contadores['revisados'] < limite:
+        if pidgeon.circuito_abierto():
+            contadores['circuito_abierto'] = 1
+            break
+        ahora = timezone.now()
+        cantidad = lote if limite is None else min(lote, limite - contadores['revisados'])
+        candidatas = list(_listas(ahora, ids).order_by('next_retry_at', 'id')[:cantidad])
+        if not candidatas:
+            break
+        tomadas = [fila for fila in candidatas if _tomar(fila, ahora)]
+        if ejecutor is None:
+            resultados = [reintentar(fila) for fila in tomadas]
+        else:
+            resultados = list(ejecutor.map(_reintentar_en_hilo, tomadas))
+        contadores['revisados'] += len(tomadas)
+        contadores.update(resultados)
+    segundos = time.perf_counter() - inicio
+    contadores['segundos'] = round(segundos, 2)
+    contadores['por_segundo'] = round(contadores['revisados'] / segundos, 1) if segundos else 0.0
+    logger.info('Reintento de EmailFailureLog: %s', dict(contadores))
+    return contadores
+
+
+@tarea('emails.reintentar_fallidos')
+def reintentar_fallidos_en_cola(ids=None):
+    reintentar_fallidos(ids=ids)
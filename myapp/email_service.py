@@ -1,6 +1,7 @@
 """
 Envío de correos vía API Pidgeon con reintentos y registro en EmailFailureLog si falla.
-No lanza excepciones hacia las vistas: fallos ⇒ log + False.
+No lanza excepciones hacia las vistas: fallos ⇒ log + False. Con el circuito de Pidgeon
+abierto (ver pidgeon.py) no se intenta la llamada: va directo a EmailFailureLog.
 
 Soporta dos versiones de la API Pidgeon (ver https://github.com/ovejero92/pidgeon):
   • v1 (legacy): POST /send con `html` armado en Python.
@@ -12,24 +13,28 @@ El switch se controla con la setting `PIDGEON_API_VERSION` (`v2` por defecto). C
 llamada acepta `template_id` + `template_data` y un `html` fallback; si v2 está
 caído o el template no existe, reintenta con v1 + HTML para no perder el correo.
 
-Los correos tras reservar turno se ejecutan en hilo tras on_commit para no bloquear
-la respuesta HTTP si Pidgeon responde 502 o está lento (evita WORKER TIMEOUT en Gunicorn).
+Los correos de reserva, confirmación, cancelación y verificación se encolan como tareas
+(myapp/tasks.py) y los manda el worker `process_tasks`: la respuesta HTTP no espera a Pidgeon
+aunque responda 502 o esté lento (evita WORKER TIMEOUT en Gunicorn). Esas tareas no usan los
+reintentos de la cola: ``send_email_with_fallback`` no lanza y deja cada destinatario que falló
+en EmailFailureLog, que reenvía ``retry_failed_emails`` con su backoff. Relanzar la tarea
+entera volvería a mandar los correos que sí salieron (la reserva manda dos).
 """
 from __future__ import annotations
 
 import logging
-import threading
 import time
 from datetime import timedelta
-from functools import partial
 
 import requests
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import close_old_connections, transaction
 from django.utils import timezone
 
-from .models import EmailFailureLog, Turno
+from . import pidgeon
+from .entitlements import capacidades
+from .models import EmailFailureLog, EmailVerificationToken, Turno
+from .tasks import encolar, espera_reintento, tarea
 
 logger = logging.getLogger(__name__)
 
@@ -45,14 +50,10 @@ def _pidgeon_version():
 
 
 def _wake_worker(base, timeout):
-    """GET /health para reducir cold-starts del free tier de Render."""
+    """GET /health para reducir cold-starts del free tier de Render (cacheado, ver pidgeon.py)."""
     if not getattr(settings, 'PIDGEON_WAKE_BEFORE_SEND', True):
         return
-    try:
-        requests.get(f'{base}/health', timeout=min(8.0, float(timeout)))
-        logger.debug('Pidgeon wake GET /health completado.')
-    except requests.exceptions.RequestException as exc:
-        logger.debug('Pidgeon wake omitido/falló (%s)', exc)
+    pidgeon.despertar(base, timeout)
 
 
 def _parse_success_response(data):
@@ -83,7 +84,7 @@ def _post_send(url, payload, timeout, attempts, event_type, to):
                 'Pidgeon POST %s intento=%s/%s destino=%s evento=%s',
                 url, attempt + 1, attempts, to, event_type,
             )
-            response = requests.post(url, json=payload, timeout=timeout)
+            response = pidgeon.post(url, json=payload, timeout=timeout)
             last_status = response.status_code
             if response.status_code == 200:
                 try:
@@ -111,6 +112,11 @@ def _post_send(url, payload, timeout, attempts, event_type, to):
             # 4xx (template inválido, payload mal armado) no se arregla reintentando.
             if 400 <= response.status_code < 500:
                 break
+        except pidgeon.CircuitoAbierto as exc:
+            # Pidgeon viene caído: ni reintento ni backoff, directo a EmailFailureLog.
+            error_msg = str(exc)
+            logger.warning('Envío omitido (%s): %s', event_type, error_msg)
+            break
         except requests.exceptions.RequestException as exc:
             error_msg = str(exc)
             logger.warning(
@@ -133,6 +139,7 @@ def send_email_via_pidgeon(
     max_retries=None,
     template_id=None,
     template_data=None,
+    log_failure=True,
 ):
     """
     Envía un email usando Pidgeon (v2 templates si está activado, con fallback transparente a v1).
@@ -145,6 +152,8 @@ def send_email_via_pidgeon(
         template_id / template_data: si están y PIDGEON_API_VERSION=v2, se manda a /v2/send.
             Si el endpoint v2 responde 4xx (template inexistente, payload inválido) se
             cae a v1 con `html`.
+        log_failure: si falla, dejarlo en EmailFailureLog (False desde retry_failed_emails,
+            que actualiza la fila que está reintentando).
 
     Returns:
         (success: bool, message_id_or_error: str)
@@ -197,22 +206,36 @@ def send_email_via_pidgeon(
     if ok:
         return True, info
 
-    try:
-        EmailFailureLog.objects.create(
-            event_type=event_type,
-            recipient=to,
-            subject=subject,
-            html_content=html,
-            error_message=info[:10000],
-            retry_count=attempts,
-        )
-    except Exception:
-        logger.exception('No se pudo guardar EmailFailureLog para %s', to)
+    if log_failure:
+        try:
+            log_email_failure(to, subject, html, event_type, info, attempts, idempotency_key)
+        except Exception:
+            logger.exception('No se pudo guardar EmailFailureLog para %s', to)
 
     logger.error('Email falló permanentemente a %s | evento=%s', to, event_type)
     return False, info
 
 
+def log_email_failure(to, subject, html, event_type, error, retry_count, idempotency_key=None):
+    """Deja el correo en EmailFailureLog con su próximo reintento según el backoff."""
+    return EmailFailureLog.objects.create(
+        event_type=event_type,
+        recipient=to,
+        subject=subject,
+        html_content=html,
+        error_message=error[:10000],
+        retry_count=retry_count,
+        idempotency_key=idempotency_key or '',
+        next_retry_at=timezone.now() + email_retry_delay(retry_count),
+    )
+
+
+def email_retry_delay(retry_count):
+    return espera_reintento(
+        retry_count, base=settings.EMAIL_RETRY_BACKOFF_BASE, tope=settings.EMAIL_RETRY_BACKOFF_MAX,
+    )
+
+
 def send_email_with_fallback(
     to,
     subject,
@@ -243,14 +266,7 @@ def send_email_with_fallback(
     except Exception as exc:
         logger.exception('Error inesperado en send_email_with_fallback: %s', exc)
         try:
-            EmailFailureLog.objects.create(
-                event_type=event_type,
-                recipient=to,
-                subject=subject,
-                html_content=html,
-                error_message=str(exc)[:10000],
-                retry_count=0,
-            )
+            log_email_failure(to, subject, html, event_type, str(exc), 0, idempotency_key)
         except Exception:
             pass
         return False
@@ -277,8 +293,6 @@ def dashboard_turnos_link(request=None):
 
 
 def create_verification_token_for_user(user):
-    from .models import EmailVerificationToken
-
     EmailVerificationToken.objects.filter(user=user).delete()
     return EmailVerificationToken.objects.create(
         user=user,
@@ -294,8 +308,10 @@ def _fmt_hora(turno):
     return turno.hora.strftime('%H:%M')
 
 
-def send_verification_email(user, request=None):
-    token = create_verification_token_for_user(user)
+def send_verification_email(user, request=None, token=None):
+    """Sin ``token`` crea uno nuevo (y el link de un correo anterior deja de valer)."""
+    if token is None:
+        token = create_verification_token_for_user(user)
     link = verification_link_for_token(token.token)
     nombre = (user.first_name or '').strip()
     subject = 'Verificá tu correo — TurnosOk'
@@ -458,26 +474,6 @@ def template_data_reminder_pro(turno, cliente_nom, dashboard_url):
     }
 
 
-def schedule_background(callable_fn):
-    """
-    Ejecuta callable_fn en un hilo tras el commit actual (para no bloquear Gunicorn
-    ante Pidgeon lento / 502). Si falla callable_fn, sólo registra exception.
-    """
-
-    def _runner():
-        close_old_connections()
-        try:
-            callable_fn()
-        except Exception:
-            logger.exception('Correos en segundo plano fallaron (callable interno)')
-        finally:
-            close_old_connections()
-
-    transaction.on_commit(
-        lambda: threading.Thread(target=_runner, daemon=True).start(),
-    )
-
-
 def schedule_turno_booking_emails(
     turno_id,
     cancel_url_abs,
@@ -485,18 +481,40 @@ def schedule_turno_booking_emails(
     cliente_display,
     propietario_id,
 ):
-    schedule_background(
-        partial(
-            dispatch_turno_booking_emails,
-            turno_id,
-            cancel_url_abs,
-            dashboard_url_abs,
-            cliente_display,
-            propietario_id,
-        )
+    encolar(
+        'emails.reserva',
+        turno_id=turno_id,
+        cancel_url_abs=cancel_url_abs,
+        dashboard_url_abs=dashboard_url_abs,
+        cliente_display=cliente_display,
+        propietario_id=propietario_id,
     )
 
 
+def schedule_booking_accepted_email(turno_id, negocio, mis_url):
+    encolar('emails.turno_confirmado', turno_id=turno_id, negocio=negocio, mis_url=mis_url)
+
+
+def schedule_booking_cancel_emails(turno_id, fue_pendiente, nombre_servicio, servicio_url):
+    encolar(
+        'emails.turno_cancelado',
+        turno_id=turno_id,
+        fue_pendiente=fue_pendiente,
+        nombre_servicio=nombre_servicio,
+        servicio_url=servicio_url,
+    )
+
+
+def schedule_verification_email(user):
+    """
+    El token se crea al encolar y viaja en la tarea: si la tarea corre dos veces (worker que
+    muere tras mandar), el segundo correo lleva el mismo link y el primero sigue valiendo.
+    """
+    token = create_verification_token_for_user(user)
+    encolar('emails.verificacion', user_id=user.pk, token=str(token.token))
+
+
+@tarea('emails.reserva')
 def dispatch_turno_booking_emails(
     turno_id,
     cancel_url_abs,
@@ -505,8 +523,7 @@ def dispatch_turno_booking_emails(
     propietario_id,
 ):
     """
-    Llamar desde un hilo vía schedule_turno_booking_emails (o schedule_background).
-    Relee el turno y el propietario.
+    Tarea encolada por schedule_turno_booking_emails. Relee el turno y el propietario.
     """
     try:
         turno = Turno.objects.select_related('servicio', 'profesional', 'cliente').get(pk=turno_id)
@@ -554,10 +571,79 @@ def dispatch_turno_booking_emails(
 
 def owner_receives_freelancer_emails(owner_user):
     """Plan Free: sin emails al freelancer/propietario. Pro/Prime activos: sí."""
+    return capacidades(getattr(owner_user, 'pk', None)).emails_propietario
+
+
+@tarea('emails.turno_confirmado')
+def dispatch_booking_accepted_email(turno_id, negocio, mis_url):
     try:
-        sus = owner_user.suscripcion
-        if not sus.is_active or not sus.plan_id:
-            return False
-        return sus.plan.slug != 'free'
-    except Exception:
-        return False
+        turno = Turno.objects.select_related('servicio', 'cliente').get(pk=turno_id)
+    except Turno.DoesNotExist:
+        logger.warning('Correo de turno confirmado omitido: el turno %s ya no existe', turno_id)
+        return
+    cliente_mail = (turno.cliente.email or '').strip()
+    if not cliente_mail:
+        return
+    send_email_with_fallback(
+        cliente_mail,
+        f'Tu turno ha sido confirmado por {negocio}',
+        html_booking_accepted_client(turno, negocio, mis_url),
+        'booking_accepted',
+        idempotency_key=f'accept-{turno_id}',
+        template_id='turno-aceptado-cliente',
+        template_data=template_data_booking_accepted_client(turno, negocio, mis_url),
+    )
+
+
+@tarea('emails.turno_cancelado')
+def dispatch_booking_cancel_emails(turno_id, fue_pendiente, nombre_servicio, servicio_url):
+    """Rechazo (si estaba pendiente) o cancelación por parte del negocio."""
+    try:
+        turno = Turno.objects.select_related('servicio', 'cliente').get(pk=turno_id)
+    except Turno.DoesNotExist:
+        logger.warning('Correo de turno cancelado omitido: el turno %s ya no existe', turno_id)
+        return
+    cliente_mail = (turno.cliente.email or '').strip()
+    if not cliente_mail:
+        return
+    if fue_pendiente:
+        send_email_with_fallback(
+            cliente_mail,
+            'Tu turno fue rechazado, puedes reagendar',
+            html_booking_rejected_client(turno, nombre_servicio, servicio_url),
+            'booking_rejected',
+            idempotency_key=f'reject-{turno_id}',
+            template_id='turno-rechazado-cliente',
+            template_data=template_data_booking_rejected_client(
+                turno, nombre_servicio, servicio_url,
+            ),
+        )
+    else:
+        send_email_with_fallback(
+            cliente_mail,
+            f'Información sobre tu turno en {nombre_servicio}',
+            html_booking_cancelled_owner(nombre_servicio, servicio_url),
+            'booking_cancelled_owner',
+            idempotency_key=f'cancel-owner-{turno_id}',
+            template_id='turno-cancelado-cliente',
+            template_data=template_data_booking_cancelled_owner(
+                turno.cliente.first_name, nombre_servicio, servicio_url,
+            ),
+        )
+
+
+@tarea('emails.verificacion')
+def dispatch_verification_email(user_id, token=None):
+    if token is None:
+        # Tareas encoladas antes de que el token viajara con la tarea.
+        usuario = User.objects.filter(pk=user_id).first()
+        if usuario is None:
+            logger.warning('Usuario %s ya no existe; no se envía verificación', user_id)
+            return
+        send_verification_email(usuario, None)
+        return
+    token_obj = EmailVerificationToken.objects.select_related('user').filter(user_id=user_id, token=token).first()
+    if token_obj is None:
+        logger.warning('Verificación de %s omitida: el token ya se usó, se reemplazó o el usuario no existe', user_id)
+        return
+    send_verification_email(token_obj.user, None, token=token_obj)
@@ -0,0 +1,103 @@
+"""
+Qué habilita el plan de un usuario (métricas, apariencia, equipo, emails al propietario).
+
+Antes cada chequeo recorría ``propietario.suscripcion.plan`` con sus propias consultas y
+algunas páginas lo evaluaban una vez por turno. ``capacidades(usuario_id)`` parte del estado
+de cuenta de user_state (caché compartida, versionada por usuario y por planes; las señales
+de Suscripcion y Plan suben esas versiones) y además guarda el resultado en memoria del
+proceso durante ``CAPACIDADES_MEMO_SECONDS``: mientras dure no toca la caché ni para leer la
+versión. Las señales lo descartan en este proceso al commitear (``olvidar``); un cambio hecho
+en otro proceso (p. ej. el webhook de MP en el worker) se ve a lo sumo ese tiempo después.
+
+En vistas y templates conviene ``capacidades_request(request)``, que queda guardado en la
+request; el context processor lo expone como ``capacidades``.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from . import user_state
+
+PLAN_GRATIS = 'free'
+PLAN_EQUIPO = 'prime'
+_MAX_LOCALES = 4096
+
+
+@dataclass(frozen=True)
+class Capacidades:
+    plan_slug: str = ''
+    activo: bool = False
+    metricas: bool = False
+    personalizacion: bool = False
+    multiples_profesionales: bool = False
+    emails_propietario: bool = False
+
+    @property
+    def plan_de_pago(self):
+        return self.activo and bool(self.plan_slug) and self.plan_slug != PLAN_GRATIS
+
+
+SIN_PLAN = Capacidades()
+
+# usuario_id -> (vence, versión, Capacidades)
+_locales = {}
+_candado = threading.Lock()
+_ATRIBUTO_REQUEST = '_capacidades'
+
+
+def desde_estado(estado):
+    """Reglas de cada capacidad a partir de un ``user_state.EstadoUsuario``."""
+    if not estado.plan_slug:
+        return SIN_PLAN
+    activo = estado.suscripcion_activa
+    return Capacidades(
+        plan_slug=estado.plan_slug,
+        activo=activo,
+        metricas=activo and estado.plan_allow_metrics,
+        personalizacion=activo and estado.plan_allow_customization,
+        multiples_profesionales=activo and estado.plan_slug == PLAN_EQUIPO,
+        # Plan Free: sin emails al freelancer/propietario. Pro/Prime activos: sí.
+        emails_propietario=activo and estado.plan_slug != PLAN_GRATIS,
+    )
+
+
+def capacidades(usuario_id):
+    """Capacidades del plan de ``usuario_id`` (``SIN_PLAN`` si no hay usuario)."""
+    if not usuario_id:
+        return SIN_PLAN
+    ahora = time.monotonic()
+    memo = _locales.get(usuario_id)
+    if memo is not None and memo[0] > ahora:
+        return memo[2]
+    version = user_state.version_usuario(usuario_id)
+    if memo is not None and memo[1] == version:
+        resultado = memo[2]
+    else:
+        resultado = desde_estado(user_state.estado_de_usuario(usuario_id, version=version))
+    with _candado:
+        if len(_locales) >= _MAX_LOCALES:
+            _locales.clear()
+        _locales[usuario_id] = (ahora + settings.CAPACIDADES_MEMO_SECONDS, version, resultado)
+    return resultado
+
+
+def olvidar(usuario_id=None):
+    """Descarta lo guardado en este proceso para ``usuario_id`` (o para todos)."""
+    with _candado:
+        if usuario_id is None:
+            _locales.clear()
+        else:
+            _locales.pop(usuario_id, None)
+
+
+def capacidades_request(request):
+    """Las del usuario de la request, resueltas una vez a partir del estado ya cargado en ella."""
+    estado = user_state.estado_usuario(request)
+    memo = getattr(request, _ATRIBUTO_REQUEST, None)
+    # Si el estado se descartó y se volvió a cargar (``olvidar_estado_usuario``), se recalculan.
+    if memo is None or memo[0] is not estado:
+        memo = (estado, desde_estado(estado))
+        setattr(request, _ATRIBUTO_REQUEST, memo)
+    return memo[1]
@@ -0,0 +1,128 @@
+"""
+MercadoPago falso (HTTP/1.1 con keep-alive) para pruebas y benchmarks.
+
+Implementa lo que usa la app: ``POST /preapproval`` (201, con ``init_point`` propio y
+deduplicado por ``X-Idempotency-Key``), ``GET`` y ``PUT /preapproval/<id>`` y
+``GET /v1/payments/<id>``. Con ``MERCADOPAGO_API_URL`` apuntando acá (``manage.py
+fake_mercadopago`` lo levanta suelto) los flujos de suscripción se pueden cargar sin la API real.
+
+Perillas: ``demora`` (segundos antes de cada respuesta), ``fallas`` (los próximos N pedidos
+responden 503), ``status`` (fuerza ese código en todos) y ``estado_inicial`` de las
+preaprobaciones nuevas (``authorized`` simula el checkout ya pagado). Anota cada pedido y cada
+conexión.
+"""
+import itertools
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class FakeMercadoPago:
+
+    def __init__(self, host='127.0.0.1', puerto=0, demora=0.0):
+        self.preaprobaciones = {}
+        self.pagos = {}
+        self.status = None
+        self.fallas = 0
+        self.estado_inicial = 'pending'
+        self.demora = demora
+        self.pedidos = []
+        self.conexiones = 0
+        self._por_clave = {}
+        self._ids = itertools.count(1)
+        self._candado = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                with fake._candado:
+                    fake.conexiones += 1
+                super().setup()
+
+            def atender(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                cuerpo = json.loads(self.rfile.read(largo)) if largo else None
+                with fake._candado:
+                    fake.pedidos.append((self.command, self.path, cuerpo, self.headers.get('X-Idempotency-Key')))
+                    falla = fake.fallas > 0
+                    fake.fallas -= int(falla)
+                time.sleep(fake.demora)
+                if fake.status or falla:
+                    status = fake.status or 503
+                    self.responder(status, {'message': 'fake error', 'status': status})
+                elif not self.headers.get('Authorization', '').startswith('Bearer '):
+                    self.responder(401, {'message': 'unauthorized', 'status': 401})
+                else:
+                    self.responder(*fake.resolver(self.command, urlsplit(self.path).path, cuerpo, self.headers))
+
+            def responder(self, status, datos):
+                cuerpo = json.dumps(datos).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(cuerpo)))
+                    self.end_headers()
+                    self.wfile.write(cuerpo)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente cortó por timeout antes de la respuesta.
+                    self.close_connection = True
+
+            do_GET = do_POST = do_PUT = atender
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer((host, puerto), Handler)
+        self.servidor.daemon_threads = True
+        self.url = f'http://{host}:{self.servidor.server_port}'
+
+    def iniciar(self):
+        """Atiende en un hilo aparte; devuelve el fake para encadenar."""
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def rutas(self):
+        return [ruta for _, ruta, _, _ in self.pedidos]
+
+    def resolver(self, metodo, ruta, cuerpo, cabeceras):
+        """(status, cuerpo) de un pedido que no falló a propósito."""
+        partes = ruta.strip('/').split('/')
+        with self._candado:
+            if metodo == 'POST' and partes == ['preapproval']:
+                clave = cabeceras.get('X-Idempotency-Key')
+                if clave in self._por_clave:
+                    return 201, self.preaprobaciones[self._por_clave[clave]]
+                preapproval_id = f'fake-pre-{next(self._ids)}'
+                self.preaprobaciones[preapproval_id] = {
+                    **(cuerpo or {}),
+                    'id': preapproval_id,
+                    'status': self.estado_inicial,
+                    'init_point': f'{self.url}/checkout/{preapproval_id}',
+                    'sandbox_init_point': f'{self.url}/checkout/{preapproval_id}',
+                    'date_created': datetime.now(timezone.utc).isoformat(),
+                }
+                if clave:
+                    self._por_clave[clave] = preapproval_id
+                return 201, self.preaprobaciones[preapproval_id]
+            if len(partes) == 2 and partes[0] == 'preapproval' and metodo in ('GET', 'PUT'):
+                preaprobacion = self.preaprobaciones.get(partes[1])
+                if preaprobacion is None:
+                    return 404, {'message': 'preapproval not found', 'status': 404}
+                if metodo == 'PUT':
+                    preaprobacion.update(cuerpo or {})
+                return 200, preaprobacion
+            if len(partes) == 3 and partes[:2] == ['v1', 'payments'] and metodo == 'GET':
+                pago = self.pagos.get(partes[2])
+                if pago is None:
+                    return 404, {'message': 'payment not found', 'status': 404}
+                return 200, pago
+        return 404, {'message': 'resource not found', 'status': 404}
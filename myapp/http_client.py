@@ -0,0 +1,121 @@
+"""
+Base de los clientes HTTP del proceso (``pidgeon.py`` y ``mp_gateway.py``).
+
+Cada ``ClienteHTTP`` tiene:
+
+- Una sola ``requests.Session`` por proceso con pool keep-alive. El pool de urllib3 es
+  thread-safe, así que la comparten los hilos de ``process_tasks``. Después de un fork se arma
+  una nueva para no heredar sockets del padre.
+- Métricas de cada llamada (duración, si fue error, si abrió conexión nueva y los contadores
+  propios del cliente); ``resumen()`` da los totales del proceso.
+
+Lo propio de cada servicio (circuit breaker, reintentos, cabeceras) queda en su módulo: acá sólo
+``medir(url)`` antes de la llamada y ``registrar(...)`` después.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_MAX_MUESTRAS = 2000
+
+
+def _percentil(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+
+def _conexiones_abiertas(pools):
+    """Conexiones que abrieron los pools de urllib3 de la sesión."""
+    return sum(pools[clave].num_connections for clave in pools.keys())
+
+
+class ClienteHTTP:
+
+    def __init__(self, pool_maxsize, pool_connections=1, contadores=()):
+        """``pool_maxsize``: callable (se lee de settings al armar la sesión). ``contadores``: extras de ``resumen``."""
+        self._pool_maxsize = pool_maxsize
+        self._pool_connections = pool_connections
+        self._contadores = ('llamadas', 'errores', *contadores, 'conexiones_nuevas')
+        self._sesion = None
+        self._candado = threading.Lock()
+        self._metricas_candado = threading.Lock()
+        self._metricas = {}
+        self.reiniciar_metricas()
+        os.register_at_fork(after_in_child=self._despues_de_fork)
+
+    def _nueva_sesion(self):
+        sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize())
+        sesion.mount('http://', adaptador)
+        sesion.mount('https://', adaptador)
+        return sesion
+
+    def sesion(self):
+        """La ``requests.Session`` del proceso (se crea la primera vez)."""
+        if self._sesion is None:
+            with self._candado:
+                if self._sesion is None:
+                    self._sesion = self._nueva_sesion()
+        return self._sesion
+
+    def cerrar(self):
+        """Cierra las conexiones del pool; la próxima llamada arma una sesión nueva."""
+        with self._candado:
+            if self._sesion is not None:
+                self._sesion.close()
+            self._sesion = None
+
+    def _despues_de_fork(self):
+        self._sesion = None
+        self._candado = threading.Lock()
+        self._metricas_candado = threading.Lock()
+
+    def reiniciar_metricas(self):
+        with self._metricas_candado:
+            self._metricas.update(dict.fromkeys(self._contadores, 0), segundos=0.0)
+            self._metricas['latencias'] = deque(maxlen=_MAX_MUESTRAS)
+
+    def contar(self, contador, cantidad=1):
+        with self._metricas_candado:
+            self._metricas[contador] += cantidad
+
+    def medir(self, url):
+        """Marca el inicio de una llamada a ``url``; se pasa tal cual a ``registrar``."""
+        pools = self.sesion().get_adapter(url).poolmanager.pools
+        return pools, _conexiones_abiertas(pools), time.perf_counter()
+
+    def registrar(self, medicion, error, **contadores):
+        """
+        Cierra la medición y la suma a las métricas. Devuelve ``(segundos, conexion_nueva)``.
+        Con varios hilos, "conexión nueva" es aproximado: mira el contador de los pools.
+        """
+        pools, conexiones_antes, inicio = medicion
+        segundos = time.perf_counter() - inicio
+        conexion_nueva = _conexiones_abiertas(pools) > conexiones_antes
+        with self._metricas_candado:
+            self._metricas['llamadas'] += 1
+            self._metricas['errores'] += int(error)
+            self._metricas['conexiones_nuevas'] += int(conexion_nueva)
+            for contador, cantidad in contadores.items():
+                self._metricas[contador] += cantidad
+            self._metricas['segundos'] += segundos
+            self._metricas['latencias'].append(segundos)
+        return segundos, conexion_nueva
+
+    def resumen(self):
+        """Totales del proceso desde el arranque (o desde ``reiniciar_metricas``); tiempos en ms."""
+        with self._metricas_candado:
+            datos = dict(self._metricas)
+            ordenadas = sorted(self._metricas['latencias'])
+        return {
+            **{contador: datos[contador] for contador in self._contadores},
+            'total_ms': round(datos['segundos'] * 1000, 1),
+            'p50_ms': round(_percentil(ordenadas, 50) * 1000, 1),
+            'p95_ms': round(_percentil(ordenadas, 95) * 1000, 1),
+            'max_ms': round((ordenadas[-1] if ordenadas else 0.0) * 1000, 1),
+        }
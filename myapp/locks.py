@@ -0,0 +1,122 @@
+"""
+Candados de trabajos (leases) en la base, para que escalar instancias no multiplique el
+trabajo de fondo.
+
+Con varias instancias web, el cron y ``cron_send_reminders_http`` podían correr
+``send_reminders`` a la vez y recorrer los mismos turnos dos veces. ``adquirir(nombre)`` toma el
+candado con un UPDATE condicional sobre la fila ``Candado`` (sólo si está vencido), lo que es
+atómico en cualquier base, y devuelve un ``Lease`` con:
+
+- ``vence``: si el proceso muere, al vencer lo puede tomar otro.
+- ``token`` (fencing): sube en cada adquisición. ``renovar()`` sólo extiende el plazo si la
+  fila sigue teniendo este titular y este token; si no, lanza ``CandadoPerdido`` y el trabajo
+  tiene que cortar antes de escribir nada más.
+- ``vigente()``: condición para sumar al UPDATE que protege el candado. La escritura sólo se
+  aplica si en ese momento el token sigue siendo el vigente, así un proceso que se colgó más
+  que el lease no pisa lo que hace el nuevo titular aunque no haya llegado a renovar.
+
+``candado(nombre)`` es el context manager para trabajos por lotes. El scheduler residente usa
+el mismo mecanismo para elegir líder: el que tiene el lease trabaja y los demás esperan.
+"""
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F
+from django.utils import timezone
+
+from .models import Candado
+
+_NUNCA = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class CandadoOcupado(Exception):
+    """Otra instancia tiene el candado vigente."""
+
+
+class CandadoPerdido(Exception):
+    """El lease venció y lo tomó otro (el token ya no es el vigente)."""
+
+
+@dataclass
+class Lease:
+    nombre: str
+    titular: str
+    token: int
+    vence: datetime
+    duracion: timedelta
+
+    def _fila(self):
+        return Candado.objects.filter(
+            nombre=self.nombre, titular=self.titular, token=self.token, vence__gt=timezone.now(),
+        )
+
+    def renovar(self):
+        """Extiende el plazo. Lanza ``CandadoPerdido`` si este lease ya no es el vigente."""
+        vence = timezone.now() + self.duracion
+        renovado = self._fila().update(vence=vence)
+        if not renovado:
+            raise CandadoPerdido(f'{self.nombre}: el token {self.token} ya no es el vigente')
+        self.vence = vence
+
+    def vigente(self):
+        """``Exists`` para filtrar un UPDATE protegido: sólo escribe mientras este lease sea el vigente."""
+        return Exists(self._fila())
+
+    def verificar(self):
+        """Lanza ``CandadoPerdido`` si este lease ya no es el vigente (sin extenderlo)."""
+        if not self._fila().exists():
+            raise CandadoPerdido(f'{self.nombre}: el token {self.token} ya no es el vigente')
+
+    def liberar(self):
+        Candado.objects.filter(nombre=self.nombre, titular=self.titular, token=self.token).update(
+            vence=timezone.now(),
+        )
+
+
+def _tomar(nombre, titular, ahora, duracion):
+    return Candado.objects.filter(nombre=nombre, vence__lte=ahora).update(
+        titular=titular, token=F('token') + 1, vence=ahora + duracion, adquirido=ahora,
+    )
+
+
+def adquirir(nombre, duracion=None):
+    """Toma ``nombre`` si está libre o vencido; devuelve el ``Lease`` o None si otro lo tiene."""
+    duracion = timedelta(seconds=duracion or settings.LOCK_LEASE_SECONDS)
+    ahora = timezone.now()
+    titular = uuid.uuid4().hex
+    tomado = _tomar(nombre, titular, ahora, duracion)
+    if not tomado and not Candado.objects.filter(nombre=nombre).exists():
+        # Primera vez que se usa este candado.
+        try:
+            with transaction.atomic():
+                Candado.objects.create(nombre=nombre, vence=_NUNCA)
+        except IntegrityError:
+            pass  # La creó otra instancia al mismo tiempo.
+        tomado = _tomar(nombre, titular, ahora, duracion)
+    if not tomado:
+        return None
+    token = Candado.objects.filter(nombre=nombre, titular=titular).values_list('token', flat=True).first()
+    if token is None:
+        return None
+    return Lease(nombre, titular, token, ahora + duracion, duracion)
+
+
+def vigente(nombre):
+    """Si alguna instancia tiene ``nombre`` tomado y sin vencer."""
+    return Candado.objects.filter(nombre=nombre, vence__gt=timezone.now()).exists()
+
+
+@contextmanager
+def candado(nombre, duracion=None):
+    """``with candado('send_reminders') as lease:`` — lanza ``CandadoOcupado`` si otro lo tiene."""
+    lease = adquirir(nombre, duracion)
+    if lease is None:
+        raise CandadoOcupado(nombre)
+    try:
+        yield lease
+    finally:
+        lease.liberar()
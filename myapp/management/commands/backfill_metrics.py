@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.metrics import reconstruir_metricas
+from myapp.models import Servicio
+
+
+def servicio_ids_desde_slugs(slugs):
+    """IDs de los servicios con esos slugs (``None`` si no se pidió ninguno)."""
+    if not slugs:
+        return None
+    encontrados = dict(Servicio.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+    faltantes = set(slugs) - set(encontrados)
+    if faltantes:
+        raise CommandError(f"No existen los servicios: {', '.join(sorted(faltantes))}")
+    return list(encontrados.values())
+
+
+class Command(BaseCommand):
+    help = 'Rearma IngresoDiario y SubServicioDiario desde los turnos completados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servicio',
+            action='append',
+            dest='servicios',
+            metavar='SLUG',
+            help='Sólo este servicio (se puede repetir). Por defecto, todos.',
+        )
+
+    def handle(self, *args, **options):
+        filas = reconstruir_metricas(servicio_ids_desde_slugs(options['servicios']))
+        self.stdout.write(self.style.SUCCESS(f'Métricas reconstruidas: {filas} filas.'))
@@ -0,0 +1,368 @@
+"""
+Benchmark HTTP de punta a punta de los caminos calientes (búsqueda, detalle, slots, reserva,
+dashboards y polling de notificaciones) contra un servidor local ya levantado.
+
+El servidor tiene que usar la misma base que este comando (SQLite o PostgreSQL local): las
+sesiones del cliente y del propietario se crean directo en la base. Para tener consultas
+por request, levantarlo con ``CONTAR_CONSULTAS=True`` (ver ContarConsultasMiddleware).
+Los datos de volumen salen de ``generate_dataset``.
+
+El escenario ``reserva`` crea turnos reales (se borran al final) y el servidor encola sus
+emails después del commit, fuera de la latencia medida; para no mandarlos, levantarlo con
+``PIDGEON_URL`` apuntando a una dirección local sin nada escuchando.
+"""
+import json
+import statistics
+from collections import Counter
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+
+from myapp.availability import PROFESIONAL_CUALQUIERA, slots_rango
+from myapp.models import PerfilUsuario, Servicio, Turno
+
+CLIENTE_BENCH = 'bench-http-cliente'
+DIAS_RESERVA = 21
+# Una regresión es un p95 por encima de la tolerancia o más consultas que el baseline.
+MARGEN_CONSULTAS = 0.5
+
+
+def percentil(ordenadas, p):
+    """Percentil ``p`` (0-100) por interpolación lineal sobre una lista ya ordenada."""
+    if not ordenadas:
+        return None
+    posicion = (len(ordenadas) - 1) * p / 100
+    abajo = int(posicion)
+    arriba = min(abajo + 1, len(ordenadas) - 1)
+    return ordenadas[abajo] + (ordenadas[arriba] - ordenadas[abajo]) * (posicion - abajo)
+
+
+def resumir(latencias, consultas, errores, segundos, codigos=None):
+    """Resultado de un escenario a partir de las muestras (latencias en segundos)."""
+    ordenadas = sorted(latencias)
+    ms = lambda valor: round(valor * 1000, 2) if valor is not None else None
+    return {
+        'peticiones': len(latencias),
+        'errores': errores,
+        'p50_ms': ms(percentil(ordenadas, 50)),
+        'p95_ms': ms(percentil(ordenadas, 95)),
+        'p99_ms': ms(percentil(ordenadas, 99)),
+        'media_ms': ms(statistics.fmean(ordenadas)) if ordenadas else None,
+        'throughput_rps': round(len(latencias) / segundos, 2) if segundos else None,
+        'consultas_por_request': round(statistics.fmean(consultas), 2) if consultas else None,
+        'consultas_max': max(consultas) if consultas else None,
+        'codigos': dict(sorted((codigos or {}).items())),
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """
+    Filas ``(escenario, métrica, base, actual, variación %, es_regresion)`` para los escenarios
+    que están en los dos resultados.
+    """
+    filas = []
+    for nombre, medido in actual['escenarios'].items():
+        anterior = base.get('escenarios', {}).get(nombre)
+        if not anterior:
+            continue
+        for metrica in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'consultas_por_request'):
+            antes, ahora = anterior.get(metrica), medido.get(metrica)
+            if antes is None or ahora is None:
+                continue
+            variacion = (ahora - antes) / antes * 100 if antes else 0.0
+            if metrica == 'p95_ms':
+                regresion = variacion > tolerancia
+            elif metrica == 'consultas_por_request':
+                regresion = ahora > antes + MARGEN_CONSULTAS
+            else:
+                regresion = False
+            filas.append((nombre, metrica, antes, ahora, round(variacion, 1), regresion))
+    return filas
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark HTTP (p50/p95/p99, throughput y consultas por request) de búsqueda, detalle, '
+        'slots, reserva, dashboards y notificaciones contra un servidor local. Escribe JSON y '
+        'puede compararlo contra un baseline guardado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor a medir.')
+        parser.add_argument('--servicio', metavar='SLUG',
+                            help='Servicio a usar (por defecto, el activo con más turnos).')
+        parser.add_argument('--escenarios', nargs='+', metavar='NOMBRE',
+                            help='Sólo estos escenarios (por defecto, todos).')
+        parser.add_argument('--peticiones', type=int, default=200, help='Peticiones medidas por escenario.')
+        parser.add_argument('--concurrencia', type=int, default=4)
+        parser.add_argument('--calentamiento', type=int, default=10, help='Peticiones previas sin medir.')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--salida', help='Archivo JSON con los resultados.')
+        parser.add_argument('--baseline', help='JSON de una corrida anterior para comparar.')
+        parser.add_argument('--tolerancia', type=float, default=20.0,
+                            help='Suba de p95 (en %%) que se acepta contra el baseline.')
+
+    def handle(self, *args, **options):
+        self.base_url = options['url'].rstrip('/') + '/'
+        self.timeout = options['timeout']
+        servicio = self._servicio(options['servicio'])
+        self.servicio = servicio
+        self.sub_servicio = servicio.sub_servicios.order_by('duracion', 'id').first()
+        if self.sub_servicio is None:
+            raise CommandError(f"El servicio '{servicio.slug}' no tiene sub-servicios.")
+        self.medio_de_pago = servicio.medios_de_pago_aceptados.order_by('id').values_list('slug', flat=True).first()
+        self.cliente = self._cliente()
+        self.cookies = {
+            'cliente': self._sesion(self.cliente),
+            'propietario': self._sesion(servicio.propietario),
+            None: {},
+        }
+        self.huecos = self._huecos_libres()
+        self._candado = threading.Lock()
+        self._local = threading.local()
+
+        escenarios = self._escenarios()
+        elegidos = options['escenarios'] or list(escenarios)
+        desconocidos = set(elegidos) - set(escenarios)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}. "
+                               f"Disponibles: {', '.join(escenarios)}")
+
+        resultado = {
+            'fecha': timezone.now().isoformat(),
+            'url': self.base_url,
+            'base_de_datos': connection.vendor,
+            'servicio': servicio.slug,
+            'turnos_del_servicio': servicio.cantidad_turnos,
+            'concurrencia': options['concurrencia'],
+            'escenarios': {},
+        }
+        self.stdout.write(
+            f"{'escenario':<28} {'n':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'SQL':>6}"
+        )
+        try:
+            for nombre in elegidos:
+                quien, peticion = escenarios[nombre]
+                # Calentar la reserva gastaría huecos libres.
+                calentamiento = 0 if nombre == 'reserva' else options['calentamiento']
+                medido = self._correr(quien, peticion, options['peticiones'], calentamiento, options['concurrencia'])
+                resultado['escenarios'][nombre] = medido
+                sql = medido['consultas_por_request']
+                self.stdout.write(
+                    f"{nombre:<28} {medido['peticiones']:>5} {medido['errores']:>4} {medido['p50_ms']:>8} "
+                    f"{medido['p95_ms']:>8} {medido['p99_ms']:>8} {medido['throughput_rps']:>8} "
+                    f"{'-' if sql is None else sql:>6}"
+                )
+        finally:
+            Turno.objects.filter(cliente=self.cliente, servicio=servicio).delete()
+            SessionStore().delete(self.cookies['cliente'][settings.SESSION_COOKIE_NAME])
+            SessionStore().delete(self.cookies['propietario'][settings.SESSION_COOKIE_NAME])
+
+        if all(m['consultas_por_request'] is None for m in resultado['escenarios'].values()):
+            self.stderr.write(self.style.WARNING(
+                'El servidor no devolvió X-Consultas: levantalo con CONTAR_CONSULTAS=True para medir SQL.'
+            ))
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados en {options['salida']}")
+        if options['baseline']:
+            self._comparar(resultado, options['baseline'], options['tolerancia'])
+
+    # --- Preparación ------------------------------------------------------------
+
+    def _servicio(self, slug):
+        servicios = Servicio.objects.filter(esta_activo=True).annotate(cantidad_turnos=Count('turnos_del_servicio'))
+        if slug:
+            servicio = servicios.filter(slug=slug).select_related('propietario').first()
+            if servicio is None:
+                raise CommandError(f"No existe el servicio activo '{slug}'.")
+            return servicio
+        servicio = servicios.filter(profesionales__activo=True).order_by('-cantidad_turnos', 'id').select_related(
+            'propietario'
+        ).first()
+        if servicio is None:
+            raise CommandError('No hay servicios activos con profesionales (ver generate_dataset).')
+        return servicio
+
+    def _cliente(self):
+        cliente, _ = User.objects.get_or_create(
+            username=CLIENTE_BENCH, defaults={'email': f'{CLIENTE_BENCH}@example.com', 'first_name': 'Bench'},
+        )
+        # Sin email verificado RequireVerifiedEmailMiddleware cierra la sesión.
+        PerfilUsuario.objects.update_or_create(usuario=cliente, defaults={'email_verified': True})
+        PerfilUsuario.objects.update_or_create(usuario=self.servicio.propietario, defaults={'email_verified': True})
+        return cliente
+
+    def _sesion(self, usuario):
+        """Cookie de una sesión ya autenticada, igual a la que deja ``django.contrib.auth.login``."""
+        sesion = SessionStore()
+        sesion[SESSION_KEY] = str(usuario.pk)
+        sesion[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        sesion[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        sesion.create()
+        return {settings.SESSION_COOKIE_NAME: sesion.session_key}
+
+    def _huecos_libres(self):
+        """``(fecha, hora, profesional_id)`` sin pisarse entre sí, para que cada POST de reserva pueda ganar."""
+        hoy = timezone.localdate()
+        profesional_ids = list(self.servicio.profesionales.filter(activo=True).values_list('id', flat=True))
+        duracion = self.sub_servicio.duracion
+        buffer_minutos = self.servicio.duracion_buffer_minutos
+        huecos = []
+        for fecha, por_profesional in slots_rango(
+            self.servicio.id, profesional_ids, hoy + timedelta(days=1), hoy + timedelta(days=DIAS_RESERVA),
+            duracion, buffer_minutos,
+        ).items():
+            for profesional_id, horas in por_profesional.items():
+                siguiente = 0
+                for hora in horas:
+                    horas_del_dia, minutos = hora.split(':')
+                    minuto = int(horas_del_dia) * 60 + int(minutos)
+                    if minuto >= siguiente:
+                        huecos.append((fecha, hora, profesional_id))
+                        siguiente = minuto + duracion + buffer_minutos
+        return huecos
+
+    # --- Escenarios -------------------------------------------------------------
+
+    def _escenarios(self):
+        """``{nombre: (quién, función que devuelve (método, path, datos))}``."""
+        servicio = self.servicio
+        hoy = timezone.localdate()
+        palabras = [servicio.nombre.split()[0], servicio.categoria.nombre if servicio.categoria_id else 'turnos',
+                    'inexistente']
+        duracion = self.sub_servicio.duracion
+        contador = iter(range(10 ** 9))
+
+        def busqueda():
+            return 'get', reverse('index'), {'q': palabras[next(contador) % len(palabras)]}
+
+        def slots():
+            fecha = hoy + timedelta(days=1 + next(contador) % 14)
+            return 'get', reverse('obtener_slots_disponibles', args=[servicio.id]), {
+                'fecha': fecha.isoformat(), 'duracion': duracion,
+            }
+
+        def slots_rango_14_dias():
+            return 'get', reverse('obtener_slots_rango', args=[servicio.id]), {
+                'desde': (hoy + timedelta(days=1)).isoformat(), 'hasta': (hoy + timedelta(days=14)).isoformat(),
+                'duracion': duracion, 'profesional_id': PROFESIONAL_CUALQUIERA,
+            }
+
+        def reserva():
+            with self._candado:
+                if not self.huecos:
+                    return None
+                fecha, hora, profesional_id = self.huecos.pop()
+            return 'post', reverse('servicio_detail', args=[servicio.slug]), {
+                'fecha': fecha.isoformat(), 'hora': hora, 'profesional_id': profesional_id,
+                'sub_servicios_solicitados': self.sub_servicio.id, 'medio_de_pago': self.medio_de_pago,
+            }
+
+        def get(nombre, *args, **params):
+            return lambda: ('get', reverse(nombre, args=args), params)
+
+        return {
+            'index_busqueda': (None, busqueda),
+            'servicio_detail': ('cliente', get('servicio_detail', servicio.slug)),
+            'slots_disponibles': ('cliente', slots),
+            'slots_rango': ('cliente', slots_rango_14_dias),
+            'reserva': ('cliente', reserva),
+            'dashboard_turnos': ('propietario', get('dashboard_turnos')),
+            'dashboard_calendario': ('propietario', get('dashboard_calendario')),
+            'dashboard_metricas': ('propietario', get('dashboard_metricas')),
+            'notificaciones_cliente': ('cliente', get('obtener_notificaciones')),
+            'notificaciones_propietario': ('propietario', get('obtener_notificaciones_propietario')),
+        }
+
+    # --- Medición ---------------------------------------------------------------
+
+    def _session_http(self, quien):
+        """Una ``requests.Session`` por hilo y por usuario (pool de conexiones keep-alive)."""
+        sesiones = getattr(self._local, 'sesiones', None)
+        if sesiones is None:
+            sesiones = self._local.sesiones = {}
+        if quien not in sesiones:
+            sesion = requests.Session()
+            sesion.cookies.update(self.cookies[quien])
+            sesiones[quien] = sesion
+        return sesiones[quien]
+
+    def _pedir(self, quien, peticion):
+        """``(segundos, consultas o None, código HTTP, ok)`` de una petición; ``None`` si no quedan datos."""
+        armada = peticion()
+        if armada is None:
+            return None
+        metodo, path, datos = armada
+        sesion = self._session_http(quien)
+        url = urljoin(self.base_url, path.lstrip('/'))
+        kwargs = {'timeout': self.timeout, 'allow_redirects': False}
+        if metodo == 'post':
+            if 'csrftoken' not in sesion.cookies:
+                sesion.get(url, timeout=self.timeout)
+            token = sesion.cookies.get('csrftoken', '')
+            kwargs.update(data=datos, headers={'X-CSRFToken': token, 'Referer': url})
+        else:
+            kwargs['params'] = datos
+        inicio = time.perf_counter()
+        try:
+            respuesta = getattr(sesion, metodo)(url, **kwargs)
+        except requests.RequestException:
+            return time.perf_counter() - inicio, None, 'sin respuesta', False
+        segundos = time.perf_counter() - inicio
+        consultas = respuesta.headers.get('X-Consultas')
+        ok = respuesta.status_code < 400
+        if metodo == 'post':
+            # La reserva exitosa redirige a mis turnos; si falla, vuelve al detalle.
+            ok = ok and respuesta.headers.get('Location', '').rstrip('/').endswith(reverse('mis_turnos').rstrip('/'))
+        elif respuesta.status_code in (301, 302) and 'login' in respuesta.headers.get('Location', ''):
+            ok = False
+        return segundos, int(consultas) if consultas is not None else None, str(respuesta.status_code), ok
+
+    def _correr(self, quien, peticion, cantidad, calentamiento, concurrencia):
+        for _ in range(calentamiento):
+            self._pedir(quien, peticion)
+        latencias, consultas, errores, codigos = [], [], 0, Counter()
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            for muestra in pool.map(lambda _: self._pedir(quien, peticion), range(cantidad)):
+                if muestra is None:
+                    continue
+                segundos, sql, codigo, ok = muestra
+                latencias.append(segundos)
+                codigos[codigo] += 1
+                if sql is not None:
+                    consultas.append(sql)
+                errores += not ok
+        return resumir(latencias, consultas, errores, time.perf_counter() - inicio, codigos)
+
+    def _comparar(self, resultado, ruta, tolerancia):
+        with open(ruta, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        filas = comparar(resultado, base, tolerancia)
+        self.stdout.write(f"\nContra {ruta} ({base.get('fecha', '?')}):")
+        for clave in ('base_de_datos', 'servicio', 'concurrencia'):
+            if base.get(clave) != resultado[clave]:
+                self.stderr.write(self.style.WARNING(
+                    f'Ojo: {clave} distinto del baseline ({base.get(clave)} vs {resultado[clave]}).'
+                ))
+        for nombre, metrica, antes, ahora, variacion, regresion in filas:
+            marca = self.style.ERROR(' REGRESIÓN') if regresion else ''
+            self.stdout.write(f'{nombre:<28} {metrica:<22} {antes:>10} -> {ahora:<10} {variacion:+7.1f}%{marca}')
+        regresiones = [f'{nombre} {metrica}' for nombre, metrica, *_, regresion in filas if regresion]
+        if regresiones:
+            raise CommandError(f"Regresiones contra el baseline: {', '.join(regresiones)}")
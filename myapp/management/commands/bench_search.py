@@ -0,0 +1,99 @@
+"""Benchmark de la búsqueda del index sobre catálogos sintéticos de distintos tamaños."""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+
+from myapp.models import Categoria, Servicio
+from myapp.search import RESULTADOS_POR_PAGINA, buscar_servicios, normalizar, texto_de_busqueda
+
+RUBROS = ['Peluquería', 'Barbería', 'Uñas', 'Estética', 'Masajes', 'Depilación', 'Tatuajes', 'Spa']
+NOMBRES = ['Ñandú', 'Colibrí', 'Ombú', 'Jacarandá', 'Aromo', 'Ceibo', 'Tero', 'Hornero', 'Calandria', 'Zorzal']
+BARRIOS = ['Palermo', 'Almagro', 'Caballito', 'Núñez', 'Belgrano', 'Boedo', 'Flores', 'Villa Crespo']
+CONSULTAS = ['peluqueria', 'barberia palermo', 'unas nunez', 'Ñandú', 'spa colibri boedo', 'inexistente']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de la búsqueda del index (página 1) contra la consulta vieja '
+        '(nombre__icontains sin paginar) con catálogos sintéticos de distintos tamaños. '
+        'Todo corre dentro de una transacción que se deshace al final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanios', type=int, nargs='+', default=[1000, 10000, 100000],
+            help='Cantidades de servicios a medir (acumulativas).',
+        )
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        self.stdout.write(f'Base de datos: {connection.vendor}')
+        try:
+            with transaction.atomic():
+                self._medir(sorted(options['tamanios']), options['repeticiones'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _medir(self, tamanios, repeticiones):
+        propietario = User.objects.create_user('bench-search', 'bench-search@example.com')
+        categorias = [
+            Categoria.objects.get_or_create(slug=f'bench-{i}', defaults={'nombre': f'Bench {rubro}'})[0]
+            for i, rubro in enumerate(RUBROS)
+        ]
+        creados = 0
+        self.stdout.write(f"{'servicios':>10} {'consulta':<22} {'vieja ms':>9} {'nueva ms':>9} {'aciertos':>9}")
+        for tamanio in tamanios:
+            self._crear(propietario, categorias, creados, tamanio - creados)
+            creados = tamanio
+            for consulta in CONSULTAS:
+                vieja = self._mediana(repeticiones, lambda: list(
+                    Servicio.objects.filter(esta_activo=True, nombre__icontains=consulta)
+                ))
+                aciertos = []
+
+                def nueva():
+                    servicios = buscar_servicios(Servicio.objects.filter(esta_activo=True), consulta)
+                    pagina = Paginator(servicios, RESULTADOS_POR_PAGINA).get_page(1)
+                    list(pagina)
+                    aciertos[:] = [pagina.paginator.count]
+
+                actual = self._mediana(repeticiones, nueva)
+                self.stdout.write(
+                    f'{tamanio:>10} {consulta:<22} {vieja * 1000:>9.2f} {actual * 1000:>9.2f} {aciertos[0]:>9}'
+                )
+
+    def _crear(self, propietario, categorias, desde, cantidad):
+        lote = []
+        for i in range(desde, desde + cantidad):
+            categoria = random.choice(categorias)
+            nombre = f'{random.choice(RUBROS)} {random.choice(NOMBRES)} {i}'
+            direccion = f'{random.choice(BARRIOS)} {random.randint(100, 9999)}'
+            descripcion = f'Turnos online en {random.choice(BARRIOS)}.'
+            lote.append(Servicio(
+                propietario=propietario, categoria=categoria, nombre=nombre, slug=f'bench-search-{i}',
+                descripcion=descripcion, direccion=direccion,
+                # bulk_create no pasa por Servicio.save().
+                busqueda_nombre=normalizar(nombre),
+                busqueda_texto=texto_de_busqueda(nombre, descripcion, direccion, categoria.nombre),
+            ))
+        Servicio.objects.bulk_create(lote, batch_size=2000)
+
+    def _mediana(self, repeticiones, funcion):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return statistics.median(tiempos)
@@ -0,0 +1,113 @@
+"""Microbenchmark del cálculo de slots: bucle anterior vs. bitmap de myapp.availability."""
+import random
+import statistics
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from myapp.availability import MapaDia, formatear_minuto
+
+
+def _slots_bucle_anterior(fecha, regla, bloqueos, turnos, duracion, buffer_minutos):
+    """Copia del algoritmo que usaba views.obtener_slots_disponibles (sin filtro de hora actual)."""
+    slots = []
+    duracion_td = timedelta(minutes=duracion)
+    periodos = []
+    if regla.tiene_descanso and regla.descanso_inicio and regla.descanso_fin:
+        periodos.append((regla.horario_apertura, regla.descanso_inicio))
+        periodos.append((regla.descanso_fin, regla.horario_cierre))
+    else:
+        periodos.append((regla.horario_apertura, regla.horario_cierre))
+    for inicio_periodo, fin_periodo in periodos:
+        slot_dt = datetime.combine(fecha, inicio_periodo)
+        fin_periodo_dt = datetime.combine(fecha, fin_periodo)
+        while slot_dt + duracion_td <= fin_periodo_dt:
+            slot_fin_dt = slot_dt + duracion_td
+            libre = True
+            for bloqueo in bloqueos:
+                if bloqueo.hora_inicio is None:
+                    libre = False
+                    break
+                if slot_dt.time() < bloqueo.hora_fin and slot_fin_dt.time() > bloqueo.hora_inicio:
+                    libre = False
+                    break
+            if libre:
+                for turno in turnos:
+                    turno_inicio_dt = datetime.combine(fecha, turno.hora)
+                    turno_fin_dt = turno_inicio_dt + timedelta(minutes=turno.duracion_total + buffer_minutos)
+                    if slot_dt < turno_fin_dt and slot_fin_dt > turno_inicio_dt:
+                        libre = False
+                        break
+            if libre:
+                slots.append(slot_dt.strftime('%H:%M'))
+            slot_dt += timedelta(minutes=15)
+    return sorted(set(slots))
+
+
+def _slots_bitmap(regla, bloqueos, turnos, duracion, buffer_minutos):
+    mapa = MapaDia.desde_datos(
+        [regla], bloqueos, [(t.hora, t.duracion_total) for t in turnos], buffer_minutos,
+    )
+    return [formatear_minuto(m) for m in mapa.inicios_libres(duracion)]
+
+
+def _medir(fn, repeticiones):
+    muestras = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        muestras.append(time.perf_counter() - inicio)
+    return statistics.median(muestras)
+
+
+class Command(BaseCommand):
+    help = 'Compara el cálculo de slots anterior (bucles anidados) con el bitmap por minuto.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turnos', type=int, nargs='+', default=[0, 20, 100])
+        parser.add_argument('--duracion', type=int, default=30)
+        parser.add_argument('--repeticiones', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        fecha = date(2030, 1, 7)
+        buffer_minutos = 15
+        duracion = options['duracion']
+        repeticiones = options['repeticiones']
+        # Jornada de 12 horas con descanso, como un negocio grande.
+        regla = SimpleNamespace(
+            horario_apertura=dtime(8, 0), horario_cierre=dtime(20, 0),
+            tiene_descanso=True, descanso_inicio=dtime(13, 0), descanso_fin=dtime(14, 0),
+        )
+        bloqueos = [SimpleNamespace(hora_inicio=dtime(17, 0), hora_fin=dtime(17, 45))]
+
+        self.stdout.write(f'{"turnos":>7} {"anterior (µs)":>14} {"bitmap (µs)":>12} {"speedup":>8}')
+        for cantidad in options['turnos']:
+            turnos = [
+                SimpleNamespace(
+                    hora=dtime(8 + rnd.randrange(12), rnd.choice((0, 15, 30, 45))),
+                    duracion_total=rnd.choice((15, 30, 45, 60)),
+                )
+                for _ in range(cantidad)
+            ]
+            esperado = _slots_bucle_anterior(fecha, regla, bloqueos, turnos, duracion, buffer_minutos)
+            obtenido = _slots_bitmap(regla, bloqueos, turnos, duracion, buffer_minutos)
+            if esperado != obtenido:
+                self.stderr.write(f'Resultados distintos con {cantidad} turnos: {esperado} != {obtenido}')
+                return
+
+            t_anterior = _medir(
+                lambda: _slots_bucle_anterior(fecha, regla, bloqueos, turnos, duracion, buffer_minutos),
+                repeticiones,
+            )
+            t_bitmap = _medir(
+                lambda: _slots_bitmap(regla, bloqueos, turnos, duracion, buffer_minutos),
+                repeticiones,
+            )
+            self.stdout.write(
+                f'{cantidad:>7} {t_anterior * 1e6:>14.1f} {t_bitmap * 1e6:>12.1f} '
+                f'{t_anterior / t_bitmap:>7.1f}x'
+            )
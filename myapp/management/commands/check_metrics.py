@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.management.commands.backfill_metrics import servicio_ids_desde_slugs
+from myapp.metrics import diferencias_metricas, reconstruir_metricas
+
+
+class Command(BaseCommand):
+    help = 'Compara IngresoDiario y SubServicioDiario contra los turnos completados en crudo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servicio',
+            action='append',
+            dest='servicios',
+            metavar='SLUG',
+            help='Sólo este servicio (se puede repetir). Por defecto, todos.',
+        )
+        parser.add_argument('--limite', type=int, default=20, help='Diferencias a listar.')
+        parser.add_argument('--reparar', action='store_true', help='Rearmar los servicios con diferencias.')
+
+    def handle(self, *args, **options):
+        servicio_ids = servicio_ids_desde_slugs(options['servicios'])
+        diferencias = diferencias_metricas(servicio_ids)
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('Las métricas coinciden con Turno.'))
+            return
+
+        for tabla, clave, esperado, guardado in diferencias[:options['limite']]:
+            self.stdout.write(f'{tabla} {clave}: esperado={esperado} guardado={guardado}')
+        if len(diferencias) > options['limite']:
+            self.stdout.write(f'... y {len(diferencias) - options["limite"]} más.')
+
+        if options['reparar']:
+            afectados = sorted({clave[0] for _, clave, _, _ in diferencias})
+            reconstruir_metricas(afectados)
+            self.stdout.write(self.style.WARNING(f'Reconstruidos {len(afectados)} servicios.'))
+            return
+        raise CommandError(f'{len(diferencias)} diferencias entre las métricas y Turno.')
@@ -0,0 +1,41 @@
+"""MercadoPago falso para pruebas de carga de los flujos de pago (ver myapp/fake_mercadopago.py)."""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.fake_mercadopago import FakeMercadoPago
+
+
+class Command(BaseCommand):
+    help = (
+        'Levanta una API de MercadoPago falsa (preapproval y payments). Correr la app con '
+        'MERCADOPAGO_API_URL apuntando a la URL que muestra. Corre hasta SIGTERM/SIGINT.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--demora', type=float, default=0.0, help='Segundos antes de cada respuesta.')
+        parser.add_argument(
+            '--autorizar', action='store_true',
+            help='Las preaprobaciones nuevas nacen "authorized" (checkout ya pagado).',
+        )
+
+    def handle(self, *args, **options):
+        self._seguir = True
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+
+        fake = FakeMercadoPago(options['host'], options['puerto'], options['demora'])
+        if options['autorizar']:
+            fake.estado_inicial = 'authorized'
+        fake.iniciar()
+        self.stdout.write(self.style.SUCCESS(f'MercadoPago falso en {fake.url} (MERCADOPAGO_API_URL={fake.url})'))
+        while self._seguir:
+            time.sleep(0.5)
+        fake.cerrar()
+        self.stdout.write(f'Pedidos atendidos: {len(fake.pedidos)} | conexiones: {fake.conexiones}')
+
+    def _detener(self, signum, frame):
+        self._seguir = False
@@ -0,0 +1,367 @@
+"""
+Dataset sintético para pruebas de carga y benchmarks.
+
+Crea clientes, propietarios con su plan, servicios repartidos en las categorías, equipos
+con HorarioLaboral y DiaNoDisponible, y años de turnos (pasados y futuros) con
+sub-servicios, estados, ingresos y reseñas. Todo va con ``bulk_create`` por lotes, así
+que no corren las señales: al final se rearman OcupacionDiaria y las métricas como en
+``rebuild_occupancy`` y ``backfill_metrics``.
+
+Con la misma ``--semilla``, los mismos parámetros y la misma ``--hoy`` genera exactamente
+los mismos datos (cambian sólo los ids), para que los benchmarks sean comparables.
+"""
+import random
+import time
+from datetime import date, time as hora_del_dia, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from myapp.availability import DIAS_SEMANA, bloqueo_aplica, minuto_del_dia, periodos_de_trabajo, regla_aplica
+from myapp.management.commands.bench_search import BARRIOS, NOMBRES
+from myapp.metrics import reconstruir_metricas
+from myapp.models import (
+    Categoria,
+    DiaNoDisponible,
+    HorarioLaboral,
+    MedioDePago,
+    PerfilUsuario,
+    Plan,
+    Profesional,
+    Reseña,
+    Servicio,
+    SubServicio,
+    Suscripcion,
+    Turno,
+)
+from myapp.occupancy import reconstruir_ocupacion
+from myapp.search import normalizar, texto_de_busqueda
+
+# Los turnos caen en una grilla de una hora y ninguno dura más, así no se pisan.
+PASO_MINUTOS = 60
+DIAS_FUTURO = 30
+SUB_SERVICIOS = [
+    ('Corte', 30), ('Color', 60), ('Brushing', 30), ('Manicura', 45), ('Pedicura', 45),
+    ('Masaje', 60), ('Limpieza facial', 60), ('Perfilado', 30), ('Depilación', 30), ('Barba', 30),
+]
+JORNADAS = [
+    # (apertura, cierre, descanso) en horas.
+    (9, 18, (13, 14)),
+    (10, 19, None),
+    (8, 14, None),
+    (14, 21, None),
+]
+PLANES = [('free', 6), ('pro', 3), ('prime', 1)]
+ESTADOS_PASADOS = [('completado', 75), ('cancelado', 12), ('rechazado', 5), ('pendiente', 4), ('confirmado', 4)]
+ESTADOS_FUTUROS = [('pendiente', 40), ('confirmado', 52), ('cancelado', 8)]
+CALIFICACIONES = [(5, 45), (4, 30), (3, 15), (2, 5), (1, 5)]
+COMENTARIOS = ['', 'Excelente atención.', 'Muy puntuales.', 'Volvería sin dudas.', 'Demoraron un poco.', 'Buen precio.']
+
+
+def _elegir(rng, opciones):
+    valores, pesos = zip(*opciones)
+    return rng.choices(valores, weights=pesos)[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera un dataset sintético y determinístico (usuarios, servicios, equipos, horarios, '
+        'bloqueos, turnos, ingresos y reseñas) con bulk_create por lotes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=5000, help='Clientes a crear.')
+        parser.add_argument('--servicios', type=int, default=200, help='Servicios (uno por propietario).')
+        parser.add_argument(
+            '--profesionales', type=int, default=4,
+            help='Profesionales por servicio con plan Prime; los demás planes tienen uno.',
+        )
+        parser.add_argument('--sub-servicios', type=int, default=5, help='Sub-servicios por servicio.')
+        parser.add_argument('--turnos', type=int, default=200000, help='Turnos en total.')
+        parser.add_argument('--anios', type=int, default=2, help='Años de historia hacia atrás.')
+        parser.add_argument('--proporcion-resenias', type=float, default=0.3,
+                            help='Fracción de turnos completados con reseña.')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--hoy', type=date.fromisoformat, default=None,
+                            help='Fecha de referencia AAAA-MM-DD (por defecto, hoy).')
+        parser.add_argument('--prefijo', default='dataset', help='Prefijo de usernames y slugs.')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por bulk_create.')
+        parser.add_argument('--sin-rollups', action='store_true',
+                            help='No rearmar OcupacionDiaria ni las métricas al final.')
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError(f'{connection.vendor} no devuelve los ids de bulk_create; hace falta para los sub-servicios.')
+        self.prefijo = options['prefijo']
+        if User.objects.filter(username__startswith=f'{self.prefijo}-').exists():
+            raise CommandError(f"Ya hay usuarios con el prefijo '{self.prefijo}'; usá otro --prefijo.")
+        categorias = list(Categoria.objects.order_by('id'))
+        if not categorias:
+            raise CommandError('No hay categorías cargadas (corré las migraciones).')
+        planes = {plan.slug: plan for plan in Plan.objects.filter(slug__in=[slug for slug, _ in PLANES])}
+        if len(planes) != len(PLANES):
+            raise CommandError('Faltan planes free/pro/prime (corré las migraciones).')
+
+        self.rng = random.Random(options['semilla'])
+        self.verbosity = options['verbosity']
+        self.lote = options['lote']
+        self.hoy = options['hoy'] or date.today()
+        inicio = time.perf_counter()
+
+        clientes = self._paso('clientes', lambda: self._crear_usuarios(
+            'cliente', [planes['free']] * options['usuarios'],
+        ))
+        propietarios = self._paso('propietarios', lambda: self._crear_usuarios('propietario', [
+            _elegir(self.rng, [(planes[slug], peso) for slug, peso in PLANES]) for _ in range(options['servicios'])
+        ]))
+        servicios = self._paso('servicios', lambda: self._crear_servicios(propietarios, categorias))
+        sub_servicios = self._paso('sub-servicios', lambda: self._crear_sub_servicios(servicios, options['sub_servicios']))
+        profesionales = self._paso('profesionales', lambda: self._crear_profesionales(
+            servicios, propietarios, sub_servicios, options['profesionales'],
+        ))
+        reglas = self._paso('horarios', lambda: self._crear_horarios(profesionales))
+        desde = self.hoy - timedelta(days=365 * options['anios'])
+        hasta = self.hoy + timedelta(days=DIAS_FUTURO)
+        bloqueos = self._paso('bloqueos', lambda: self._crear_bloqueos(profesionales, desde, hasta))
+        self._paso('favoritos', lambda: self._crear_favoritos(clientes, servicios))
+        creados = self._paso('turnos', lambda: self._crear_turnos(
+            profesionales, sub_servicios, reglas, bloqueos, clientes, desde, hasta,
+            options['turnos'], options['proporcion_resenias'],
+        ))
+        if creados < options['turnos']:
+            self.stderr.write(self.style.WARNING(
+                f'Sólo entraron {creados} turnos en las agendas; subí --servicios o --profesionales.'
+            ))
+        if not options['sin_rollups']:
+            servicio_ids = [servicio.pk for servicio in servicios]
+            self._paso('ocupación', lambda: reconstruir_ocupacion(servicio_ids, batch_size=self.lote))
+            self._paso('métricas', lambda: reconstruir_metricas(servicio_ids, batch_size=self.lote))
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset «{self.prefijo}» listo en {time.perf_counter() - inicio:.1f} s '
+            f'(semilla {options["semilla"]}, hoy {self.hoy}).'
+        ))
+
+    def _paso(self, nombre, funcion):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        segundos = time.perf_counter() - inicio
+        if isinstance(resultado, dict):
+            cantidad = sum(len(filas) if isinstance(filas, list) else 1 for filas in resultado.values())
+        else:
+            cantidad = resultado if isinstance(resultado, int) else len(resultado)
+        self.stdout.write(f'{nombre:<14} {cantidad:>10} filas {segundos:>8.1f} s')
+        return resultado
+
+    def _crear_usuarios(self, rol, planes):
+        """Un usuario por elemento de ``planes``, con perfil verificado y suscripción activa a ese plan."""
+        # Un solo hash para todos: make_password por usuario tardaría minutos.
+        clave = make_password(self.prefijo)
+        usuarios = User.objects.bulk_create([
+            User(
+                username=f'{self.prefijo}-{rol}-{i}', email=f'{self.prefijo}-{rol}-{i}@example.com',
+                first_name=self.rng.choice(NOMBRES), last_name=rol.capitalize(), password=clave,
+            )
+            for i in range(len(planes))
+        ], batch_size=self.lote)
+        # bulk_create no dispara crear_suscripcion_gratuita: perfil y suscripción van a mano.
+        PerfilUsuario.objects.bulk_create([
+            PerfilUsuario(usuario=usuario, email_verified=True, telefono=f'11{self.rng.randrange(10 ** 8):08d}')
+            for usuario in usuarios
+        ], batch_size=self.lote)
+        Suscripcion.objects.bulk_create([
+            Suscripcion(usuario=usuario, plan=plan, is_active=True) for usuario, plan in zip(usuarios, planes)
+        ], batch_size=self.lote)
+        for usuario, plan in zip(usuarios, planes):
+            usuario.plan_slug = plan.slug
+        return usuarios
+
+    def _crear_servicios(self, propietarios, categorias):
+        servicios = []
+        for i, propietario in enumerate(propietarios):
+            categoria = self.rng.choice(categorias)
+            nombre = f'{categoria.nombre} {self.rng.choice(NOMBRES)} {i}'
+            barrio = self.rng.choice(BARRIOS)
+            direccion = f'{barrio} {self.rng.randint(100, 9999)}'
+            descripcion = f'Turnos online en {barrio}.'
+            servicios.append(Servicio(
+                propietario=propietario, categoria=categoria, nombre=nombre,
+                slug=f'{self.prefijo}-{i}', descripcion=descripcion, direccion=direccion,
+                configuracion_inicial_completa=True, esta_activo=self.rng.random() < 0.95,
+                # bulk_create no pasa por Servicio.save().
+                busqueda_nombre=normalizar(nombre),
+                busqueda_texto=texto_de_busqueda(nombre, descripcion, direccion, categoria.nombre),
+            ))
+        servicios = Servicio.objects.bulk_create(servicios, batch_size=self.lote)
+        medios = list(MedioDePago.objects.order_by('id'))
+        if medios:
+            Servicio.medios_de_pago_aceptados.through.objects.bulk_create([
+                Servicio.medios_de_pago_aceptados.through(servicio_id=servicio.pk, mediodepago_id=medio.pk)
+                for servicio in servicios
+                for medio in self.rng.sample(medios, self.rng.randint(1, len(medios)))
+            ], batch_size=self.lote)
+        return servicios
+
+    def _crear_sub_servicios(self, servicios, por_servicio):
+        sub_servicios = SubServicio.objects.bulk_create([
+            SubServicio(
+                servicio_padre=servicio, nombre=nombre, duracion=duracion,
+                precio=Decimal(self.rng.randrange(3000, 30000, 500)),
+            )
+            for servicio in servicios
+            for nombre, duracion in self.rng.sample(SUB_SERVICIOS, min(por_servicio, len(SUB_SERVICIOS)))
+        ], batch_size=self.lote)
+        por_id = {}
+        for sub_servicio in sub_servicios:
+            por_id.setdefault(sub_servicio.servicio_padre_id, []).append(sub_servicio)
+        return por_id
+
+    def _crear_profesionales(self, servicios, propietarios, sub_servicios, maximo_prime):
+        profesionales = []
+        for servicio, propietario in zip(servicios, propietarios):
+            cantidad = maximo_prime if propietario.plan_slug == 'prime' else 1
+            profesionales.extend(
+                Profesional(servicio=servicio, nombre=f'{self.rng.choice(NOMBRES)} {servicio.pk}-{j}')
+                for j in range(max(cantidad, 1))
+            )
+        profesionales = Profesional.objects.bulk_create(profesionales, batch_size=self.lote)
+        Profesional.sub_servicios_ofrecidos.through.objects.bulk_create([
+            Profesional.sub_servicios_ofrecidos.through(profesional_id=profesional.pk, subservicio_id=sub.pk)
+            for profesional in profesionales
+            for sub in sub_servicios.get(profesional.servicio_id, [])
+        ], batch_size=self.lote)
+        return profesionales
+
+    def _crear_horarios(self, profesionales):
+        reglas = []
+        for profesional in profesionales:
+            apertura, cierre, descanso = self.rng.choice(JORNADAS)
+            dias = dict.fromkeys(DIAS_SEMANA[:5], True)
+            dias['sabado'] = self.rng.random() < 0.4
+            reglas.append(HorarioLaboral(
+                profesional=profesional, horario_apertura=hora_del_dia(apertura), horario_cierre=hora_del_dia(cierre),
+                tiene_descanso=descanso is not None,
+                descanso_inicio=hora_del_dia(descanso[0]) if descanso else None,
+                descanso_fin=hora_del_dia(descanso[1]) if descanso else None,
+                **dias,
+            ))
+        reglas = HorarioLaboral.objects.bulk_create(reglas, batch_size=self.lote)
+        return {regla.profesional_id: regla for regla in reglas}
+
+    def _crear_bloqueos(self, profesionales, desde, hasta):
+        """Vacaciones (días completos) y algún trámite de unas horas, por año y profesional."""
+        dias = (hasta - desde).days
+        bloqueos = []
+        for profesional in profesionales:
+            for _ in range(max(dias // 365, 1) * 2):
+                inicio = desde + timedelta(days=self.rng.randrange(dias))
+                bloqueos.append(DiaNoDisponible(
+                    profesional=profesional, fecha_inicio=inicio,
+                    fecha_fin=inicio + timedelta(days=self.rng.randint(0, 9)), motivo='Vacaciones',
+                ))
+            hora = self.rng.randint(9, 16)
+            bloqueos.append(DiaNoDisponible(
+                profesional=profesional, fecha_inicio=desde + timedelta(days=self.rng.randrange(dias)),
+                hora_inicio=hora_del_dia(hora), hora_fin=hora_del_dia(hora + 2), motivo='Trámite',
+            ))
+        DiaNoDisponible.objects.bulk_create(bloqueos, batch_size=self.lote)
+        por_profesional = {}
+        for bloqueo in bloqueos:
+            por_profesional.setdefault(bloqueo.profesional_id, []).append(bloqueo)
+        return por_profesional
+
+    def _crear_favoritos(self, clientes, servicios):
+        favoritos = Servicio.favoritos.through.objects.bulk_create([
+            Servicio.favoritos.through(servicio_id=servicio.pk, user_id=cliente.pk)
+            for cliente in clientes
+            for servicio in self.rng.sample(servicios, min(self.rng.randint(0, 3), len(servicios)))
+        ], batch_size=self.lote)
+        return len(favoritos)
+
+    def _huecos(self, regla, bloqueos, desde, hasta):
+        """``(fecha, minuto)`` de cada hueco de una hora libre en la agenda del profesional."""
+        huecos = []
+        fecha = desde
+        while fecha <= hasta:
+            if regla_aplica(regla, fecha):
+                del_dia = [b for b in bloqueos if bloqueo_aplica(b, fecha)]
+                if not any(b.hora_inicio is None for b in del_dia):
+                    tomados = [(minuto_del_dia(b.hora_inicio), minuto_del_dia(b.hora_fin)) for b in del_dia]
+                    for inicio, fin in periodos_de_trabajo(regla):
+                        for minuto in range(inicio, fin - PASO_MINUTOS + 1, PASO_MINUTOS):
+                            if not any(desde_b < minuto + PASO_MINUTOS and minuto < hasta_b for desde_b, hasta_b in tomados):
+                                huecos.append((fecha, minuto))
+            fecha += timedelta(days=1)
+        return huecos
+
+    def _cupos(self, profesionales, total):
+        """Reparte ``total`` turnos entre los profesionales con una popularidad al azar."""
+        pesos = [self.rng.uniform(0.5, 1.5) for _ in profesionales]
+        suma = sum(pesos)
+        cupos = [int(total * peso / suma) for peso in pesos]
+        for i in range(total - sum(cupos)):
+            cupos[i % len(cupos)] += 1
+        return cupos
+
+    def _crear_turnos(self, profesionales, sub_servicios, reglas, bloqueos, clientes, desde, hasta,
+                      total, proporcion_resenias):
+        pendientes = []
+        creados = 0
+        combinaciones = {}
+        for profesional, cupo in zip(profesionales, self._cupos(profesionales, total)):
+            subs = sub_servicios.get(profesional.servicio_id, [])
+            if profesional.servicio_id not in combinaciones:
+                simples = [(sub,) for sub in subs]
+                dobles = [
+                    (a, b) for i, a in enumerate(subs) for b in subs[i + 1:] if a.duracion + b.duracion <= PASO_MINUTOS
+                ]
+                combinaciones[profesional.servicio_id] = (simples, dobles)
+            simples, dobles = combinaciones[profesional.servicio_id]
+            if not simples:
+                continue
+            huecos = self._huecos(reglas[profesional.pk], bloqueos.get(profesional.pk, []), desde, hasta)
+            for fecha, minuto in sorted(self.rng.sample(huecos, min(cupo, len(huecos)))):
+                elegidos = self.rng.choice(dobles) if dobles and self.rng.random() < 0.2 else self.rng.choice(simples)
+                pasado = fecha < self.hoy
+                estado = _elegir(self.rng, ESTADOS_PASADOS if pasado else ESTADOS_FUTUROS)
+                medio = self.rng.choice(Turno.MEDIO_DE_PAGO_CHOICES)[0]
+                completado = estado == 'completado'
+                turno = Turno(
+                    servicio_id=profesional.servicio_id, profesional=profesional,
+                    cliente_id=self.rng.choice(clientes).pk, fecha=fecha, hora=hora_del_dia(*divmod(minuto, 60)),
+                    duracion_total=sum(sub.duracion for sub in elegidos), estado=estado, medio_de_pago=medio,
+                    medio_de_pago_final=medio if completado else None,
+                    ingreso_real=sum(sub.precio for sub in elegidos) if completado else None,
+                    visto_por_cliente=pasado, recordatorio_enviado=pasado,
+                )
+                resenia = completado and self.rng.random() < proporcion_resenias
+                pendientes.append((turno, elegidos, (
+                    _elegir(self.rng, CALIFICACIONES), self.rng.choice(COMENTARIOS),
+                ) if resenia else None))
+                if len(pendientes) >= self.lote:
+                    creados += self._guardar_turnos(pendientes)
+                    pendientes = []
+        return creados + self._guardar_turnos(pendientes)
+
+    def _guardar_turnos(self, pendientes):
+        if not pendientes:
+            return 0
+        intermedia = Turno.sub_servicios_solicitados.through
+        with transaction.atomic():
+            Turno.objects.bulk_create([turno for turno, _, _ in pendientes], batch_size=self.lote)
+            intermedia.objects.bulk_create([
+                intermedia(turno_id=turno.pk, subservicio_id=sub.pk)
+                for turno, elegidos, _ in pendientes for sub in elegidos
+            ], batch_size=self.lote)
+            Reseña.objects.bulk_create([
+                Reseña(
+                    servicio_id=turno.servicio_id, turno=turno, usuario_id=turno.cliente_id,
+                    calificacion=resenia[0], comentario=resenia[1],
+                )
+                for turno, _, resenia in pendientes if resenia
+            ], batch_size=self.lote)
+        if self.verbosity > 1:
+            self.stdout.write(f'  +{len(pendientes)} turnos')
+        return len(pendientes)
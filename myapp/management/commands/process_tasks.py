@@ -0,0 +1,69 @@
+"""Worker de la cola de tareas (myapp/tasks.py): correos de reservas, cancelaciones y registro."""
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp import pidgeon
+from myapp.locks import adquirir
+from myapp.tasks import encolar, procesar_lote, purgar_hechas
+
+PURGA_CADA_SEGUNDOS = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta las tareas encoladas por las vistas, en lotes y con concurrencia acotada. '
+        'Corre hasta recibir SIGTERM/SIGINT (termina el lote en curso) o, con --una-vez, '
+        'hasta vaciar la cola.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrencia', type=int, default=settings.TAREAS_CONCURRENCIA,
+            help='Hilos que ejecutan tareas a la vez.',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=settings.TAREAS_LOTE,
+            help='Tareas que se reclaman por consulta.',
+        )
+        parser.add_argument(
+            '--espera', type=float, default=2.0,
+            help='Segundos entre consultas cuando la cola está vacía.',
+        )
+        parser.add_argument('--una-vez', action='store_true', help='Salir cuando no queden tareas listas.')
+
+    def handle(self, *args, **options):
+        self._seguir = True
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+
+        procesadas = 0
+        proxima_purga = 0.0
+        proximo_reintento_emails = 0.0
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrencia'])) as ejecutor:
+            while self._seguir:
+                # Los candados no se liberan: vencen solos, así corre una vez por intervalo
+                # aunque haya varios workers.
+                if time.monotonic() >= proxima_purga:
+                    if adquirir('purga_tareas', PURGA_CADA_SEGUNDOS):
+                        purgar_hechas(settings.TAREAS_RETENCION_DIAS)
+                    proxima_purga = time.monotonic() + PURGA_CADA_SEGUNDOS
+                if time.monotonic() >= proximo_reintento_emails:
+                    # Drena EmailFailureLog dentro del mismo pool (ver myapp/email_retry.py).
+                    if adquirir('reintento_emails', settings.EMAIL_RETRY_INTERVAL_SECONDS):
+                        encolar('emails.reintentar_fallidos')
+                    proximo_reintento_emails = time.monotonic() + settings.EMAIL_RETRY_INTERVAL_SECONDS
+                tareas = procesar_lote(options['lote'], ejecutor)
+                procesadas += len(tareas)
+                if not tareas:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['espera'])
+        self.stdout.write(self.style.SUCCESS(f'Tareas procesadas: {procesadas}'))
+        self.stdout.write(f'Pidgeon: {pidgeon.resumen()}')
+
+    def _detener(self, signum, frame):
+        self._seguir = False
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from myapp.management.commands.backfill_metrics import servicio_ids_desde_slugs
+from myapp.occupancy import reconstruir_ocupacion
+
+
+class Command(BaseCommand):
+    help = 'Rearma desde cero la tabla OcupacionDiaria a partir de Turno y HorarioLaboral.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servicio',
+            action='append',
+            dest='servicios',
+            metavar='SLUG',
+            help='Sólo este servicio (se puede repetir). Por defecto, todos.',
+        )
+
+    def handle(self, *args, **options):
+        filas = reconstruir_ocupacion(servicio_ids_desde_slugs(options['servicios']))
+        self.stdout.write(self.style.SUCCESS(f'OcupacionDiaria reconstruida: {filas} filas.'))
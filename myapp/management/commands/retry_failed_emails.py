@@ -0,0 +1,34 @@
+"""Reintenta los correos pendientes de EmailFailureLog (ver myapp/email_retry.py)."""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from myapp import pidgeon
+from myapp.email_retry import reintentar_fallidos
+
+
+class Command(BaseCommand):
+    help = (
+        'Drena EmailFailureLog sin resolver: cierra recordatorios vencidos, colapsa duplicados, reenvía por lotes con el HTML '
+        'guardado y su idempotency key, y reprograma con backoff los que vuelven a fallar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='Filas que se toman por consulta.')
+        parser.add_argument('--limite', type=int, default=None, help='Máximo de filas a reintentar en esta corrida.')
+        parser.add_argument('--concurrencia', type=int, default=1, help='Reenvíos en paralelo.')
+
+    def handle(self, *args, **options):
+        if options['concurrencia'] > 1:
+            with ThreadPoolExecutor(max_workers=options['concurrencia']) as ejecutor:
+                contadores = reintentar_fallidos(options['lote'], options['limite'], ejecutor=ejecutor)
+        else:
+            contadores = reintentar_fallidos(options['lote'], options['limite'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Revisados: {contadores['revisados']} | reenviados: {contadores['reenviados']} | "
+            f"fallidos: {contadores['fallidos']} | agotados: {contadores['agotados']} | "
+            f"duplicados: {contadores['duplicados']} | vencidos: {contadores['vencidos']} | {contadores['por_segundo']}/s en {contadores['segundos']} s"
+        ))
+        if contadores['circuito_abierto']:
+            self.stdout.write(self.style.WARNING('Circuito de Pidgeon abierto: se cortó la corrida.'))
+        self.stdout.write(f'Pidgeon: {pidgeon.resumen()}')
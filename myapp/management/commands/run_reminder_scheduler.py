@@ -0,0 +1,62 @@
+"""Scheduler residente de recordatorios (ver myapp/reminders.py)."""
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.locks import CandadoPerdido, adquirir
+from myapp.reminders import CANDADO_SCHEDULER as CANDADO, Scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        'Mantiene en memoria los recordatorios próximos y encola cada uno en su momento exacto '
+        '(inicio - REMINDER_OFFSET_MINUTES). Los envía el worker process_tasks. Con varias '
+        'instancias trabaja sólo la que tiene el candado; las demás quedan de reserva.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sondeo', type=float, default=settings.REMINDER_SCHEDULER_POLL_SECONDS,
+            help='Segundos máximos entre lecturas de turnos cambiados.',
+        )
+        parser.add_argument(
+            '--recarga', type=int, default=settings.REMINDER_SCHEDULER_RELOAD_SECONDS,
+            help='Segundos entre recargas completas de la agenda.',
+        )
+
+    def handle(self, *args, **options):
+        self._seguir = True
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+
+        scheduler = None
+        lease = None
+        disparados = 0
+        while self._seguir:
+            # Un solo líder entre instancias; el resto espera a que el lease venza.
+            if lease is None:
+                lease = adquirir(CANDADO)
+                if lease is None:
+                    time.sleep(options['sondeo'])
+                    continue
+                scheduler = Scheduler(options['recarga'])
+            try:
+                lease.renovar()
+            except CandadoPerdido:
+                lease = None
+                continue
+            disparados += len(scheduler.paso(timezone.now()))
+            espera = options['sondeo']
+            proximo = scheduler.agenda.proximo()
+            if proximo is not None:
+                espera = min(espera, max(0.0, (proximo - timezone.now()).total_seconds()))
+            time.sleep(espera)
+        if lease is not None:
+            lease.liberar()
+        self.stdout.write(self.style.SUCCESS(f'Recordatorios encolados: {disparados}'))
+
+    def _detener(self, signum, frame):
+        self._seguir = False
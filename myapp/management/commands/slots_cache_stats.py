@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from myapp.availability import estadisticas_cache, reiniciar_estadisticas_cache
+
+
+class Command(BaseCommand):
+    help = 'Muestra los hits/misses de la caché de slots disponibles (opcionalmente los reinicia).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Pone los contadores en cero.')
+
+    def handle(self, *args, **options):
+        stats = estadisticas_cache()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_rate={stats['hit_rate']:.1%}"
+        )
+        if options['reset']:
+            reiniciar_estadisticas_cache()
+            self.stdout.write(self.style.SUCCESS('Contadores reiniciados.'))
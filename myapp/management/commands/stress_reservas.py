@@ -0,0 +1,124 @@
+"""Prueba de carga del alta de turnos: N reservas simultáneas contra el mismo hueco."""
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from myapp.availability import minuto_del_dia, slots_disponibles
+from myapp.booking import TurnoNoDisponible, reservar_turno
+from myapp.models import Servicio, Turno
+
+
+class Command(BaseCommand):
+    help = (
+        'Dispara reservas concurrentes al mismo horario de un profesional y verifica que gane '
+        'exactamente una por ronda. Reporta throughput y latencias. Borra los turnos creados al final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('servicio_slug')
+        parser.add_argument('--hilos', type=int, default=20, help='Reservas simultáneas por ronda.')
+        parser.add_argument('--rondas', type=int, default=10)
+        parser.add_argument('--duracion', type=int, default=30)
+        parser.add_argument('--dias-adelante', type=int, default=30, help='Se reserva a partir de este día.')
+        parser.add_argument('--conservar', action='store_true', help='No borrar los turnos creados.')
+
+    def handle(self, *args, **options):
+        try:
+            servicio = Servicio.objects.get(slug=options['servicio_slug'])
+        except Servicio.DoesNotExist:
+            raise CommandError(f"No existe el servicio '{options['servicio_slug']}'.")
+        profesional = servicio.profesionales.filter(activo=True).order_by('id').first()
+        if profesional is None:
+            raise CommandError('El servicio no tiene profesionales activos.')
+        if not connection.features.has_select_for_update:
+            self.stderr.write(self.style.WARNING(
+                f'{connection.vendor} no soporta SELECT ... FOR UPDATE: el resultado no es representativo.'
+            ))
+
+        duracion = options['duracion']
+        hilos = options['hilos']
+        huecos = self._huecos(servicio, profesional, duracion, options['rondas'], options['dias_adelante'])
+        if len(huecos) < options['rondas']:
+            raise CommandError('No hay suficientes horarios libres para las rondas pedidas.')
+
+        creados, latencias, ganadores_por_ronda, errores = [], [], [], 0
+        lock = threading.Lock()
+        inicio_total = time.perf_counter()
+        for fecha, hora in huecos:
+            largada = threading.Barrier(hilos)
+            ganadores = []
+
+            def intentar():
+                nonlocal errores
+                turno = Turno(
+                    servicio=servicio, cliente=servicio.propietario,
+                    fecha=fecha, hora=hora, duracion_total=duracion,
+                )
+                largada.wait()
+                inicio = time.perf_counter()
+                try:
+                    reservar_turno(turno, [profesional.id])
+                    resultado = turno.id
+                except TurnoNoDisponible:
+                    resultado = None
+                except DatabaseError:
+                    resultado = None
+                    with lock:
+                        errores += 1
+                finally:
+                    connection.close()
+                with lock:
+                    latencias.append(time.perf_counter() - inicio)
+                    if resultado:
+                        ganadores.append(resultado)
+
+            threads = [threading.Thread(target=intentar) for _ in range(hilos)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ganadores_por_ronda.append(len(ganadores))
+            creados.extend(ganadores)
+        total = time.perf_counter() - inicio_total
+
+        intentos = len(latencias)
+        cuantiles = statistics.quantiles(latencias, n=100) if intentos > 1 else latencias * 99
+        rondas_ok = sum(1 for g in ganadores_por_ronda if g == 1)
+        self.stdout.write(f'Base de datos:          {connection.vendor}')
+        self.stdout.write(f'Rondas x hilos:         {len(huecos)} x {hilos}')
+        self.stdout.write(f'Rondas con 1 ganador:   {rondas_ok}/{len(huecos)}')
+        self.stdout.write(f'Turnos duplicados:      {sum(max(g - 1, 0) for g in ganadores_por_ronda)}')
+        self.stdout.write(f'Errores de base:        {errores}')
+        self.stdout.write(f'Intentos por segundo:   {intentos / total:.1f}')
+        self.stdout.write(f'Reservas por segundo:   {len(creados) / total:.1f}')
+        self.stdout.write(f'Latencia p50/p95 (ms):  {cuantiles[49] * 1000:.1f} / {cuantiles[94] * 1000:.1f}')
+
+        if not options['conservar']:
+            Turno.objects.filter(id__in=creados).delete()
+
+        if rondas_ok != len(huecos):
+            raise CommandError('Hubo rondas sin exactamente un ganador.')
+        self.stdout.write(self.style.SUCCESS('OK: cada hueco se reservó una sola vez.'))
+
+    def _huecos(self, servicio, profesional, duracion, rondas, dias_adelante):
+        """Primeros ``rondas`` horarios libres del profesional, sin solaparse entre sí."""
+        huecos = []
+        fecha = timezone.localdate() + timedelta(days=dias_adelante)
+        for _ in range(60):
+            ultimo_fin = None
+            for slot in slots_disponibles(profesional, fecha, duracion, servicio.duracion_buffer_minutos):
+                hora = datetime.strptime(slot, '%H:%M').time()
+                minutos = minuto_del_dia(hora)
+                if ultimo_fin is not None and minutos < ultimo_fin:
+                    continue
+                huecos.append((fecha, hora))
+                ultimo_fin = minutos + duracion + servicio.duracion_buffer_minutos
+                if len(huecos) == rondas:
+                    return huecos
+            fecha += timedelta(days=1)
+        return huecos
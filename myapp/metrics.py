@@ -0,0 +1,310 @@
+"""
+Métricas de ingresos del dashboard sobre tablas pre-agregadas.
+
+IngresoDiario guarda, por (servicio, profesional, medio de pago final, fecha), la suma de
+``ingreso_real`` y la cantidad de turnos completados; SubServicioDiario, cuántos turnos
+completados incluyeron cada sub-servicio. Son tablas separadas para no multiplicar los
+ingresos por la cantidad de sub-servicios de cada turno.
+
+``signals.py`` recalcula las filas de un (servicio, profesional, fecha) cuando un turno
+entra o sale de "completado" o le cambian el ingreso o el medio de pago (lo que hace
+``finalizar_turno``). ``backfill_metrics`` rearma todo y ``check_metrics`` compara las
+tablas contra Turno.
+
+Las respuestas de ``api_metricas_grafico`` se cachean con claves versionadas por servicio
+y por mes: recalcular un día sube la versión de su mes, así que los períodos cerrados
+quedan cacheados hasta que alguien edite un turno viejo. La versión también es el ETag.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from . import cache_versions
+from .models import IngresoDiario, Servicio, SubServicioDiario, Turno
+from .occupancy import bloquear_recalculo
+
+ESTADO_COMPLETADO = 'completado'
+
+
+def _completados(turnos):
+    return turnos.filter(estado=ESTADO_COMPLETADO)
+
+
+def agregar_ingresos(turnos):
+    """Turnos completados agrupados por la clave de IngresoDiario, en una consulta."""
+    return _completados(turnos).annotate(
+        medio=Coalesce('medio_de_pago_final', Value('')),
+    ).values('servicio_id', 'profesional_id', 'medio', 'fecha').annotate(
+        total=Sum('ingreso_real'),
+        cantidad=Count('id'),
+        con_ingreso=Count('ingreso_real'),
+    ).order_by()
+
+
+def agregar_sub_servicios(turnos):
+    """Turnos completados por sub-servicio, agrupados por la clave de SubServicioDiario."""
+    return _completados(turnos).filter(sub_servicios_solicitados__isnull=False).values(
+        'servicio_id', 'profesional_id', 'fecha', sub_servicio_id=F('sub_servicios_solicitados'),
+    ).annotate(cantidad=Count('id')).order_by()
+
+
+def filas_ingresos(agregados, modelo=IngresoDiario):
+    return [
+        modelo(
+            servicio_id=fila['servicio_id'],
+            profesional_id=fila['profesional_id'],
+            medio_de_pago_final=fila['medio'],
+            fecha=fila['fecha'],
+            ingresos=fila['total'] or 0,
+            turnos=fila['cantidad'],
+            turnos_con_ingreso=fila['con_ingreso'],
+        )
+        for fila in agregados
+    ]
+
+
+def filas_sub_servicios(agregados, modelo=SubServicioDiario):
+    return [modelo(**fila) for fila in agregados]
+
+
+def _rearmar(servicio_id, profesional_id, fechas):
+    turnos = Turno.objects.filter(servicio_id=servicio_id, profesional_id=profesional_id, fecha__in=fechas)
+    clave = {'servicio_id': servicio_id, 'profesional_id': profesional_id, 'fecha__in': fechas}
+    IngresoDiario.objects.filter(**clave).delete()
+    SubServicioDiario.objects.filter(**clave).delete()
+    IngresoDiario.objects.bulk_create(filas_ingresos(agregar_ingresos(turnos)))
+    SubServicioDiario.objects.bulk_create(filas_sub_servicios(agregar_sub_servicios(turnos)))
+
+
+def recalcular_metricas(servicio_id, profesional_id, fechas):
+    """
+    Rearma las filas de métricas de un profesional (o de "sin profesional") en ``fechas``.
+    Agrega Turno dentro de la transacción y con el mismo bloqueo que la ocupación.
+    """
+    fechas = {fecha for fecha in fechas if fecha}
+    if not servicio_id or not fechas:
+        return
+    with transaction.atomic():
+        bloquear_recalculo(servicio_id, profesional_id)
+        _rearmar(servicio_id, profesional_id, fechas)
+    invalidar_metricas(servicio_id, fechas)
+
+
+def recalcular_sin_profesional(servicio_id):
+    """Rearma las filas de turnos sin profesional de un servicio (quedan así al borrar uno)."""
+    with transaction.atomic():
+        bloquear_recalculo(servicio_id, None)
+        fechas = set(_completados(
+            Turno.objects.filter(servicio_id=servicio_id, profesional__isnull=True)
+        ).values_list('fecha', flat=True))
+        IngresoDiario.objects.filter(servicio_id=servicio_id, profesional__isnull=True).delete()
+        SubServicioDiario.objects.filter(servicio_id=servicio_id, profesional__isnull=True).delete()
+        if fechas:
+            _rearmar(servicio_id, None, fechas)
+    invalidar_metricas(servicio_id, fechas)
+
+
+def reconstruir_metricas(servicio_ids=None, batch_size=1000):
+    """Borra y rearma las dos tablas (todo, o sólo ``servicio_ids``). Devuelve las filas creadas."""
+    turnos = Turno.objects.all()
+    ingresos = IngresoDiario.objects.all()
+    sub_servicios = SubServicioDiario.objects.all()
+    if servicio_ids is not None:
+        turnos = turnos.filter(servicio_id__in=servicio_ids)
+        ingresos = ingresos.filter(servicio_id__in=servicio_ids)
+        sub_servicios = sub_servicios.filter(servicio_id__in=servicio_ids)
+    filas_i = filas_ingresos(agregar_ingresos(turnos))
+    filas_s = filas_sub_servicios(agregar_sub_servicios(turnos))
+    with transaction.atomic():
+        ingresos.delete()
+        sub_servicios.delete()
+        IngresoDiario.objects.bulk_create(filas_i, batch_size=batch_size)
+        SubServicioDiario.objects.bulk_create(filas_s, batch_size=batch_size)
+    if servicio_ids is None:
+        servicio_ids = Servicio.objects.values_list('id', flat=True)
+    for servicio_id in servicio_ids:
+        invalidar_metricas(servicio_id)
+    return len(filas_i) + len(filas_s)
+
+
+def diferencias_metricas(servicio_ids=None):
+    """
+    Compara las tablas contra lo que sale de agregar Turno en crudo. Devuelve una lista
+    de ``(tabla, clave, esperado, guardado)``; vacía si están al día.
+    """
+    turnos = Turno.objects.all()
+    ingresos = IngresoDiario.objects.all()
+    sub_servicios = SubServicioDiario.objects.all()
+    if servicio_ids is not None:
+        turnos = turnos.filter(servicio_id__in=servicio_ids)
+        ingresos = ingresos.filter(servicio_id__in=servicio_ids)
+        sub_servicios = sub_servicios.filter(servicio_id__in=servicio_ids)
+
+    def _comparar(tabla, esperado, guardado):
+        return [
+            (tabla, clave, esperado.get(clave), guardado.get(clave))
+            for clave in sorted(set(esperado) | set(guardado), key=str)
+            if esperado.get(clave) != guardado.get(clave)
+        ]
+
+    esperado_i = {
+        (f['servicio_id'], f['profesional_id'], f['medio'], f['fecha']):
+            (Decimal(f['total'] or 0), f['cantidad'], f['con_ingreso'])
+        for f in agregar_ingresos(turnos)
+    }
+    guardado_i = {
+        (f.servicio_id, f.profesional_id, f.medio_de_pago_final, f.fecha):
+            (f.ingresos, f.turnos, f.turnos_con_ingreso)
+        for f in ingresos
+    }
+    esperado_s = {
+        (f['servicio_id'], f['profesional_id'], f['sub_servicio_id'], f['fecha']): f['cantidad']
+        for f in agregar_sub_servicios(turnos)
+    }
+    guardado_s = {
+        (f.servicio_id, f.profesional_id, f.sub_servicio_id, f.fecha): f.cantidad
+        for f in sub_servicios
+    }
+    return (
+        _comparar('IngresoDiario', esperado_i, guardado_i)
+        + _comparar('SubServicioDiario', esperado_s, guardado_s)
+    )
+
+
+# --- Caché de respuestas del gráfico ---
+
+_PREFIJO_CACHE = 'metricas'
+# Candados por franja de claves: limitan a un cálculo por clave dentro del proceso.
+_CANDADOS = tuple(threading.Lock() for _ in range(32))
+
+
+def _clave_version_servicio(servicio_id):
+    return f'{_PREFIJO_CACHE}:v:s:{servicio_id}'
+
+
+def _clave_version_mes(servicio_id, año, mes):
+    return f'{_PREFIJO_CACHE}:v:m:{servicio_id}:{año}-{mes:02d}'
+
+
+def _meses(desde, hasta):
+    año, mes = desde.year, desde.month
+    while (año, mes) <= (hasta.year, hasta.month):
+        yield año, mes
+        año, mes = (año, mes + 1) if mes < 12 else (año + 1, 1)
+
+
+def invalidar_metricas(servicio_id, fechas=None):
+    """Sube la versión de los meses de ``fechas`` o, sin fechas, la de todo el servicio."""
+    if not servicio_id:
+        return
+    if fechas is None:
+        claves = [_clave_version_servicio(servicio_id)]
+    else:
+        claves = {_clave_version_mes(servicio_id, fecha.year, fecha.month) for fecha in fechas if fecha}
+    cache_versions.subir(claves)
+
+
+def version_datos(servicio_id, desde, hasta):
+    """Versión de los datos del servicio en ``[desde, hasta]`` (la del servicio y la de cada mes)."""
+    claves = [_clave_version_servicio(servicio_id)]
+    claves += [_clave_version_mes(servicio_id, año, mes) for año, mes in _meses(desde, hasta)]
+    versiones = cache_versions.vigentes(claves)
+    return '.'.join(str(versiones.get(clave, 0)) for clave in claves)
+
+
+def obtener_o_calcular(clave, calcular, timeout, espera=10):
+    """
+    ``cache.get(clave)`` o, si no está, ``calcular()`` guardándolo. Los misses concurrentes
+    de la misma clave se juntan en un solo cálculo: dentro del proceso con un candado y
+    entre procesos con una marca ``cache.add``. Si la marca es de otro proceso se espera
+    hasta ``espera`` s fuera del candado, para no trabar las demás claves de su franja.
+    """
+    valor = cache.get(clave)
+    if valor is not None:
+        return valor
+    marca = f'{clave}:calculando'
+    limite = time.monotonic() + espera
+    while True:
+        with _CANDADOS[hash(clave) % len(_CANDADOS)]:
+            valor = cache.get(clave)
+            if valor is not None:
+                return valor
+            propia = cache.add(marca, 1, espera)
+            # Sin marca propia sólo se calcula si el otro no terminó a tiempo.
+            if propia or time.monotonic() >= limite:
+                try:
+                    valor = calcular()
+                    cache.set(clave, valor, timeout)
+                finally:
+                    if propia:
+                        cache.delete(marca)
+                return valor
+        time.sleep(0.05)
+
+
+def timeout_grafico(hasta, hoy):
+    """Los períodos que ya terminaron casi no cambian: se cachean mucho más tiempo."""
+    if hasta < hoy:
+        return getattr(settings, 'METRICAS_CACHE_TIMEOUT_HISTORICO', 7 * 24 * 3600)
+    return getattr(settings, 'METRICAS_CACHE_TIMEOUT', 300)
+
+
+# --- Consultas del dashboard ---
+
+def _ingresos_periodo(servicio, desde, hasta):
+    return IngresoDiario.objects.filter(servicio=servicio, fecha__range=(desde, hasta))
+
+
+def resumen_periodo(servicio, desde, hasta):
+    """KPIs del período: ingresos totales, turnos completados e ingreso promedio."""
+    totales = _ingresos_periodo(servicio, desde, hasta).aggregate(
+        ingresos=Sum('ingresos'), turnos=Sum('turnos'), con_ingreso=Sum('turnos_con_ingreso'),
+    )
+    ingresos = totales['ingresos'] or 0
+    return {
+        'ingresos_totales': ingresos,
+        'turnos_totales': totales['turnos'] or 0,
+        'ingreso_promedio': ingresos / totales['con_ingreso'] if totales['con_ingreso'] else 0,
+    }
+
+
+def sub_servicios_populares(servicio, desde, hasta, limite=5):
+    """``[(nombre, cantidad)]`` de los sub-servicios más pedidos en turnos completados."""
+    return list(
+        SubServicioDiario.objects.filter(servicio=servicio, fecha__range=(desde, hasta))
+        .values('sub_servicio__nombre')
+        .annotate(cantidad=Sum('cantidad'))
+        .order_by('-cantidad')
+        .values_list('sub_servicio__nombre', 'cantidad')[:limite]
+    )
+
+
+def ingresos_por_profesional(servicio, desde, hasta):
+    return (
+        _ingresos_periodo(servicio, desde, hasta).filter(profesional__isnull=False)
+        .values('profesional__nombre')
+        .annotate(total_ingresos=Sum('ingresos'), cantidad_turnos=Sum('turnos'))
+        .order_by('-total_ingresos')
+    )
+
+
+def serie_ingresos(servicio, desde, hasta, agrupar_por_mes=False, por_profesional=False):
+    """
+    Ingresos agrupados por día (o por mes), opcionalmente también por profesional:
+    filas ``{'periodo', 'total'[, 'profesional__nombre']}`` ordenadas como espera el gráfico.
+    """
+    qs = _ingresos_periodo(servicio, desde, hasta)
+    periodo = TruncMonth('fecha') if agrupar_por_mes else F('fecha')
+    campos = ['periodo']
+    orden = ['periodo']
+    if por_profesional:
+        qs = qs.filter(profesional__isnull=False)
+        campos.append('profesional__nombre')
+        orden = ['profesional__nombre', 'periodo']
+    return qs.annotate(periodo=periodo).values(*campos).annotate(total=Sum('ingresos')).order_by(*orden)
@@ -1,12 +1,16 @@
 # myapp/middleware.py
+import time
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import logout as auth_logout
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
 from django.shortcuts import redirect
 from django.urls import reverse
-from allauth.socialaccount.models import SocialAccount
 
 from .subscription_utils import ensure_suscripcion_gratuita
+from .user_state import estado_usuario, olvidar_estado_usuario
 
 
 class EnsureSuscripcionGratuitaMiddleware:
@@ -30,7 +34,9 @@ class EnsureSuscripcionGratuitaMiddleware:
             getattr(request, 'user', None).is_authenticated
             and all(not request.path.startswith(p) for p in self.SKIP_PREFIXES)
         ):
-            ensure_suscripcion_gratuita(request.user)
+            if not estado_usuario(request).tiene_suscripcion:
+                ensure_suscripcion_gratuita(request.user)
+                olvidar_estado_usuario(request)
         return self.get_response(request)
 
 
@@ -62,13 +68,10 @@ class RequireVerifiedEmailMiddleware:
                 return self.get_response(request)
             if request.user.is_superuser:
                 return self.get_response(request)
-            if SocialAccount.objects.filter(user=request.user).exists():
+            estado = estado_usuario(request)
+            if estado.tiene_cuenta_social:
                 return self.get_response(request)
-            try:
-                verified = request.user.perfil.email_verified
-            except ObjectDoesNotExist:
-                verified = False
-            if not verified:
+            if not estado.email_verificado:
                 auth_logout(request)
                 messages.info(
                     request,
@@ -77,3 +80,37 @@ class RequireVerifiedEmailMiddleware:
                 )
                 return redirect(reverse('account_login'))
         return self.get_response(request)
+
+
+class ContarConsultasMiddleware:
+    """
+    Con ``CONTAR_CONSULTAS=True`` agrega a cada respuesta ``X-Consultas`` (cantidad de SQL
+    ejecutadas) y ``Server-Timing`` con el tiempo en la base y el total. Lo usa ``bench_http``
+    para reportar consultas por request contra un servidor levantado aparte; sin la
+    opción, Django lo saca de la cadena al arrancar y no cuesta nada.
+    Va primero, para contar también la sesión y el usuario.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CONTAR_CONSULTAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = {'consultas': 0, 'segundos': 0.0}
+
+        def contar(execute, sql, params, many, context):
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                medicion['consultas'] += 1
+                medicion['segundos'] += time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contar):
+            response = self.get_response(request)
+        total = time.perf_counter() - inicio
+        response['X-Consultas'] = str(medicion['consultas'])
+        response['Server-Timing'] = f"db;dur={medicion['segundos'] * 1000:.1f}, total;dur={total * 1000:.1f}"
+        return response
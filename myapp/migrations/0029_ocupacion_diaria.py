@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_ocupacion(apps, schema_editor):
+    from myapp.occupancy import agregar_turnos, capacidad_semanal, filas_ocupacion
+
+    Turno = apps.get_model('myapp', 'Turno')
+    HorarioLaboral = apps.get_model('myapp', 'HorarioLaboral')
+    OcupacionDiaria = apps.get_model('myapp', 'OcupacionDiaria')
+    capacidad = capacidad_semanal(HorarioLaboral.objects.filter(activo=True))
+    OcupacionDiaria.objects.bulk_create(
+        filas_ocupacion(agregar_turnos(Turno.objects.all()), capacidad, modelo=OcupacionDiaria),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0028_pidgeon_email_verification_and_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('minutos_reservados', models.PositiveIntegerField(default=0, help_text='Minutos de turnos pendientes o confirmados.')),
+                ('minutos_capacidad', models.PositiveIntegerField(default=0, help_text='Minutos de trabajo según las reglas horarias activas.')),
+                ('conteo_pendiente', models.PositiveIntegerField(default=0)),
+                ('conteo_confirmado', models.PositiveIntegerField(default=0)),
+                ('conteo_rechazado', models.PositiveIntegerField(default=0)),
+                ('conteo_cancelado', models.PositiveIntegerField(default=0)),
+                ('conteo_completado', models.PositiveIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('profesional', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ocupacion_diaria', to='myapp.profesional')),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacion_diaria', to='myapp.servicio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['servicio', 'fecha'], name='myapp_ocupa_servici_287e15_idx')],
+                'unique_together': {('servicio', 'profesional', 'fecha')},
+            },
+        ),
+        migrations.RunPython(poblar_ocupacion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def poblar_metricas(apps, schema_editor):
+    from myapp.metrics import agregar_ingresos, agregar_sub_servicios, filas_ingresos, filas_sub_servicios
+
+    Turno = apps.get_model('myapp', 'Turno')
+    IngresoDiario = apps.get_model('myapp', 'IngresoDiario')
+    SubServicioDiario = apps.get_model('myapp', 'SubServicioDiario')
+    IngresoDiario.objects.bulk_create(
+        filas_ingresos(agregar_ingresos(Turno.objects.all()), modelo=IngresoDiario), batch_size=1000,
+    )
+    SubServicioDiario.objects.bulk_create(
+        filas_sub_servicios(agregar_sub_servicios(Turno.objects.all()), modelo=SubServicioDiario), batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0029_ocupacion_diaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngresoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('medio_de_pago_final', models.CharField(blank=True, default='', max_length=50)),
+                ('fecha', models.DateField()),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('turnos', models.PositiveIntegerField(default=0)),
+                ('turnos_con_ingreso', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SubServicioDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(fields=['servicio', 'estado', 'fecha'], name='myapp_turno_servici_8b20ab_idx'),
+        ),
+        migrations.AddField(
+            model_name='ingresodiario',
+            name='profesional',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ingresos_diarios', to='myapp.profesional'),
+        ),
+        migrations.AddField(
+            model_name='ingresodiario',
+            name='servicio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingresos_diarios', to='myapp.servicio'),
+        ),
+        migrations.AddField(
+            model_name='subserviciodiario',
+            name='profesional',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sub_servicios_diarios', to='myapp.profesional'),
+        ),
+        migrations.AddField(
+            model_name='subserviciodiario',
+            name='servicio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sub_servicios_diarios', to='myapp.servicio'),
+        ),
+        migrations.AddField(
+            model_name='subserviciodiario',
+            name='sub_servicio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conteos_diarios', to='myapp.subservicio'),
+        ),
+        migrations.AddIndex(
+            model_name='ingresodiario',
+            index=models.Index(fields=['servicio', 'fecha'], name='myapp_ingre_servici_edb0a6_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ingresodiario',
+            unique_together={('servicio', 'profesional', 'medio_de_pago_final', 'fecha')},
+        ),
+        migrations.AddIndex(
+            model_name='subserviciodiario',
+            index=models.Index(fields=['servicio', 'fecha'], name='myapp_subse_servici_88a553_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='subserviciodiario',
+            unique_together={('servicio', 'profesional', 'sub_servicio', 'fecha')},
+        ),
+        migrations.RunPython(poblar_metricas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:19
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalizar(texto):
+    # Copia de myapp.search.normalizar a la fecha de esta migración: si esa cambia, esta no.
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_marcas = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_marcas.lower().split())
+
+
+def poblar_busqueda(apps, schema_editor):
+    Servicio = apps.get_model('myapp', 'Servicio')
+    lote = []
+    for servicio in Servicio.objects.select_related('categoria').iterator(chunk_size=1000):
+        categoria = servicio.categoria.nombre if servicio.categoria_id else ''
+        servicio.busqueda_nombre = _normalizar(servicio.nombre)
+        servicio.busqueda_texto = _normalizar(' '.join(filter(None, (
+            servicio.nombre, servicio.descripcion, servicio.direccion, categoria,
+        ))))
+        lote.append(servicio)
+        if len(lote) >= 1000:
+            Servicio.objects.bulk_update(lote, ['busqueda_nombre', 'busqueda_texto'])
+            lote = []
+    Servicio.objects.bulk_update(lote, ['busqueda_nombre', 'busqueda_texto'])
+
+
+def crear_indice_trigramas(apps, schema_editor):
+    # En SQLite no hay pg_trgm: la búsqueda funciona igual, sin índice.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS myapp_servicio_busqueda_trgm '
+        'ON myapp_servicio USING gin (busqueda_texto gin_trgm_ops)'
+    )
+
+
+def borrar_indice_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS myapp_servicio_busqueda_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0030_metricas_diarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicio',
+            name='busqueda_nombre',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='servicio',
+            name='busqueda_texto',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(poblar_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice_trigramas, borrar_indice_trigramas),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0032_cola_de_tareas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailfailurelog',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='emailfailurelog',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emailfailurelog',
+            name='resolution',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='emailfailurelog',
+            index=models.Index(fields=['resolved', 'next_retry_at'], name='myapp_email_resolve_126abe_idx'),
+        ),
+    ]
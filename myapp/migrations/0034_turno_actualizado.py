@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0033_reintento_emails_fallidos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='turno',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0034_turno_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('titular', models.CharField(blank=True, max_length=32)),
+                ('token', models.PositiveBigIntegerField(default=0)),
+                ('vence', models.DateTimeField()),
+                ('adquirido', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
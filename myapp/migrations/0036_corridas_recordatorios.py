@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0035_candados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorridaRecordatorios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('hecha', 'Hecha'), ('omitida', 'Omitida (otra instancia tenía el candado)'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('activa', models.BooleanField(default=True)),
+                ('contadores', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-creada'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('activa', True)), fields=('activa',), name='una_corrida_recordatorios_activa')],
+            },
+        ),
+    ]
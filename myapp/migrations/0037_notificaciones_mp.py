@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0036_corridas_recordatorios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionMP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topico', models.CharField(max_length=50)),
+                ('notificacion_id', models.CharField(max_length=100)),
+                ('recurso_id', models.CharField(max_length=100)),
+                ('accion', models.CharField(blank=True, max_length=50)),
+                ('cuerpo', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesada', 'Procesada'), ('ignorada', 'Ignorada (tópico sin manejar)'), ('fallida', 'Fallida (sin más reintentos)')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('recibida', models.DateTimeField(auto_now_add=True)),
+                ('procesada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-recibida'],
+                'indexes': [models.Index(fields=['estado', 'topico', 'recurso_id'], name='myapp_notif_estado_92e441_idx')],
+                'constraints': [models.UniqueConstraint(fields=('topico', 'notificacion_id'), name='notificacion_mp_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def borrar_duplicadas(apps, schema_editor):
+    # Las carreras de recálculo pudieron dejar dos filas "sin profesional" para el mismo día:
+    # queda la más nueva (si hace falta, ``rebuild_occupancy`` corrige los números).
+    OcupacionDiaria = apps.get_model('myapp', 'OcupacionDiaria')
+    repetidas = OcupacionDiaria.objects.filter(profesional__isnull=True).values('servicio_id', 'fecha').annotate(
+        filas=Count('id'), ultima=Max('id'),
+    ).filter(filas__gt=1).order_by()
+    for grupo in repetidas:
+        OcupacionDiaria.objects.filter(
+            profesional__isnull=True, servicio_id=grupo['servicio_id'], fecha=grupo['fecha'],
+        ).exclude(pk=grupo['ultima']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0037_notificaciones_mp'),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ocupaciondiaria',
+            constraint=models.UniqueConstraint(condition=models.Q(('profesional__isnull', True)), fields=('servicio', 'fecha'), name='ocupacion_sin_profesional_unica'),
+        ),
+    ]
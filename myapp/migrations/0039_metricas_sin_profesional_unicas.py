@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def _borrar_duplicadas(modelo, campos):
+    repetidas = modelo.objects.filter(profesional__isnull=True).values(*campos).annotate(
+        filas=Count('id'), ultima=Max('id'),
+    ).filter(filas__gt=1).order_by()
+    for grupo in repetidas:
+        modelo.objects.filter(profesional__isnull=True, **{campo: grupo[campo] for campo in campos}).exclude(
+            pk=grupo['ultima'],
+        ).delete()
+
+
+def borrar_duplicadas(apps, schema_editor):
+    # Como en 0038: queda la fila más nueva; ``check_metrics --reparar`` corrige los números.
+    _borrar_duplicadas(apps.get_model('myapp', 'IngresoDiario'), ('servicio_id', 'medio_de_pago_final', 'fecha'))
+    _borrar_duplicadas(apps.get_model('myapp', 'SubServicioDiario'), ('servicio_id', 'sub_servicio_id', 'fecha'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0038_ocupacion_sin_profesional_unica'),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingresodiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('profesional__isnull', True)), fields=('servicio', 'medio_de_pago_final', 'fecha'), name='ingreso_sin_profesional_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='subserviciodiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('profesional__isnull', True)), fields=('servicio', 'sub_servicio', 'fecha'), name='sub_servicio_sin_profesional_unico'),
+        ),
+    ]
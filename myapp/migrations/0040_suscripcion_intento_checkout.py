@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0039_metricas_sin_profesional_unicas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='suscripcion',
+            name='intento_checkout',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -10,6 +10,8 @@ from django.core.exceptions import ValidationError
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
+from .search import actualizar_campos_busqueda
+
 def validar_tamaño_maximo_img(value):
     limite = 2 * 1024 * 1024
     if value.size > limite:
@@ -103,11 +105,23 @@ class Servicio(models.Model):
     footer_instagram_url = models.CharField(max_length=100, blank=True, null=True, help_text="Solo tu nombre de usuario (sin @)")
     footer_facebook_url = models.CharField(max_length=100, blank=True, null=True, help_text="Solo el nombre de tu página (ej: cocacola)")
     footer_tiktok_url = models.CharField(max_length=100, blank=True, null=True, help_text="Solo tu nombre de usuario (con @)")    
+    # Texto normalizado (sin tildes, en minúsculas) que usa la búsqueda del index; ver search.py.
+    busqueda_nombre = models.CharField(max_length=100, blank=True, default='', editable=False)
+    busqueda_texto = models.TextField(blank=True, default='', editable=False)
+
+    CAMPOS_BUSQUEDA = ('nombre', 'descripcion', 'direccion', 'categoria', 'categoria_id')
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.nombre)
         else:
             self.slug = slugify(self.slug)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            actualizar_campos_busqueda(self)
+        elif set(update_fields) & set(self.CAMPOS_BUSQUEDA):
+            actualizar_campos_busqueda(self)
+            kwargs['update_fields'] = {*update_fields, 'busqueda_nombre', 'busqueda_texto'}
         super().save(*args, **kwargs)
         
     def __str__(self):
@@ -115,26 +129,16 @@ class Servicio(models.Model):
     
     @property
     def tiene_apariencia_premium_activa(self):
-        try:
-            suscripcion = self.propietario.suscripcion
-            return suscripcion.is_active and suscripcion.plan.allow_customization
-        except Suscripcion.DoesNotExist:
-            return False
-        except AttributeError:
-            return False
+        from .entitlements import capacidades
+        return capacidades(self.propietario_id).personalizacion
         
     @property
     def permite_multiples_profesionales(self):
         """
         Devuelve True si el plan del propietario es 'Prime' y está activo.
         """
-        try:
-            suscripcion = self.propietario.suscripcion
-            # Comprueba si la suscripción está activa Y si el slug del plan es 'prime'
-            return suscripcion.is_active and suscripcion.plan.slug == 'prime'
-        except (Suscripcion.DoesNotExist, AttributeError):
-            # Si no tiene suscripción o algo falla, no tiene acceso.
-            return False
+        from .entitlements import capacidades
+        return capacidades(self.propietario_id).multiples_profesionales
 
 @receiver(models.signals.post_delete, sender=Servicio)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
@@ -252,9 +256,11 @@ class DiaNoDisponible(models.Model):
     motivo = models.CharField(max_length=255, blank=True, help_text="Ej: Vacaciones, Feriado")
 
     def __str__(self):
+        # El bloqueo es por profesional (ya no hay FK a Servicio); el admin trae ambos con select_related.
+        servicio = self.profesional.servicio.nombre
         if self.fecha_fin and self.fecha_fin != self.fecha_inicio:
-            return f"Bloqueo en {self.servicio.nombre} del {self.fecha_inicio.strftime('%d/%m/%Y')} al {self.fecha_fin.strftime('%d/%m/%Y')}"
-        return f"Día completo no disponible en {self.servicio.nombre}: {self.fecha_inicio}"
+            return f"Bloqueo de {self.profesional.nombre} en {servicio} del {self.fecha_inicio.strftime('%d/%m/%Y')} al {self.fecha_fin.strftime('%d/%m/%Y')}"
+        return f"Día completo no disponible para {self.profesional.nombre} en {servicio}: {self.fecha_inicio}"
 
     def clean(self):
         if self.fecha_fin and self.fecha_fin < self.fecha_inicio:
@@ -309,9 +315,12 @@ class Turno(models.Model):
         help_text="True si ya se enviaron los recordatorios ~15 min antes del turno.",
     )
     sub_servicios_solicitados = models.ManyToManyField(SubServicio, blank=True)
+    # Lo lee el scheduler de recordatorios para enterarse de altas y cambios sin escanear la tabla.
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('profesional', 'fecha', 'hora')
+        indexes = [models.Index(fields=['servicio', 'estado', 'fecha'])]
 
     def __str__(self):
         return f"Turno para {self.cliente.username} en {self.servicio.nombre} el {self.fecha} a las {self.hora}"
@@ -323,6 +332,114 @@ class Turno(models.Model):
         naive = dt.combine(self.fecha, self.hora)
         return timezone.make_aware(naive, tz)
 
+class OcupacionDiaria(models.Model):
+    """
+    Resumen por profesional y día de los turnos de un servicio. Lo mantiene
+    myapp/occupancy.py desde las señales de Turno y HorarioLaboral; si se desincroniza,
+    `python manage.py rebuild_occupancy` lo rearma desde cero.
+    """
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='ocupacion_diaria')
+    # Null para los turnos sin profesional asignado (p. ej. si se borró el profesional).
+    profesional = models.ForeignKey(
+        Profesional,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='ocupacion_diaria'
+    )
+    fecha = models.DateField()
+    minutos_reservados = models.PositiveIntegerField(default=0, help_text="Minutos de turnos pendientes o confirmados.")
+    minutos_capacidad = models.PositiveIntegerField(default=0, help_text="Minutos de trabajo según las reglas horarias activas.")
+    conteo_pendiente = models.PositiveIntegerField(default=0)
+    conteo_confirmado = models.PositiveIntegerField(default=0)
+    conteo_rechazado = models.PositiveIntegerField(default=0)
+    conteo_cancelado = models.PositiveIntegerField(default=0)
+    conteo_completado = models.PositiveIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('servicio', 'profesional', 'fecha')
+        indexes = [models.Index(fields=['servicio', 'fecha'])]
+        constraints = [
+            # El unique_together no cubre profesional NULL (NULL no es igual a NULL).
+            models.UniqueConstraint(
+                fields=['servicio', 'fecha'],
+                condition=models.Q(profesional__isnull=True),
+                name='ocupacion_sin_profesional_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Ocupación {self.servicio_id}/{self.profesional_id} {self.fecha}: {self.minutos_reservados}/{self.minutos_capacidad} min"
+
+    @property
+    def conteo_activos(self):
+        return self.conteo_pendiente + self.conteo_confirmado
+
+class IngresoDiario(models.Model):
+    """
+    Turnos completados e ingresos por día, profesional y medio de pago final. Lo
+    mantiene myapp/metrics.py; `backfill_metrics` lo rearma y `check_metrics` lo
+    compara contra Turno.
+    """
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='ingresos_diarios')
+    profesional = models.ForeignKey(
+        Profesional,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='ingresos_diarios'
+    )
+    medio_de_pago_final = models.CharField(max_length=50, blank=True, default='')
+    fecha = models.DateField()
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    turnos = models.PositiveIntegerField(default=0)
+    # Los completados sin ingreso cargado cuentan como turno pero no para el promedio.
+    turnos_con_ingreso = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('servicio', 'profesional', 'medio_de_pago_final', 'fecha')
+        indexes = [models.Index(fields=['servicio', 'fecha'])]
+        constraints = [
+            # Igual que en OcupacionDiaria: el unique_together no cubre profesional NULL.
+            models.UniqueConstraint(
+                fields=['servicio', 'medio_de_pago_final', 'fecha'],
+                condition=models.Q(profesional__isnull=True),
+                name='ingreso_sin_profesional_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Ingresos {self.servicio_id}/{self.profesional_id} {self.fecha}: ${self.ingresos} ({self.turnos} turnos)"
+
+class SubServicioDiario(models.Model):
+    """Cuántos turnos completados incluyeron cada sub-servicio, por día y profesional."""
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='sub_servicios_diarios')
+    profesional = models.ForeignKey(
+        Profesional,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='sub_servicios_diarios'
+    )
+    sub_servicio = models.ForeignKey(SubServicio, on_delete=models.CASCADE, related_name='conteos_diarios')
+    fecha = models.DateField()
+    cantidad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('servicio', 'profesional', 'sub_servicio', 'fecha')
+        indexes = [models.Index(fields=['servicio', 'fecha'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['servicio', 'sub_servicio', 'fecha'],
+                condition=models.Q(profesional__isnull=True),
+                name='sub_servicio_sin_profesional_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.sub_servicio_id} x{self.cantidad} el {self.fecha}"
+
 class Reseña(models.Model):
     servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='reseñas')
     turno = models.OneToOneField(Turno, on_delete=models.CASCADE, related_name='reseña')
@@ -360,6 +477,8 @@ class Suscripcion(models.Model):
     is_active = models.BooleanField(default=False)
     mp_subscription_id = models.CharField(max_length=100, blank=True, null=True)
     fecha_fin = models.DateTimeField(null=True, blank=True)
+    # Intentos de checkout con respuesta definitiva de MP: entra en la clave de idempotencia del alta.
+    intento_checkout = models.PositiveIntegerField(default=0)
     
     ha_visto_animacion_premium = models.BooleanField(default=False)
 
@@ -412,13 +531,145 @@ class EmailFailureLog(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     retry_count = models.IntegerField(default=0)
     resolved = models.BooleanField(default=False)
+    idempotency_key = models.CharField(max_length=200, blank=True)
+    # Cuándo lo puede volver a tomar `retry_failed_emails` (backoff según retry_count).
+    next_retry_at = models.DateTimeField(null=True, blank=True)
+    resolution = models.CharField(max_length=20, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['resolved', 'next_retry_at'])]
 
     def __str__(self):
         return f"{self.event_type} → {self.recipient} ({self.created_at:%Y-%m-%d})"
 
+class Tarea(models.Model):
+    """Trabajo diferido (outbox): lo encola la request y lo ejecuta ``manage.py process_tasks``."""
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    HECHA = 'hecha'
+    FALLIDA = 'fallida'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (HECHA, 'Hecha'),
+        (FALLIDA, 'Fallida (sin más reintentos)'),
+    ]
+
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=6)
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    # Quién la tomó y hasta cuándo: si el worker muere, vence y otro la vuelve a tomar.
+    tomada_por = models.CharField(max_length=32, blank=True)
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creada']
+        indexes = [models.Index(fields=['estado', 'disponible_desde'])]
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.get_estado_display()})"
+
+
+class Candado(models.Model):
+    """Lease de un trabajo que debe correr en una sola instancia a la vez (ver myapp/locks.py)."""
+    nombre = models.CharField(max_length=100, unique=True)
+    titular = models.CharField(max_length=32, blank=True)
+    # Fencing token: sube en cada adquisición; un titular viejo ya no coincide y no puede seguir.
+    token = models.PositiveBigIntegerField(default=0)
+    vence = models.DateTimeField()
+    adquirido = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.nombre} (token {self.token})"
+
+
+class CorridaRecordatorios(models.Model):
+    """Corrida de ``send_reminders`` pedida por ``cron_send_reminders_http``; la ejecuta ``process_tasks``."""
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    HECHA = 'hecha'
+    OMITIDA = 'omitida'
+    FALLIDA = 'fallida'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (HECHA, 'Hecha'),
+        (OMITIDA, 'Omitida (otra instancia tenía el candado)'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default=PENDIENTE)
+    # True mientras no terminó; la restricción deja una sola activa, así los disparos que se
+    # pisan devuelven la misma corrida.
+    activa = models.BooleanField(default=True)
+    contadores = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    iniciada = models.DateTimeField(null=True, blank=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creada']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['activa'], condition=models.Q(activa=True), name='una_corrida_recordatorios_activa',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Corrida de recordatorios #{self.pk} ({self.get_estado_display()})"
+
+    @property
+    def duracion(self):
+        """Segundos desde que arrancó (hasta que terminó, si ya terminó)."""
+        if self.iniciada is None:
+            return None
+        return round(((self.terminada or timezone.now()) - self.iniciada).total_seconds(), 2)
+
+
+class NotificacionMP(models.Model):
+    """Notificación cruda del webhook de MercadoPago; la procesa la cola (ver myapp/mp_notifications.py)."""
+    PENDIENTE = 'pendiente'
+    PROCESADA = 'procesada'
+    IGNORADA = 'ignorada'
+    FALLIDA = 'fallida'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (PROCESADA, 'Procesada'),
+        (IGNORADA, 'Ignorada (tópico sin manejar)'),
+        (FALLIDA, 'Fallida (sin más reintentos)'),
+    ]
+
+    topico = models.CharField(max_length=50)
+    # Id de la notificación que manda MP (igual en sus reenvíos); si no viene, hash del cuerpo.
+    notificacion_id = models.CharField(max_length=100)
+    recurso_id = models.CharField(max_length=100)
+    accion = models.CharField(max_length=50, blank=True)
+    cuerpo = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    recibida = models.DateTimeField(auto_now_add=True)
+    procesada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-recibida']
+        constraints = [
+            models.UniqueConstraint(fields=['topico', 'notificacion_id'], name='notificacion_mp_unica'),
+        ]
+        indexes = [models.Index(fields=['estado', 'topico', 'recurso_id'])]
+
+    def __str__(self):
+        return f"{self.topico} {self.recurso_id} ({self.get_estado_display()})"
+
+
 @receiver(post_save, sender=User)
 def crear_o_actualizar_perfil_usuario(sender, instance, created, **kwargs):
     PerfilUsuario.objects.get_or_create(usuario=instance)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Cliente HTTP de la API de MercadoPago compartido por todo el proceso.
+
+``crear_suscripcion_mp``, ``cancelar_suscripcion`` y el webhook armaban un
+``mercadopago.SDK(...)`` por request: el SDK abre una ``requests.Session`` nueva en cada llamada
+(TCP+TLS en frío) y no pone timeout, así que un MP lento colgaba el worker de Gunicorn. Ahora:
+
+- Hay una sola ``requests.Session`` por proceso con pool keep-alive (``MERCADOPAGO_POOL_MAXSIZE``),
+  que se rearma después de un fork (``ClienteHTTP``, myapp/http_client.py, igual que Pidgeon).
+- Timeouts explícitos: ``MERCADOPAGO_CONNECT_TIMEOUT`` para conectar y ``MERCADOPAGO_TIMEOUT``
+  para la respuesta.
+- Se reintenta hasta ``MERCADOPAGO_RETRIES`` veces, con backoff corto, ante errores de red,
+  429 y 5xx. No respeta ``Retry-After``: esto corre dentro de requests de usuarios. Intentos y
+  esperas comparten ``MERCADOPAGO_TOTAL_TIMEOUT``, por debajo del timeout de Gunicorn: cada
+  intento se acota a lo que queda y no se reintenta si no alcanza.
+- Los POST llevan ``X-Idempotency-Key`` (la misma en cada reintento), así MP no crea dos
+  preaprobaciones si el pedido original sí había llegado. La del alta sale de
+  ``clave_preapproval`` (suscripción, plan e intento de checkout).
+- Cada llamada queda medida (duración, status, reintentos, si abrió conexión nueva);
+  ``resumen()`` da los totales del proceso y el log en DEBUG muestra cada una.
+
+Las funciones devuelven lo mismo que el SDK (``{'status': ..., 'response': ...}``) y lanzan
+``ErrorMP`` si MP no respondió. Con ``MERCADOPAGO_API_URL`` apuntando al MP falso
+(``myapp/fake_mercadopago.py``, ``manage.py fake_mercadopago``) los flujos de pago se pueden
+probar y cargar sin la API real.
+"""
+import logging
+import time
+import uuid
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+
+from .http_client import ClienteHTTP
+
+logger = logging.getLogger(__name__)
+
+_BACKOFF = 0.25
+_REINTENTAR_STATUS = (429, 500, 502, 503, 504)
+# No se reintenta si después del backoff quedaría menos que esto del presupuesto total.
+_INTENTO_MINIMO = 0.5
+
+_cliente = ClienteHTTP(lambda: settings.MERCADOPAGO_POOL_MAXSIZE, contadores=('reintentos',))
+sesion = _cliente.sesion
+cerrar = _cliente.cerrar
+reiniciar_metricas = _cliente.reiniciar_metricas
+resumen = _cliente.resumen
+
+
+class ErrorMP(Exception):
+    """MP no respondió (red o timeout, ya reintentado) o respondió con un error inesperado."""
+
+
+def _espera_para_reintentar(reintentos, limite):
+    """Segundos de backoff antes del próximo intento, o None si no corresponde otro."""
+    if reintentos >= settings.MERCADOPAGO_RETRIES:
+        return None
+    espera = _BACKOFF * 2 ** reintentos
+    if limite - time.monotonic() - espera < _INTENTO_MINIMO:
+        return None
+    return espera
+
+
+def request(metodo, ruta, datos=None, idempotency_key=None):
+    """
+    Llama a ``MERCADOPAGO_API_URL + ruta`` con la sesión del proceso. Devuelve
+    ``{'status': ..., 'response': ...}`` como el SDK; lanza ``ErrorMP`` si no hubo respuesta.
+    Intentos y esperas entran en ``MERCADOPAGO_TOTAL_TIMEOUT``.
+    """
+    url = f'{settings.MERCADOPAGO_API_URL}{ruta}'
+    cabeceras = {'Authorization': f'Bearer {settings.MERCADOPAGO_ACCESS_TOKEN}'}
+    if metodo == 'POST':
+        cabeceras['X-Idempotency-Key'] = idempotency_key or uuid.uuid4().hex
+    limite = time.monotonic() + settings.MERCADOPAGO_TOTAL_TIMEOUT
+    medicion = _cliente.medir(url)
+    status = None
+    reintentos = 0
+    try:
+        while True:
+            restante = max(limite - time.monotonic(), 0.01)
+            try:
+                respuesta = sesion().request(
+                    metodo, url, json=datos, headers=cabeceras,
+                    timeout=(
+                        min(settings.MERCADOPAGO_CONNECT_TIMEOUT, restante),
+                        min(settings.MERCADOPAGO_TIMEOUT, restante),
+                    ),
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+                espera = _espera_para_reintentar(reintentos, limite)
+                if espera is None:
+                    raise ErrorMP(f'{metodo} {ruta}: {exc}') from exc
+            except requests.exceptions.RequestException as exc:
+                raise ErrorMP(f'{metodo} {ruta}: {exc}') from exc
+            else:
+                status = respuesta.status_code
+                espera = _espera_para_reintentar(reintentos, limite) if status in _REINTENTAR_STATUS else None
+                if espera is None:
+                    break
+            time.sleep(espera)
+            reintentos += 1
+    finally:
+        segundos, conexion_nueva = _cliente.registrar(
+            medicion, status is None or status >= 500, reintentos=reintentos,
+        )
+        logger.debug(
+            'MP %s %s status=%s %.1f ms reintentos=%s conexión=%s',
+            metodo, ruta, status, segundos * 1000, reintentos, 'nueva' if conexion_nueva else 'reusada',
+        )
+    try:
+        cuerpo = respuesta.json() if respuesta.content else None
+    except ValueError:
+        cuerpo = None
+    return {'status': status, 'response': cuerpo}
+
+
+def clave_preapproval(suscripcion_id, plan_slug, intento):
+    """
+    ``X-Idempotency-Key`` del alta: la misma para un doble submit o un reintento del mismo
+    intento de checkout (MP devuelve la preaprobación ya creada), otra para el siguiente.
+    """
+    return f'preapproval-{suscripcion_id}-{plan_slug}-{intento}'
+
+
+def crear_preapproval(datos, idempotency_key=None):
+    return request('POST', '/preapproval', datos, idempotency_key=idempotency_key)
+
+
+def obtener_preapproval(preapproval_id):
+    return request('GET', f"/preapproval/{quote(str(preapproval_id), safe='')}")
+
+
+def actualizar_preapproval(preapproval_id, datos):
+    return request('PUT', f"/preapproval/{quote(str(preapproval_id), safe='')}", datos)
+
+
+def obtener_pago(pago_id):
+    return request('GET', f"/v1/payments/{quote(str(pago_id), safe='')}")
@@ -0,0 +1,176 @@
+"""
+Notificaciones (webhook) de MercadoPago, procesadas fuera de la request.
+
+``webhook_mp`` consultaba a MP (``sdk.preapproval().get()``) antes de responder: con MP lento el
+worker de Gunicorn quedaba colgado, la notificación vencía del lado de MP y la reenviaba,
+sumando más carga. Ahora:
+
+- ``registrar`` guarda la notificación cruda en ``NotificacionMP`` con un INSERT que ignora
+  duplicados (única por tópico + id de notificación: los reenvíos de MP no suman filas) y, si no
+  hay una ya pendiente, encola ``mercadopago.notificaciones`` con
+  ``MERCADOPAGO_WEBHOOK_DEMORA_SECONDS`` de demora. El webhook responde 200 enseguida.
+- ``procesar_pendientes`` agrupa las pendientes por recurso (la misma suscripción notificada
+  varias veces) y consulta a MP una sola vez por grupo. MP devuelve el estado actual, así que el
+  orden en que llegaron los avisos no importa.
+- ``aplicar_preapproval`` sólo guarda si algo cambia y descarta las bajas de una preaprobación
+  que ya no es la de la suscripción (la vieja, cancelada después de volver a suscribirse).
+- Las consultas van por el cliente compartido de ``myapp/mp_gateway.py`` (pool, timeouts y
+  reintentos cortos). Si MP igual falla, el grupo queda pendiente y la tarea se reintenta con
+  el backoff de la cola; tras ``TAREAS_MAX_INTENTOS`` consultas fallidas la notificación queda
+  ``fallida`` para el admin.
+
+El ``save()`` de la suscripción corre en el proceso de ``process_tasks``: la versión de estado
+de cuenta que sube (user_state) la tienen que ver los workers de Gunicorn, por eso la caché
+tiene que ser compartida (check ``myapp.E001``, ver myapp/checks.py).
+"""
+import hashlib
+import json
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import mp_gateway
+from .locks import CandadoOcupado, candado
+from .models import NotificacionMP, Plan, Suscripcion, Tarea
+from .mp_gateway import ErrorMP
+from .tasks import encolar, tarea
+
+logger = logging.getLogger(__name__)
+
+TAREA = 'mercadopago.notificaciones'
+
+
+def registrar(cuerpo, parametros=None):
+    """
+    Guarda la notificación (``cuerpo`` JSON ya decodificado; ``parametros`` el query string, que
+    usan las notificaciones IPN) y agenda su procesamiento. Devuelve False si no identifica
+    tópico y recurso.
+    """
+    parametros = parametros or {}
+    datos = cuerpo.get('data') if isinstance(cuerpo.get('data'), dict) else {}
+    topico = str(cuerpo.get('type') or cuerpo.get('topic') or parametros.get('type') or parametros.get('topic') or '')
+    recurso_id = str(datos.get('id') or parametros.get('data.id') or parametros.get('id') or '')
+    if not topico or not recurso_id:
+        return False
+    notificacion_id = str(cuerpo.get('id') or '') or hashlib.sha1(
+        json.dumps([cuerpo, parametros], sort_keys=True, default=str).encode(),
+    ).hexdigest()
+    NotificacionMP.objects.bulk_create([
+        NotificacionMP(
+            topico=topico[:50],
+            notificacion_id=notificacion_id[:100],
+            recurso_id=recurso_id[:100],
+            accion=str(cuerpo.get('action') or '')[:50],
+            cuerpo=cuerpo,
+        ),
+    ], ignore_conflicts=True)
+    if not Tarea.objects.filter(nombre=TAREA, estado=Tarea.PENDIENTE).exists():
+        encolar(TAREA, demora=timedelta(seconds=settings.MERCADOPAGO_WEBHOOK_DEMORA_SECONDS))
+    return True
+
+
+def _consultar(consulta, recurso_id):
+    """Devuelve el JSON del recurso, None si MP no lo conoce, o lanza ``ErrorMP``."""
+    resultado = consulta(recurso_id)
+    if resultado['status'] == 404:
+        return None
+    if resultado['status'] != 200:
+        raise ErrorMP(f"{recurso_id}: HTTP {resultado['status']}")
+    return resultado['response']
+
+
+def aplicar_preapproval(preapproval_id, datos):
+    """Lleva la Suscripcion del ``external_reference`` al estado que informa MP. Devuelve si cambió."""
+    referencia = str(datos.get('external_reference') or '')
+    suscripcion = Suscripcion.objects.filter(pk=referencia).first() if referencia.isdigit() else None
+    if suscripcion is None:
+        logger.warning('MP: suscripción no encontrada para preapproval %s (ref %r)', preapproval_id, referencia)
+        return False
+
+    estado = datos.get('status')
+    if estado == 'authorized':
+        if suscripcion.is_active and suscripcion.mp_subscription_id == preapproval_id:
+            return False
+        suscripcion.is_active = True
+        suscripcion.mp_subscription_id = preapproval_id
+    elif estado in ('cancelled', 'paused'):
+        if suscripcion.mp_subscription_id and suscripcion.mp_subscription_id != preapproval_id:
+            logger.info('MP: %s de la preapproval %s ya reemplazada; se ignora', estado, preapproval_id)
+            return False
+        plan_gratuito = Plan.objects.filter(slug='free').first()
+        if plan_gratuito is None:
+            logger.warning("El Plan 'free' no existe al cancelar suscripción por webhook.")
+            if not suscripcion.is_active:
+                return False
+        elif suscripcion.plan_id == plan_gratuito.id:
+            return False
+        else:
+            suscripcion.plan = plan_gratuito
+        suscripcion.is_active = False
+    else:
+        return False
+    suscripcion.save()
+    return True
+
+
+# Tópico -> (consulta a MP, función que aplica la respuesta). Los demás (p. ej. ``payment``)
+# no tienen efecto todavía: se marcan ignorados sin consultar a MP.
+MANEJADORES = {
+    'subscription_preapproval': (mp_gateway.obtener_preapproval, aplicar_preapproval),
+}
+
+
+def procesar_pendientes(lease=None):
+    """
+    Procesa las pendientes con una consulta a MP por recurso. Con ``lease`` lo renueva antes de
+    cada consulta. Devuelve contadores (``fallidas``: notificaciones que quedan para reintentar).
+    """
+    grupos = defaultdict(list)
+    pendientes = NotificacionMP.objects.filter(estado=NotificacionMP.PENDIENTE).order_by('id')
+    for fila_id, topico, recurso_id in pendientes.values_list('id', 'topico', 'recurso_id'):
+        grupos[(topico, recurso_id)].append(fila_id)
+    contadores = Counter(notificaciones=sum(len(ids) for ids in grupos.values()))
+    for (topico, recurso_id), ids in grupos.items():
+        filas = NotificacionMP.objects.filter(pk__in=ids)
+        if topico not in MANEJADORES:
+            filas.update(estado=NotificacionMP.IGNORADA, procesada=timezone.now())
+            contadores['ignoradas'] += len(ids)
+            continue
+        if lease is not None:
+            lease.renovar()
+        consulta, aplicar = MANEJADORES[topico]
+        contadores['consultas'] += 1
+        try:
+            datos = _consultar(consulta, recurso_id)
+        except ErrorMP as exc:
+            logger.warning('MP: no se pudo consultar %s %s: %s', topico, recurso_id, exc)
+            filas.update(intentos=F('intentos') + 1, ultimo_error=str(exc)[:4000])
+            filas.filter(intentos__gte=settings.TAREAS_MAX_INTENTOS).update(
+                estado=NotificacionMP.FALLIDA, procesada=timezone.now(),
+            )
+            contadores['fallidas'] += len(ids)
+            continue
+        if datos is not None and aplicar(recurso_id, datos):
+            contadores['actualizadas'] += 1
+        filas.update(estado=NotificacionMP.PROCESADA, procesada=timezone.now(), ultimo_error='')
+        contadores['procesadas'] += len(ids)
+    return contadores
+
+
+@tarea(TAREA)
+def procesar_en_cola():
+    try:
+        with candado('notificaciones_mp') as lease:
+            contadores = procesar_pendientes(lease=lease)
+    except CandadoOcupado:
+        # Otro worker está procesando: lo que llegó después de su consulta se levanta más tarde.
+        encolar(TAREA, demora=timedelta(seconds=settings.MERCADOPAGO_WEBHOOK_DEMORA_SECONDS))
+        return
+    logger.info('Notificaciones de MP: %s', dict(contadores))
+    if contadores['fallidas']:
+        # La cola reintenta con backoff; las que ya agotaron intentos quedaron fallidas.
+        raise ErrorMP(f"{contadores['fallidas']} notificaciones sin procesar")
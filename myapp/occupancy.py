@@ -0,0 +1,213 @@
+"""
+Ocupación por día de un servicio (minutos reservados vs. minutos de trabajo).
+
+La capacidad de un profesional en un día es la cantidad de minutos cubiertos por sus
+reglas de HorarioLaboral activas para ese día de la semana (sin el descanso), con la
+misma representación en bitmap que usa ``availability``. Como sólo depende del día de
+la semana, se calcula una vez por profesional y se reparte sobre el mes.
+
+Los números por (servicio, profesional, fecha) viven materializados en OcupacionDiaria.
+``signals.py`` recalcula sólo las filas que toca cada alta/cambio de Turno y la capacidad
+del profesional cuando cambian sus reglas; ``rebuild_occupancy`` rearma todo.
+"""
+import calendar
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .availability import DIAS_SEMANA, ESTADOS_QUE_OCUPAN, MapaDia, periodos_de_trabajo
+from .models import HorarioLaboral, OcupacionDiaria, Profesional, Servicio, Turno
+
+UMBRAL_LLENO = 90
+UMBRAL_CASI_LLENO = 50
+
+
+def capacidad_semanal(reglas):
+    """
+    ``{profesional_id: [minutos lunes, ..., minutos domingo]}`` a partir de reglas activas.
+    Si un profesional tiene reglas superpuestas, los minutos se cuentan una sola vez.
+    """
+    periodos = {}
+    for regla in reglas:
+        dias = periodos.setdefault(regla.profesional_id, [[] for _ in DIAS_SEMANA])
+        for num_dia, nombre_dia in enumerate(DIAS_SEMANA):
+            if getattr(regla, nombre_dia):
+                dias[num_dia].extend(periodos_de_trabajo(regla))
+    return {
+        profesional_id: [MapaDia(periodos_dia).libres.bit_count() for periodos_dia in dias]
+        for profesional_id, dias in periodos.items()
+    }
+
+
+def agregar_turnos(turnos):
+    """
+    Agrega un queryset de Turno por (servicio, profesional, fecha) en una consulta:
+    minutos reservados (sólo estados que ocupan agenda) y un conteo por estado.
+    """
+    conteos = {
+        f'conteo_{estado}': Count('id', filter=Q(estado=estado)) for estado, _ in Turno.ESTADO_CHOICES
+    }
+    return turnos.values('servicio_id', 'profesional_id', 'fecha').annotate(
+        minutos_reservados=Sum('duracion_total', filter=Q(estado__in=ESTADOS_QUE_OCUPAN)),
+        **conteos,
+    ).order_by()
+
+
+def filas_ocupacion(agregados, capacidad, modelo=OcupacionDiaria):
+    """Instancias sin guardar de ``modelo`` a partir de ``agregar_turnos`` y ``capacidad_semanal``."""
+    filas = []
+    for fila in agregados:
+        fila = dict(fila)
+        fila['minutos_reservados'] = fila['minutos_reservados'] or 0
+        semana = capacidad.get(fila['profesional_id'])
+        fila['minutos_capacidad'] = semana[fila['fecha'].weekday()] if semana else 0
+        filas.append(modelo(**fila))
+    return filas
+
+
+def bloquear_recalculo(servicio_id, profesional_id):
+    """
+    Serializa los recálculos de rollups de un mismo profesional (o de "sin profesional" del
+    servicio); va dentro de la transacción del recálculo. ``reservar_turno`` ya tiene tomada la
+    fila del Profesional, así que ahí no espera. Sin esto dos recálculos cruzados podían leer
+    antes de que el otro borrara y chocar en el INSERT, o pisar números nuevos con viejos.
+    También lo usa myapp/metrics.py.
+    """
+    if profesional_id:
+        Profesional.objects.select_for_update().filter(pk=profesional_id).exists()
+    else:
+        Servicio.objects.select_for_update().filter(pk=servicio_id).exists()
+
+
+def _rearmar(servicio_id, profesional_id, fechas):
+    capacidad = {}
+    if profesional_id:
+        capacidad = capacidad_semanal(HorarioLaboral.objects.filter(profesional_id=profesional_id, activo=True))
+    agregados = agregar_turnos(
+        Turno.objects.filter(servicio_id=servicio_id, profesional_id=profesional_id, fecha__in=fechas)
+    )
+    OcupacionDiaria.objects.filter(
+        servicio_id=servicio_id, profesional_id=profesional_id, fecha__in=fechas,
+    ).delete()
+    OcupacionDiaria.objects.bulk_create(filas_ocupacion(agregados, capacidad))
+
+
+def recalcular_ocupacion(servicio_id, profesional_id, fechas):
+    """Rearma las filas de OcupacionDiaria de un profesional (o de "sin profesional") en ``fechas``."""
+    fechas = {fecha for fecha in fechas if fecha}
+    if not servicio_id or not fechas:
+        return
+    with transaction.atomic():
+        bloquear_recalculo(servicio_id, profesional_id)
+        _rearmar(servicio_id, profesional_id, fechas)
+
+
+def recalcular_sin_profesional(servicio_id):
+    """Rearma las filas de turnos sin profesional de un servicio (quedan así al borrar uno)."""
+    with transaction.atomic():
+        bloquear_recalculo(servicio_id, None)
+        fechas = set(
+            Turno.objects.filter(servicio_id=servicio_id, profesional__isnull=True).values_list('fecha', flat=True)
+        )
+        OcupacionDiaria.objects.filter(servicio_id=servicio_id, profesional__isnull=True).delete()
+        if fechas:
+            _rearmar(servicio_id, None, fechas)
+
+
+def actualizar_capacidad(profesional_id):
+    """Después de cambiar las reglas horarias: una UPDATE por día de la semana."""
+    semana = capacidad_semanal(
+        HorarioLaboral.objects.filter(profesional_id=profesional_id, activo=True)
+    ).get(profesional_id, [0] * len(DIAS_SEMANA))
+    filas = OcupacionDiaria.objects.filter(profesional_id=profesional_id)
+    with transaction.atomic():
+        for num_dia, minutos in enumerate(semana):
+            # iso_week_day: 1 = lunes ... 7 = domingo, igual que DIAS_SEMANA.
+            filas.filter(fecha__iso_week_day=num_dia + 1).exclude(
+                minutos_capacidad=minutos,
+            ).update(minutos_capacidad=minutos)
+
+
+def reconstruir_ocupacion(servicio_ids=None, batch_size=1000):
+    """Borra y rearma OcupacionDiaria (todo, o sólo ``servicio_ids``). Devuelve las filas creadas."""
+    turnos = Turno.objects.all()
+    reglas = HorarioLaboral.objects.filter(activo=True)
+    existentes = OcupacionDiaria.objects.all()
+    if servicio_ids is not None:
+        turnos = turnos.filter(servicio_id__in=servicio_ids)
+        reglas = reglas.filter(profesional__servicio_id__in=servicio_ids)
+        existentes = existentes.filter(servicio_id__in=servicio_ids)
+    filas = filas_ocupacion(agregar_turnos(turnos), capacidad_semanal(reglas))
+    with transaction.atomic():
+        existentes.delete()
+        OcupacionDiaria.objects.bulk_create(filas, batch_size=batch_size)
+    return len(filas)
+
+
+def ocupacion_del_dia(servicio, fecha):
+    """Turnos activos y minutos reservados de un día del servicio, sumando todos los profesionales."""
+    totales = OcupacionDiaria.objects.filter(servicio=servicio, fecha=fecha).aggregate(
+        pendientes=Sum('conteo_pendiente'),
+        confirmados=Sum('conteo_confirmado'),
+        minutos_reservados=Sum('minutos_reservados'),
+    )
+    return {
+        'conteo': (totales['pendientes'] or 0) + (totales['confirmados'] or 0),
+        'minutos_reservados': totales['minutos_reservados'] or 0,
+    }
+
+
+def estado_ocupacion(conteo, minutos_reservados, minutos_capacidad):
+    """Clase CSS del día en el calendario del dashboard."""
+    if not conteo:
+        return 'vacio'
+    porcentaje = (minutos_reservados / minutos_capacidad) * 100 if minutos_capacidad > 0 else 100
+    if porcentaje >= UMBRAL_LLENO:
+        return 'lleno'
+    if porcentaje >= UMBRAL_CASI_LLENO:
+        return 'casi-lleno'
+    return 'con-turnos'
+
+
+def ocupacion_mes(servicio, año, mes):
+    """
+    ``{dia: {'estado', 'conteo', 'minutos_reservados', 'minutos_capacidad'}}`` para todos
+    los días del mes. Dos consultas: las filas de OcupacionDiaria del mes agregadas por
+    fecha y las reglas horarias. La capacidad sale de las reglas y no de la tabla porque
+    ahí sólo hay filas para los profesionales que tienen algún turno ese día.
+    """
+    num_dias = calendar.monthrange(año, mes)[1]
+    desde, hasta = date(año, mes, 1), date(año, mes, num_dias)
+
+    reservas = {
+        fila['fecha']: fila
+        for fila in OcupacionDiaria.objects.filter(
+            servicio=servicio, fecha__range=(desde, hasta),
+        ).values('fecha').annotate(
+            pendientes=Sum('conteo_pendiente'),
+            confirmados=Sum('conteo_confirmado'),
+            minutos=Sum('minutos_reservados'),
+        ).order_by()
+    }
+    capacidad = capacidad_semanal(
+        HorarioLaboral.objects.filter(profesional__servicio=servicio, activo=True)
+    )
+    capacidad_por_dia_semana = [
+        sum(minutos[num_dia] for minutos in capacidad.values()) for num_dia in range(len(DIAS_SEMANA))
+    ]
+
+    dias = {}
+    for dia in range(1, num_dias + 1):
+        fecha = date(año, mes, dia)
+        fila = reservas.get(fecha, {})
+        conteo = (fila.get('pendientes') or 0) + (fila.get('confirmados') or 0)
+        minutos_reservados = fila.get('minutos') or 0
+        minutos_capacidad = capacidad_por_dia_semana[fecha.weekday()]
+        dias[dia] = {
+            'estado': estado_ocupacion(conteo, minutos_reservados, minutos_capacidad),
+            'conteo': conteo,
+            'minutos_reservados': minutos_reservados,
+            'minutos_capacidad': minutos_capacidad,
+        }
+    return dias
@@ -0,0 +1,139 @@
+"""
+Cliente HTTP de Pidgeon compartido por todo el proceso.
+
+Cada correo hacía un ``requests.post`` suelto (TCP+TLS nuevos) y antes un ``GET /health`` de
+hasta 8 s para despertar el servicio: una corrida de 200 recordatorios abría más de 400
+conexiones en frío. Ahora:
+
+- Hay una sola ``requests.Session`` por proceso con pool keep-alive (``PIDGEON_POOL_MAXSIZE``),
+  que se rearma después de un fork (``ClienteHTTP``, myapp/http_client.py).
+- El ping de salud se hace a lo sumo una vez por ``PIDGEON_HEALTH_CACHE_SECONDS``; la marca
+  vive en la caché.
+- Cada llamada queda medida (duración, status, si abrió conexión nueva); ``resumen()`` da los
+  totales del proceso y el log en DEBUG muestra cada una.
+- Circuit breaker: con Pidgeon caído cada correo se comía reintentos v2 + v1 con timeouts
+  (hasta 4 × ``PIDGEON_TIMEOUT`` de hilo bloqueado). Tras ``PIDGEON_CIRCUIT_FAILURES`` fallas
+  seguidas (error de red o 5xx) el circuito se abre por ``PIDGEON_CIRCUIT_OPEN_SECONDS`` y
+  ``request`` lanza ``CircuitoAbierto`` sin tocar la red. Vencido ese plazo pasa una sola
+  sonda (``cache.add``); si responde se cierra, si no se vuelve a abrir. El estado vive en la
+  caché.
+
+Marca de salud y circuito se comparten entre workers de Gunicorn y ``process_tasks`` sólo si la
+caché es compartida (``CACHE_URL``; en producción lo exige el check ``myapp.E001``, ver
+myapp/checks.py). Con locmem cada proceso lleva su propio circuito y sólo lo comparten sus hilos.
+"""
+import logging
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from .http_client import ClienteHTTP
+
+logger = logging.getLogger(__name__)
+
+_CLAVE_SALUD = 'pidgeon:salud'
+_CLAVE_FALLAS = 'pidgeon:circuito:fallas'
+_CLAVE_ABIERTO_HASTA = 'pidgeon:circuito:abierto_hasta'
+_CLAVE_SONDA = 'pidgeon:circuito:sonda'
+# Si el ping falla, no esperar la ventana completa para volver a intentarlo.
+_REINTENTO_SALUD_SEGUNDOS = 30
+
+_cliente = ClienteHTTP(lambda: settings.PIDGEON_POOL_MAXSIZE, pool_connections=2, contadores=('rechazadas_por_circuito',))
+sesion = _cliente.sesion
+cerrar = _cliente.cerrar
+reiniciar_metricas = _cliente.reiniciar_metricas
+resumen = _cliente.resumen
+
+
+class CircuitoAbierto(requests.exceptions.ConnectionError):
+    """Pidgeon viene fallando: no se intenta la llamada."""
+
+
+def circuito_abierto():
+    """True mientras el circuito está abierto (sin contar la ventana de sonda)."""
+    abierto_hasta = cache.get(_CLAVE_ABIERTO_HASTA)
+    return abierto_hasta is not None and time.time() < abierto_hasta
+
+
+def _circuito_permite():
+    abierto_hasta = cache.get(_CLAVE_ABIERTO_HASTA)
+    if abierto_hasta is None:
+        return True
+    if time.time() < abierto_hasta:
+        return False
+    # Semiabierto: pasa sólo el primero; si la sonda se cuelga, la marca vence y prueba otro.
+    return cache.add(_CLAVE_SONDA, True, int(settings.PIDGEON_TIMEOUT) + 5)
+
+
+def _circuito_exito():
+    if cache.get(_CLAVE_FALLAS):
+        if cache.get(_CLAVE_ABIERTO_HASTA) is not None:
+            logger.warning('Pidgeon respondió: circuito cerrado.')
+        cache.delete_many([_CLAVE_FALLAS, _CLAVE_ABIERTO_HASTA, _CLAVE_SONDA])
+
+
+def _circuito_falla():
+    cache.add(_CLAVE_FALLAS, 0, None)
+    try:
+        fallas = cache.incr(_CLAVE_FALLAS)
+    except ValueError:
+        fallas = 1
+    if fallas >= settings.PIDGEON_CIRCUIT_FAILURES:
+        cache.set(_CLAVE_ABIERTO_HASTA, time.time() + settings.PIDGEON_CIRCUIT_OPEN_SECONDS, None)
+        cache.delete(_CLAVE_SONDA)
+        logger.warning(
+            'Pidgeon: %s fallas seguidas, circuito abierto por %s s.',
+            fallas, settings.PIDGEON_CIRCUIT_OPEN_SECONDS,
+        )
+
+
+def request(metodo, url, **kwargs):
+    """
+    ``Session.request`` medido y detrás del circuit breaker. Propaga las excepciones de
+    requests igual que antes (``CircuitoAbierto`` es una de ellas).
+    """
+    if not _circuito_permite():
+        _cliente.contar('rechazadas_por_circuito')
+        raise CircuitoAbierto(f'Circuito de Pidgeon abierto; no se llama a {url}')
+    medicion = _cliente.medir(url)
+    status = None
+    try:
+        respuesta = sesion().request(metodo, url, **kwargs)
+        status = respuesta.status_code
+        return respuesta
+    finally:
+        error = status is None or status >= 500
+        segundos, conexion_nueva = _cliente.registrar(medicion, error)
+        if error:
+            _circuito_falla()
+        else:
+            _circuito_exito()
+        logger.debug(
+            'Pidgeon %s %s status=%s %.1f ms conexión=%s',
+            metodo, url, status, segundos * 1000, 'nueva' if conexion_nueva else 'reusada',
+        )
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def despertar(base, timeout):
+    """
+    ``GET /health`` para sacar de cold-start al free tier de Render, a lo sumo una vez por
+    ventana: ``cache.add`` deja pasar sólo al primero (hilo o worker) de cada intervalo.
+    """
+    if not cache.add(_CLAVE_SALUD, True, settings.PIDGEON_HEALTH_CACHE_SECONDS):
+        return
+    try:
+        get(f'{base}/health', timeout=min(8.0, float(timeout)))
+        logger.debug('Pidgeon wake GET /health completado.')
+    except requests.exceptions.RequestException as exc:
+        cache.set(_CLAVE_SALUD, False, _REINTENTO_SALUD_SEGUNDOS)
+        logger.debug('Pidgeon wake omitido/falló (%s)', exc)
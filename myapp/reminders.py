@@ -0,0 +1,399 @@
+"""
+Recordatorios de turnos: a quién avisar, cuándo, y la agenda en memoria del scheduler.
+
+``send_reminders`` (cron cada ~5 min) escanea los turnos confirmados de una ventana de
+10–22 minutos y manda con hasta 7 minutos de diferencia; si el scheduler está vivo, sólo los
+que ya se atrasaron (ver ``ventana_cron``). ``manage.py run_reminder_scheduler``
+es la alternativa residente: carga una vez los recordatorios del horizonte en una ``Agenda``
+(heap por momento, con borrado perezoso), la mantiene al día leyendo sólo los turnos cuyo
+``actualizado`` cambió desde el último sondeo y dispara cada uno en su momento exacto
+(``inicio - REMINDER_OFFSET_MINUTES``). Disparar = marcar ``recordatorio_enviado`` con un UPDATE
+condicional y encolar ``recordatorios.enviar`` en la misma transacción, así nunca se manda dos
+veces aunque convivan el cron y el scheduler.
+
+``cron_send_reminders_http`` no corre el envío dentro de la request: ``pedir_corrida`` crea una
+``CorridaRecordatorios`` (o devuelve la que sigue activa) y encola ``recordatorios.corrida``;
+``process_tasks`` la ejecuta y va guardando los contadores para el endpoint de estado.
+"""
+import heapq
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .email_service import (
+    html_reminder_client,
+    html_reminder_pro,
+    owner_receives_freelancer_emails,
+    send_email_with_fallback,
+    site_base_url,
+    template_data_reminder_client,
+    template_data_reminder_pro,
+)
+from .locks import CandadoOcupado, CandadoPerdido, candado, vigente
+from .models import CorridaRecordatorios, Turno
+from .tasks import encolar, tarea
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_AGENDA = ('id', 'fecha', 'hora', 'estado', 'recordatorio_enviado', 'actualizado')
+VENTANA_CRON = (timedelta(minutes=10), timedelta(minutes=22))
+# Lo tiene el scheduler residente que está trabajando (manage.py run_reminder_scheduler).
+CANDADO_SCHEDULER = 'reminder_scheduler'
+# Una corrida activa hace tanto ya no la está ejecutando nadie (worker caído o apagado).
+CORRIDA_COLGADA = timedelta(hours=1)
+
+
+def momento_recordatorio(turno):
+    return turno.inicio_en_timezone() - timedelta(minutes=settings.REMINDER_OFFSET_MINUTES)
+
+
+def corresponde_recordar(turno, ahora):
+    """Confirmado, sin recordatorio y todavía sin empezar."""
+    return (
+        turno.estado == 'confirmado'
+        and not turno.recordatorio_enviado
+        and turno.inicio_en_timezone() > ahora
+    )
+
+
+def enviar_recordatorio(turno):
+    """
+    Correo al cliente y, si el plan lo incluye, al propietario. ``turno`` con select_related.
+    Devuelve si salió el del cliente.
+    """
+    prof_nombre = turno.profesional.nombre if turno.profesional else turno.servicio.nombre
+    cliente_nom = turno.cliente.get_full_name() or turno.cliente.first_name or turno.cliente.email
+    dash_url = f'{site_base_url()}/dashboard/'
+
+    enviado = send_email_with_fallback(
+        turno.cliente.email,
+        f'Recordatorio: tu turno con {prof_nombre} es en 15 minutos',
+        html_reminder_client(turno, prof_nombre),
+        'reminder_client',
+        idempotency_key=f'reminder-client-{turno.id}',
+        template_id='recordatorio-cliente',
+        template_data=template_data_reminder_client(turno, prof_nombre),
+    )
+
+    propietario = turno.servicio.propietario
+    if owner_receives_freelancer_emails(propietario):
+        send_email_with_fallback(
+            propietario.email,
+            f'Recordatorio: turno en 15 minutos con {cliente_nom}',
+            html_reminder_pro(turno, cliente_nom, dash_url),
+            'reminder_pro',
+            idempotency_key=f'reminder-pro-{turno.id}',
+            template_id='recordatorio-pro',
+            template_data=template_data_reminder_pro(turno, cliente_nom, dash_url),
+        )
+    return enviado
+
+
+@tarea('recordatorios.enviar')
+def enviar_recordatorio_en_cola(turno_id):
+    turno = (
+        Turno.objects.select_related('cliente', 'servicio', 'servicio__propietario', 'profesional')
+        .filter(pk=turno_id)
+        .first()
+    )
+    if turno is None:
+        logger.warning('Recordatorio omitido: el turno %s ya no existe', turno_id)
+        return
+    enviar_recordatorio(turno)
+
+
+def ventana_cron(ahora):
+    """
+    ``(desde, hasta)`` relativos a ``ahora``. Con el scheduler vivo (tiene su candado) el cron
+    queda de respaldo: sólo levanta los atrasados, cuyo momento (inicio - offset) ya pasó, en vez
+    de adelantarse hasta 7 minutos a lo que el scheduler dispararía en hora.
+    """
+    desde, hasta = VENTANA_CRON
+    if vigente(CANDADO_SCHEDULER):
+        hasta = min(hasta, timedelta(minutes=settings.REMINDER_OFFSET_MINUTES))
+    return desde, hasta
+
+
+def candidatos_cron(ahora):
+    """Confirmados sin recordatorio que empiezan dentro de ``ventana_cron`` (cron cada ~5 min)."""
+    ahora = timezone.localtime(ahora)
+    desde, hasta = ventana_cron(ahora)
+    turnos = Turno.objects.filter(
+        estado='confirmado',
+        recordatorio_enviado=False,
+        fecha__gte=(ahora + desde).date(),
+        fecha__lte=(ahora + hasta).date(),
+    ).select_related('cliente', 'servicio', 'servicio__propietario', 'profesional')
+    return [turno for turno in turnos if desde <= turno.inicio_en_timezone() - ahora <= hasta]
+
+
+def _enviar_medido(turno):
+    inicio = time.perf_counter()
+    try:
+        enviado = enviar_recordatorio(turno)
+    except Exception:
+        logger.exception('Recordatorio del turno %s falló', turno.id)
+        enviado = False
+    return turno.id, enviado, time.perf_counter() - inicio
+
+
+def _enviar_medido_en_hilo(turno):
+    close_old_connections()
+    try:
+        return _enviar_medido(turno)
+    finally:
+        connections.close_all()
+
+
+def tomar(turno_id, lease=None):
+    """
+    Marca el recordatorio como enviado si nadie lo tomó antes (el mismo UPDATE condicional que
+    ``disparar``). Devuelve si lo tomó esta llamada. Con ``lease`` el UPDATE además exige que su
+    token siga vigente; si no lo es, lanza ``CandadoPerdido`` sin haber escrito.
+    """
+    turnos = Turno.objects.filter(pk=turno_id, estado='confirmado', recordatorio_enviado=False)
+    if lease is not None:
+        turnos = turnos.filter(lease.vigente())
+    tomado = bool(turnos.update(recordatorio_enviado=True))
+    if not tomado and lease is not None:
+        lease.verificar()
+    return tomado
+
+
+def enviar_recordatorios_pendientes(ahora=None, concurrencia=None, lote=None, al_avanzar=None, lease=None):
+    """
+    Manda los recordatorios de la ventana del cron con a lo sumo ``concurrencia`` envíos a la
+    vez, de a ``lote`` turnos. Cada turno se toma (``tomar``) antes de mandarlo: si el scheduler
+    lo disparó entre la lectura y el envío, se saltea (``omitidos``). Los que fallan quedan
+    marcados, igual que por el scheduler: ``send_email_with_fallback`` ya dejó la falla en
+    EmailFailureLog y la reintenta ``email_retry`` sólo al destinatario que falló (desmarcar
+    duplicaba el correo del cliente y reenviaba el del propietario). ``al_avanzar(contadores)``
+    se llama tras cada lote. Con ``lease`` (locks.Lease) lo renueva antes de cada lote y cada
+    toma lleva su token: si lo perdió, corta con ``CandadoPerdido`` antes de mandar el lote.
+    Devuelve los contadores de la corrida (latencias en ms).
+    """
+    concurrencia = concurrencia or settings.REMINDER_SEND_CONCURRENCY
+    lote = lote or settings.REMINDER_SEND_BATCH
+    inicio = time.perf_counter()
+    turnos = candidatos_cron(ahora or timezone.now())
+    contadores = {'candidatos': len(turnos), 'procesados': 0, 'enviados': 0, 'fallidos': 0, 'omitidos': 0}
+    latencias = []
+    ejecutor = ThreadPoolExecutor(max_workers=concurrencia) if concurrencia > 1 and len(turnos) > 1 else None
+    try:
+        for desde in range(0, len(turnos), lote):
+            if lease is not None:
+                lease.renovar()
+            candidatos = turnos[desde:desde + lote]
+            parte = []
+            try:
+                for turno in candidatos:
+                    if tomar(turno.id, lease):
+                        parte.append(turno)
+            except CandadoPerdido:
+                # Se corta sin mandar nada: los ya tomados de este lote vuelven a quedar pendientes.
+                Turno.objects.filter(pk__in=[turno.id for turno in parte]).update(recordatorio_enviado=False)
+                raise
+            if ejecutor is None:
+                resultados = [_enviar_medido(turno) for turno in parte]
+            else:
+                resultados = list(ejecutor.map(_enviar_medido_en_hilo, parte))
+            fallidos = [turno_id for turno_id, enviado, _ in resultados if not enviado]
+            latencias.extend(segundos for _, _, segundos in resultados)
+            contadores['procesados'] += len(resultados)
+            contadores['enviados'] += len(resultados) - len(fallidos)
+            contadores['fallidos'] += len(fallidos)
+            contadores['omitidos'] += len(candidatos) - len(parte)
+            if al_avanzar is not None:
+                al_avanzar(dict(contadores))
+    finally:
+        if ejecutor is not None:
+            ejecutor.shutdown()
+    segundos = time.perf_counter() - inicio
+    latencias.sort()
+    contadores.update(
+        segundos=round(segundos, 2),
+        por_segundo=round(contadores['procesados'] / segundos, 1) if segundos else 0.0,
+        p50_ms=round(latencias[len(latencias) // 2] * 1000, 1) if latencias else 0.0,
+        p95_ms=round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000, 1) if latencias else 0.0,
+    )
+    return contadores
+
+
+def pedir_corrida():
+    """
+    Devuelve ``(corrida, nueva)``. Si hay una corrida activa (disparos que se pisan) devuelve esa;
+    si no, la crea y encola ``recordatorios.corrida`` en la misma transacción.
+    """
+    ahora = timezone.now()
+    CorridaRecordatorios.objects.filter(activa=True, creada__lt=ahora - CORRIDA_COLGADA).update(
+        activa=False, estado=CorridaRecordatorios.FALLIDA, terminada=ahora,
+        error='Quedó activa sin terminar; se descartó.',
+    )
+    activa = CorridaRecordatorios.objects.filter(activa=True).first()
+    if activa is not None:
+        return activa, False
+    try:
+        with transaction.atomic():
+            corrida = CorridaRecordatorios.objects.create()
+            encolar('recordatorios.corrida', corrida_id=corrida.pk)
+    except IntegrityError:
+        # Otro disparo la creó entre la consulta y el INSERT (restricción de una sola activa).
+        return pedir_corrida()
+    return corrida, True
+
+
+def _actualizar_corrida(corrida_id, **cambios):
+    CorridaRecordatorios.objects.filter(pk=corrida_id).update(**cambios)
+
+
+@tarea('recordatorios.corrida')
+def ejecutar_corrida(corrida_id):
+    """
+    Corre ``enviar_recordatorios_pendientes`` bajo el candado de ``send_reminders`` y guarda los
+    contadores tras cada lote. No relanza errores: la próxima corrida del cron levanta lo que quedó.
+    """
+    if not CorridaRecordatorios.objects.filter(pk=corrida_id, activa=True).exists():
+        return
+    _actualizar_corrida(corrida_id, estado=CorridaRecordatorios.EN_CURSO, iniciada=timezone.now())
+    try:
+        with candado('send_reminders') as lease:
+            contadores = enviar_recordatorios_pendientes(
+                al_avanzar=lambda parciales: _actualizar_corrida(corrida_id, contadores=parciales),
+                lease=lease,
+            )
+        cambios = {'estado': CorridaRecordatorios.HECHA, 'contadores': contadores}
+    except CandadoOcupado:
+        cambios = {'estado': CorridaRecordatorios.OMITIDA}
+    except Exception:
+        logger.exception('La corrida de recordatorios %s falló', corrida_id)
+        cambios = {'estado': CorridaRecordatorios.FALLIDA, 'error': traceback.format_exc()[-4000:]}
+    _actualizar_corrida(corrida_id, activa=False, terminada=timezone.now(), **cambios)
+
+
+class Agenda:
+    """Recordatorios pendientes ordenados por momento. Reprogramar o quitar es O(log n)."""
+
+    def __init__(self):
+        self._heap = []
+        self._vigentes = {}
+
+    def __len__(self):
+        return len(self._vigentes)
+
+    def __contains__(self, turno_id):
+        return turno_id in self._vigentes
+
+    def programar(self, turno_id, momento):
+        if self._vigentes.get(turno_id) != momento:
+            self._vigentes[turno_id] = momento
+            heapq.heappush(self._heap, (momento, turno_id))
+
+    def quitar(self, turno_id):
+        # La entrada vieja queda en el heap y se descarta al salir.
+        self._vigentes.pop(turno_id, None)
+
+    def _descartar_viejas(self):
+        while self._heap and self._vigentes.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def proximo(self):
+        self._descartar_viejas()
+        return self._heap[0][0] if self._heap else None
+
+    def vencidos(self, ahora):
+        """Saca y devuelve los ids cuyo momento ya llegó."""
+        ids = []
+        self._descartar_viejas()
+        while self._heap and self._heap[0][0] <= ahora:
+            momento, turno_id = heapq.heappop(self._heap)
+            if self._vigentes.get(turno_id) == momento:
+                del self._vigentes[turno_id]
+                ids.append(turno_id)
+            self._descartar_viejas()
+        return ids
+
+    def sincronizar(self, turnos, ahora, hasta):
+        """Programa, mueve o quita según el estado actual de ``turnos`` (con ``CAMPOS_AGENDA``)."""
+        for turno in turnos:
+            momento = momento_recordatorio(turno)
+            if corresponde_recordar(turno, ahora) and momento <= hasta:
+                self.programar(turno.id, momento)
+            else:
+                self.quitar(turno.id)
+
+
+def turnos_del_horizonte(ahora, hasta):
+    """Candidatos de la carga completa: confirmados sin recordatorio entre hoy y ``hasta``."""
+    desde_fecha = timezone.localtime(ahora).date() - timedelta(days=1)
+    return Turno.objects.filter(
+        estado='confirmado',
+        recordatorio_enviado=False,
+        fecha__gte=desde_fecha,
+        fecha__lte=timezone.localtime(hasta).date() + timedelta(days=1),
+    ).only(*CAMPOS_AGENDA)
+
+
+def cambiados_desde(marca):
+    """Turnos guardados desde ``marca`` (incluida: reprogramar dos veces no molesta)."""
+    return Turno.objects.filter(actualizado__gte=marca).only(*CAMPOS_AGENDA).order_by('actualizado')
+
+
+def disparar(turno_id, ahora):
+    """
+    Marca el recordatorio como enviado y encola el envío, en una transacción. Devuelve False si
+    entre el último sondeo y ahora el turno cambió y ya no corresponde (o lo tomó el cron).
+    """
+    with transaction.atomic():
+        turno = Turno.objects.filter(pk=turno_id).only(*CAMPOS_AGENDA).first()
+        if turno is None or not corresponde_recordar(turno, ahora) or momento_recordatorio(turno) > ahora:
+            return False
+        tomado = tomar(turno_id)
+        if tomado:
+            encolar('recordatorios.enviar', turno_id=turno_id)
+        return tomado
+
+
+class Scheduler:
+    """
+    Estado del scheduler residente. ``paso(ahora)`` es una vuelta del loop: recarga la agenda
+    completa cada ``recarga`` segundos (red de seguridad), si no sólo lee los turnos cambiados,
+    y dispara los recordatorios vencidos.
+    """
+
+    # Los turnos guardados en una transacción que commitea después del sondeo quedan con
+    # ``actualizado`` anterior a la marca: se relee este margen hacia atrás.
+    SOLAPE = timedelta(seconds=30)
+
+    def __init__(self, recarga=None):
+        self.recarga = timedelta(seconds=recarga or settings.REMINDER_SCHEDULER_RELOAD_SECONDS)
+        self.agenda = Agenda()
+        self.proxima_recarga = None
+        self.marca = None
+        self.hasta = None
+
+    def recargar(self, ahora):
+        self.hasta = ahora + 2 * self.recarga
+        self.agenda = Agenda()
+        self.agenda.sincronizar(turnos_del_horizonte(ahora, self.hasta), ahora, self.hasta)
+        self.marca = ahora
+        self.proxima_recarga = ahora + self.recarga
+        logger.info('Agenda de recordatorios recargada: %s pendientes', len(self.agenda))
+
+    def sondear(self, ahora):
+        cambiados = list(cambiados_desde(self.marca - self.SOLAPE))
+        self.agenda.sincronizar(cambiados, ahora, self.hasta)
+        if cambiados:
+            self.marca = max(self.marca, cambiados[-1].actualizado)
+
+    def paso(self, ahora):
+        if self.proxima_recarga is None or ahora >= self.proxima_recarga:
+            self.recargar(ahora)
+        else:
+            self.sondear(ahora)
+        return [turno_id for turno_id in self.agenda.vencidos(ahora) if disparar(turno_id, ahora)]
@@ -0,0 +1,95 @@
+"""
+Búsqueda de servicios del index.
+
+Cada Servicio guarda su texto de búsqueda ya normalizado (minúsculas y sin tildes, así
+"peluqueria nandu" encuentra "Peluquería Ñandú"): ``busqueda_nombre`` con el nombre y
+``busqueda_texto`` con nombre, descripción, dirección y categoría. Se recalculan en
+``Servicio.save`` y cuando se renombra una categoría.
+
+Cada palabra de la consulta tiene que aparecer en ``busqueda_texto`` (``LIKE '%palabra%'``).
+En PostgreSQL ese LIKE usa el índice GIN de trigramas (pg_trgm) que crea la migración, así
+que no recorre la tabla entera; en SQLite (tests, desarrollo) es la misma consulta sin
+índice. El orden es por relevancia: pesa más que la palabra esté en el nombre, y más aún
+al principio de una palabra del nombre.
+"""
+import unicodedata
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+RESULTADOS_POR_PAGINA = 12
+MAX_PALABRAS = 8
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes ni diéresis (la ñ queda como n) y con los espacios colapsados."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_marcas = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_marcas.lower().split())
+
+
+def texto_de_busqueda(nombre, descripcion, direccion, categoria_nombre=''):
+    return normalizar(' '.join(filter(None, (nombre, descripcion, direccion, categoria_nombre))))
+
+
+def actualizar_campos_busqueda(servicio):
+    """Carga ``busqueda_nombre`` y ``busqueda_texto`` en la instancia (no guarda)."""
+    categoria = servicio.categoria.nombre if servicio.categoria_id else ''
+    servicio.busqueda_nombre = normalizar(servicio.nombre)
+    servicio.busqueda_texto = texto_de_busqueda(
+        servicio.nombre, servicio.descripcion, servicio.direccion, categoria,
+    )
+
+
+def reindexar_servicios(servicios, batch_size=1000):
+    """Recalcula y guarda los campos de búsqueda de ``servicios`` (un queryset). Devuelve cuántos."""
+    total = 0
+    lote = []
+    for servicio in servicios.select_related('categoria').only(
+        'nombre', 'descripcion', 'direccion', 'categoria__nombre',
+    ).iterator(chunk_size=batch_size):
+        actualizar_campos_busqueda(servicio)
+        lote.append(servicio)
+        if len(lote) >= batch_size:
+            total += _guardar_lote(servicios.model, lote)
+            lote = []
+    return total + _guardar_lote(servicios.model, lote)
+
+
+def _guardar_lote(modelo, lote):
+    modelo.objects.bulk_update(lote, ['busqueda_nombre', 'busqueda_texto'])
+    return len(lote)
+
+
+def palabras(consulta):
+    """Palabras normalizadas y sin repetir de la consulta, hasta ``MAX_PALABRAS``."""
+    vistas = []
+    for palabra in normalizar(consulta).split():
+        if palabra not in vistas:
+            vistas.append(palabra)
+    return vistas[:MAX_PALABRAS]
+
+
+def buscar_servicios(servicios, consulta):
+    """
+    Filtra el queryset ``servicios`` por ``consulta`` y lo ordena por relevancia.
+    Una consulta vacía devuelve el queryset sin tocar.
+    """
+    lista = palabras(consulta)
+    if not lista:
+        return servicios
+    relevancia = Value(0)
+    for palabra in lista:
+        servicios = servicios.filter(busqueda_texto__contains=palabra)
+        relevancia = relevancia + Case(
+            When(Q(busqueda_nombre__startswith=palabra) | Q(busqueda_nombre__contains=f' {palabra}'), then=Value(3)),
+            When(busqueda_nombre__contains=palabra, then=Value(2)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    frase = ' '.join(lista)
+    relevancia = relevancia + Case(
+        When(busqueda_nombre=frase, then=Value(10)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return servicios.annotate(relevancia=relevancia).order_by('-relevancia', 'nombre', 'id')
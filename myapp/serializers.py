@@ -8,7 +8,9 @@ class ServicioSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class TurnoSerializer(serializers.ModelSerializer):
-    usuario_username = serializers.CharField(source='usuario.username', read_only=True)
+    # El campo del modelo es ``cliente``; la API lo sigue exponiendo como ``usuario``.
+    usuario = serializers.PrimaryKeyRelatedField(source='cliente', read_only=True)
+    usuario_username = serializers.CharField(source='cliente.username', read_only=True)
 
     class Meta:
         model = Turno
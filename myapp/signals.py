@@ -1,17 +1,19 @@
 import logging
-import threading
 
 from django.contrib.auth.models import User
-from django.db import close_old_connections, transaction
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
 
 from allauth.account.signals import user_signed_up
 from allauth.socialaccount.models import SocialAccount
 from allauth.socialaccount.signals import social_account_added
 
-from .models import Plan, Suscripcion
-from .email_service import send_verification_email
+from .models import (
+    Categoria, DiaNoDisponible, HorarioLaboral, PerfilUsuario, Plan, Profesional, Servicio, Suscripcion, Turno,
+)
+from .email_service import schedule_verification_email
+from . import availability, entitlements, metrics, occupancy, search, user_state
 
 logger = logging.getLogger(__name__)
 
@@ -41,24 +43,7 @@ def send_email_verification_pidgeon(sender, request, user, **kwargs):
     except Exception:
         pass
 
-    user_id = user.pk
-
-    def _send_after_commit():
-        def _runner():
-            close_old_connections()
-            try:
-                u = User.objects.get(pk=user_id)
-                send_verification_email(u, None)
-            except User.DoesNotExist:
-                logger.warning('Usuario %s ya no existe tras commit; no se envía verificación', user_id)
-            except Exception:
-                logger.exception('Envío en segundo plano del correo de verificación falló (user=%s)', user_id)
-            finally:
-                close_old_connections()
-
-        threading.Thread(target=_runner, daemon=True).start()
-
-    transaction.on_commit(_send_after_commit)
+    schedule_verification_email(user)
 
     if request is not None:
         from django.contrib import messages as dj_messages
@@ -83,3 +68,193 @@ def mark_oauth_user_email_verified(request, sociallogin, **kwargs):
     if not perfil.email_verified:
         perfil.email_verified = True
         perfil.save(update_fields=['email_verified'])
+
+
+# --- Invalidación de la caché de disponibilidad (ver myapp/availability.py) ---
+
+# Valores con los que se cargó la instancia, para invalidar también el día "viejo"
+# cuando un turno o bloqueo cambia de fecha/profesional. Se leen de __dict__ para
+# no disparar consultas con campos diferidos (.only()/.defer()). Se refrescan con
+# un post_save conectado al final del archivo, para que corra después de los demás.
+_CAMPOS_ORIGINALES = {
+    Turno: (
+        'servicio_id', 'profesional_id', 'fecha', 'estado', 'duracion_total',
+        'ingreso_real', 'medio_de_pago_final', 'hora',
+    ),
+    DiaNoDisponible: ('profesional_id', 'fecha_inicio', 'fecha_fin'),
+    Servicio: ('duracion_buffer_minutos',),
+}
+
+
+def _guardar_originales(sender, instance, **kwargs):
+    instance._valores_originales = {
+        campo: instance.__dict__.get(campo) for campo in _CAMPOS_ORIGINALES[sender]
+    }
+
+
+for _modelo in _CAMPOS_ORIGINALES:
+    post_init.connect(_guardar_originales, sender=_modelo, dispatch_uid=f'originales_{_modelo.__name__}')
+
+
+def _original(instance, campo):
+    return getattr(instance, '_valores_originales', {}).get(campo)
+
+
+@receiver(post_save, sender=Turno)
+@receiver(post_delete, sender=Turno)
+def invalidar_slots_turno(sender, instance, **kwargs):
+    availability.invalidar_dias(instance.profesional_id, [instance.fecha])
+    profesional_original = _original(instance, 'profesional_id')
+    fecha_original = _original(instance, 'fecha')
+    if (profesional_original, fecha_original) != (instance.profesional_id, instance.fecha):
+        availability.invalidar_dias(profesional_original, [fecha_original])
+
+
+def _dias_bloqueo(fecha_inicio, fecha_fin):
+    if not fecha_inicio:
+        return []
+    return list(availability.iterar_fechas(fecha_inicio, fecha_fin or fecha_inicio))
+
+
+@receiver(post_save, sender=DiaNoDisponible)
+@receiver(post_delete, sender=DiaNoDisponible)
+def invalidar_slots_bloqueo(sender, instance, **kwargs):
+    dias = _dias_bloqueo(instance.fecha_inicio, instance.fecha_fin)
+    profesional_original = _original(instance, 'profesional_id')
+    dias_originales = _dias_bloqueo(_original(instance, 'fecha_inicio'), _original(instance, 'fecha_fin'))
+    # Bloqueos largos (vacaciones) tocan muchos días: más barato invalidar al profesional entero.
+    if len(dias) + len(dias_originales) > availability.MAX_DIAS_RANGO:
+        availability.invalidar_profesional(instance.profesional_id)
+        availability.invalidar_profesional(profesional_original)
+    else:
+        availability.invalidar_dias(instance.profesional_id, dias)
+        availability.invalidar_dias(profesional_original, dias_originales)
+
+
+@receiver(post_save, sender=HorarioLaboral)
+@receiver(post_delete, sender=HorarioLaboral)
+def invalidar_slots_horario(sender, instance, **kwargs):
+    availability.invalidar_profesional(instance.profesional_id)
+
+
+@receiver(post_save, sender=Servicio)
+def invalidar_slots_buffer(sender, instance, created, **kwargs):
+    if not created and _original(instance, 'duracion_buffer_minutos') != instance.duracion_buffer_minutos:
+        availability.invalidar_servicio(instance.pk)
+
+
+# --- Rollups de ocupación (myapp/occupancy.py) y de ingresos (myapp/metrics.py) ---
+
+# Los tres primeros campos son la clave (servicio, profesional, fecha) de las filas.
+_CAMPOS_OCUPACION = ('servicio_id', 'profesional_id', 'fecha', 'estado', 'duracion_total')
+# ``hora`` no cambia las tablas diarias pero sí el gráfico por hora (sale de Turno): invalida la caché.
+_CAMPOS_METRICAS = ('servicio_id', 'profesional_id', 'fecha', 'estado', 'ingreso_real', 'medio_de_pago_final', 'hora')
+
+
+def _recalcular_si_cambio(recalcular, campos, instance, signal, created):
+    """Llama a ``recalcular`` para el día actual del turno y, si se movió, para el anterior."""
+    originales = [_original(instance, campo) for campo in campos]
+    actuales = [getattr(instance, campo) for campo in campos]
+    if signal is post_save and not created and originales == actuales:
+        return
+    recalcular(instance.servicio_id, instance.profesional_id, [instance.fecha])
+    if not created and originales[:3] != actuales[:3]:
+        recalcular(originales[0], originales[1], [originales[2]])
+
+
+@receiver(post_save, sender=Turno)
+@receiver(post_delete, sender=Turno)
+def actualizar_ocupacion_turno(sender, instance, signal, created=False, **kwargs):
+    _recalcular_si_cambio(occupancy.recalcular_ocupacion, _CAMPOS_OCUPACION, instance, signal, created)
+
+
+@receiver(post_save, sender=Turno)
+@receiver(post_delete, sender=Turno)
+def actualizar_metricas_turno(sender, instance, signal, created=False, **kwargs):
+    # Sólo importan los turnos que son o eran "completado".
+    if instance.estado != metrics.ESTADO_COMPLETADO and _original(instance, 'estado') != metrics.ESTADO_COMPLETADO:
+        return
+    _recalcular_si_cambio(metrics.recalcular_metricas, _CAMPOS_METRICAS, instance, signal, created)
+
+
+@receiver(m2m_changed, sender=Turno.sub_servicios_solicitados.through)
+def actualizar_metricas_sub_servicios(sender, instance, action, reverse, **kwargs):
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if instance.estado == metrics.ESTADO_COMPLETADO:
+        metrics.recalcular_metricas(instance.servicio_id, instance.profesional_id, [instance.fecha])
+
+
+@receiver(post_save, sender=Profesional)
+def invalidar_metricas_profesional(sender, instance, created, **kwargs):
+    # El gráfico por profesional usa el nombre como etiqueta.
+    if not created:
+        metrics.invalidar_metricas(instance.servicio_id)
+
+
+@receiver(post_save, sender=HorarioLaboral)
+@receiver(post_delete, sender=HorarioLaboral)
+def actualizar_capacidad_horario(sender, instance, origin=None, **kwargs):
+    # En cascada (se borra el profesional, su servicio o el dueño) las filas del profesional
+    # ya se borraron con él: no hay capacidad que actualizar.
+    if origin is not None and getattr(origin, 'model', type(origin)) is not HorarioLaboral:
+        return
+    occupancy.actualizar_capacidad(instance.profesional_id)
+
+
+@receiver(post_delete, sender=Profesional)
+def reasignar_rollups_profesional(sender, instance, **kwargs):
+    # Sus turnos quedan con profesional NULL (SET_NULL no dispara señales de Turno).
+    occupancy.recalcular_sin_profesional(instance.servicio_id)
+    metrics.recalcular_sin_profesional(instance.servicio_id)
+
+
+@receiver(post_save, sender=Categoria)
+def reindexar_busqueda_categoria(sender, instance, created, **kwargs):
+    # El nombre de la categoría forma parte del texto de búsqueda de sus servicios.
+    if not created:
+        search.reindexar_servicios(instance.servicios.all())
+
+
+def _invalidar_usuario(usuario_id):
+    user_state.invalidar_usuario(usuario_id)
+    # Después de subir la versión (los on_commit corren en orden), así no se vuelve a memorizar la vieja.
+    transaction.on_commit(lambda: entitlements.olvidar(usuario_id))
+
+
+@receiver(post_save, sender=Suscripcion)
+@receiver(post_delete, sender=Suscripcion)
+def invalidar_estado_suscripcion(sender, instance, **kwargs):
+    _invalidar_usuario(instance.usuario_id)
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def invalidar_estado_perfil(sender, instance, **kwargs):
+    _invalidar_usuario(instance.usuario_id)
+
+
+@receiver(post_save, sender=SocialAccount)
+@receiver(post_delete, sender=SocialAccount)
+def invalidar_estado_cuenta_social(sender, instance, **kwargs):
+    _invalidar_usuario(instance.user_id)
+
+
+@receiver(post_save, sender=Servicio)
+@receiver(post_delete, sender=Servicio)
+def invalidar_estado_propietario(sender, instance, created=False, signal=None, **kwargs):
+    # Sólo importa si tiene o no negocio (la navbar ofrece "Mi negocio").
+    if created or signal is post_delete:
+        _invalidar_usuario(instance.propietario_id)
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def invalidar_estado_planes(sender, instance, **kwargs):
+    user_state.invalidar_planes()
+    transaction.on_commit(entitlements.olvidar)
+
+
+# Último receptor de post_save: desde acá los "originales" pasan a ser los valores guardados.
+for _modelo in _CAMPOS_ORIGINALES:
+    post_save.connect(_guardar_originales, sender=_modelo, dispatch_uid=f'refrescar_{_modelo.__name__}')
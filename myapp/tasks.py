@@ -0,0 +1,147 @@
+"""
+Cola de tareas persistente (patrón outbox) para el trabajo que no tiene que frenar la request.
+
+Antes cada reserva, confirmación, cancelación y registro arrancaba su propio
+``threading.Thread`` tras el commit: sin límite ante una ráfaga y, si Gunicorn reiniciaba el
+worker, el correo se perdía. Ahora la vista sólo inserta una fila ``Tarea`` dentro de su
+transacción (si se deshace, la tarea también) y ``manage.py process_tasks`` las ejecuta:
+
+- ``tomar_lote`` reclama varias de una con ``SELECT ... FOR UPDATE SKIP LOCKED`` donde la base
+  lo soporta (PostgreSQL), así varios workers no se esperan ni se pisan. El UPDATE repite la
+  condición y marca el lote con ``tomada_por``, lo que alcanza también en SQLite.
+- La tarea tomada queda ``en_curso`` hasta ``bloqueada_hasta`` (``TAREAS_BLOQUEO``); si el
+  proceso muere, al vencer otro worker la vuelve a tomar.
+- Si la función lanza una excepción se reintenta con backoff exponencial
+  (``TAREAS_BACKOFF_BASE`` · 2^n con tope ``TAREAS_BACKOFF_MAX``); agotados ``max_intentos``
+  queda ``fallida`` (dead-letter) para revisarla desde el admin. Las tareas de correo no lanzan:
+  sus fallos se reintentan por EmailFailureLog (ver ``email_service``).
+
+Las funciones se registran por nombre con ``@tarea('...')`` y reciben sólo argumentos que se
+puedan guardar como JSON.
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_registro = {}
+
+
+def tarea(nombre):
+    """Registra la función decorada bajo ``nombre`` para poder encolarla."""
+    def decorador(funcion):
+        _registro[nombre] = funcion
+        return funcion
+    return decorador
+
+
+def encolar(nombre, *, demora=None, **argumentos):
+    """Guarda la tarea en la transacción actual; el worker la ve recién después del commit."""
+    if nombre not in _registro:
+        raise KeyError(f'Tarea no registrada: {nombre}')
+    return Tarea.objects.create(
+        nombre=nombre,
+        argumentos=argumentos,
+        disponible_desde=timezone.now() + (demora or timedelta()),
+        max_intentos=settings.TAREAS_MAX_INTENTOS,
+    )
+
+
+def _listas(ahora):
+    """Pendientes cuyo backoff ya pasó, o en curso con el bloqueo vencido (worker caído)."""
+    return Q(estado=Tarea.PENDIENTE, disponible_desde__lte=ahora) | Q(
+        estado=Tarea.EN_CURSO, bloqueada_hasta__lt=ahora,
+    )
+
+
+def tomar_lote(cantidad):
+    """Reclama hasta ``cantidad`` tareas listas; vuelven marcadas ``en_curso`` para este lote."""
+    ahora = timezone.now()
+    lote = uuid.uuid4().hex
+    with transaction.atomic():
+        candidatas = Tarea.objects.filter(_listas(ahora)).order_by('disponible_desde', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidatas = candidatas.select_for_update(skip_locked=True)
+        ids = list(candidatas.values_list('id', flat=True)[:cantidad])
+        if not ids:
+            return []
+        # Sin SKIP LOCKED otro worker pudo elegir las mismas: la condición repetida lo descarta.
+        Tarea.objects.filter(_listas(ahora), id__in=ids).update(
+            estado=Tarea.EN_CURSO,
+            tomada_por=lote,
+            bloqueada_hasta=ahora + timedelta(seconds=settings.TAREAS_BLOQUEO),
+            intentos=F('intentos') + 1,
+        )
+    return list(Tarea.objects.filter(tomada_por=lote).order_by('disponible_desde', 'id'))
+
+
+def espera_reintento(intentos, base=None, tope=None):
+    """Backoff exponencial con ±20 % de jitter para no reintentar todo junto."""
+    base = settings.TAREAS_BACKOFF_BASE if base is None else base
+    tope = settings.TAREAS_BACKOFF_MAX if tope is None else tope
+    segundos = min(base * 2 ** max(intentos - 1, 0), tope)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def ejecutar(tarea_tomada):
+    """Corre una tarea tomada con ``tomar_lote`` y guarda cómo terminó. Devuelve el estado."""
+    try:
+        _registro[tarea_tomada.nombre](**tarea_tomada.argumentos)
+    except Exception:
+        ahora = timezone.now()
+        cambios = {'ultimo_error': traceback.format_exc()[-4000:]}
+        if tarea_tomada.intentos >= tarea_tomada.max_intentos:
+            cambios.update(estado=Tarea.FALLIDA, terminada=ahora)
+            logger.exception('Tarea %s falló %s veces; queda fallida', tarea_tomada, tarea_tomada.intentos)
+        else:
+            cambios.update(
+                estado=Tarea.PENDIENTE,
+                disponible_desde=ahora + espera_reintento(tarea_tomada.intentos),
+            )
+            logger.warning('Tarea %s falló (intento %s); se reintenta', tarea_tomada, tarea_tomada.intentos)
+    else:
+        cambios = {'estado': Tarea.HECHA, 'terminada': timezone.now(), 'ultimo_error': ''}
+    # Si el bloqueo venció y otro worker la retomó, su resultado es el que vale.
+    Tarea.objects.filter(pk=tarea_tomada.pk, tomada_por=tarea_tomada.tomada_por).update(
+        bloqueada_hasta=None, **cambios,
+    )
+    return cambios['estado']
+
+
+def _ejecutar_en_hilo(tarea_tomada):
+    close_old_connections()
+    try:
+        return ejecutar(tarea_tomada)
+    finally:
+        connections.close_all()
+
+
+def procesar_lote(cantidad, ejecutor=None):
+    """
+    Toma un lote y lo ejecuta; con ``ejecutor`` (un ThreadPoolExecutor acotado) en paralelo.
+    Devuelve las tareas tomadas.
+    """
+    tareas = tomar_lote(cantidad)
+    if ejecutor is None:
+        for tarea_tomada in tareas:
+            ejecutar(tarea_tomada)
+    else:
+        list(ejecutor.map(_ejecutar_en_hilo, tareas))
+    return tareas
+
+
+def purgar_hechas(dias):
+    """Borra las tareas hechas hace más de ``dias`` días; las fallidas quedan para revisar."""
+    limite = timezone.now() - timedelta(days=dias)
+    borradas, _ = Tarea.objects.filter(estado=Tarea.HECHA, terminada__lt=limite).delete()
+    return borradas
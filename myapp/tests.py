@@ -1,3 +1,1924 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from time import monotonic, perf_counter, sleep, time_ns
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import availability, mp_gateway, pidgeon, reminders, search, user_state
+from .booking import TurnoNoDisponible, reservar_turno
+from .checks import cache_compartida
+from .email_service import schedule_verification_email, send_email_with_fallback, verification_link_for_token
+from .entitlements import capacidades, olvidar as olvidar_capacidades
+from .fake_mercadopago import FakeMercadoPago
+from .models import (
+    Candado, Categoria, CorridaRecordatorios, DiaNoDisponible, EmailFailureLog, EmailVerificationToken, HorarioLaboral,
+    IngresoDiario, MedioDePago, NotificacionMP, OcupacionDiaria, Plan, Profesional, Reseña, Servicio, SubServicio,
+    SubServicioDiario, Suscripcion, Tarea, Turno,
+)
+from .locks import CandadoOcupado, CandadoPerdido, adquirir, candado
+from .metrics import diferencias_metricas, obtener_o_calcular
+from .mp_notifications import procesar_pendientes
+from .occupancy import reconstruir_ocupacion
+from .reminders import Scheduler, disparar, enviar_recordatorios_pendientes
+from .tasks import encolar, ejecutar, procesar_lote, tarea, tomar_lote
+from .user_state import estado_de_usuario
+
+
+def crear_negocio(profesionales=1, buffer_minutos=0):
+    """Servicio con ``profesionales`` que atienden todos los días de 9 a 18."""
+    Plan.objects.get_or_create(slug='free', defaults={'nombre': 'Free'})
+    propietario = User.objects.create_user('propietario', 'propietario@example.com', 'clave')
+    servicio = Servicio.objects.create(
+        propietario=propietario, nombre='Peluquería', duracion_buffer_minutos=buffer_minutos,
+    )
+    sub_servicio = SubServicio.objects.create(servicio_padre=servicio, nombre='Corte', duracion=30, precio=100)
+    creados = []
+    for i in range(profesionales):
+        profesional = Profesional.objects.create(servicio=servicio, nombre=f'Profesional {i}')
+        HorarioLaboral.objects.create(
+            profesional=profesional,
+            lunes=True, martes=True, miercoles=True, jueves=True,
+            viernes=True, sabado=True, domingo=True,
+            horario_apertura=time(9), horario_cierre=time(18),
+        )
+        creados.append(profesional)
+    return servicio, sub_servicio, creados
+
+
+def crear_usuario(username, plan_slug=None):
+    usuario = User.objects.create_user(username, f'{username}@example.com', 'clave')
+    usuario.perfil.email_verified = True
+    usuario.perfil.save()
+    if plan_slug:
+        suscripcion = usuario.suscripcion
+        suscripcion.plan = Plan.objects.get(slug=plan_slug)
+        suscripcion.is_active = True
+        suscripcion.save()
+    return usuario
+
+
+class FakePidgeon:
+    """
+    Pidgeon local (HTTP/1.1 con keep-alive) para pruebas: responde ``status`` tras ``demora``
+    segundos y anota cada pedido y cada conexión TCP aceptada.
+    """
+
+    def __init__(self, status=200, demora=0.0):
+        self.status = status
+        self.demora = demora
+        self.pedidos = []
+        self.conexiones = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                fake.conexiones += 1
+                super().setup()
+
+            def responder(self, cuerpo=None):
+                fake.pedidos.append((self.command, self.path, cuerpo))
+                sleep(fake.demora)
+                datos = json.dumps({'success': fake.status == 200, 'messageId': f'm{len(fake.pedidos)}'}).encode()
+                self.send_response(fake.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def do_GET(self):
+                self.responder()
+
+            def do_POST(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                self.responder(json.loads(self.rfile.read(largo) or b'null'))
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.servidor.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.servidor.server_port}'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def rutas(self):
+        return [ruta for _, ruta, _ in self.pedidos]
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class ConFakePidgeonTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        pidgeon.cerrar()
+        pidgeon.reiniciar_metricas()
+        self.fake = FakePidgeon()
+        self.addCleanup(self.fake.cerrar)
+        self.addCleanup(pidgeon.cerrar)
+
+
+class PidgeonClienteTests(ConFakePidgeonTestCase):
+
+    def test_reusa_la_conexion_y_despierta_una_vez_por_ventana(self):
+        with self.settings(PIDGEON_URL=self.fake.url, PIDGEON_WAKE_BEFORE_SEND=True, PIDGEON_API_VERSION='v2'):
+            for i in range(5):
+                self.assertTrue(send_email_with_fallback(
+                    f'c{i}@example.com', 'Hola', '<p>hola</p>', 'prueba', template_id='t', template_data={},
+                ))
+        self.assertEqual(self.fake.rutas(), ['/health'] + ['/v2/send'] * 5)
+        self.assertEqual(self.fake.conexiones, 1)
+        resumen = pidgeon.resumen()
+        self.assertEqual((resumen['llamadas'], resumen['conexiones_nuevas'], resumen['errores']), (6, 1, 0))
+        self.assertGreater(resumen['p95_ms'], 0)
+
+    @override_settings(
+        PIDGEON_WAKE_BEFORE_SEND=False, PIDGEON_SEND_ATTEMPTS=2, PIDGEON_TIMEOUT=2,
+        PIDGEON_CIRCUIT_FAILURES=2, PIDGEON_CIRCUIT_OPEN_SECONDS=1,
+    )
+    def test_circuito_corta_con_pidgeon_caido_y_la_sonda_lo_cierra(self):
+        self.fake.status, self.fake.demora = 503, 0.3
+
+        def enviar(cantidad):
+            inicio = perf_counter()
+            with self.settings(PIDGEON_URL=self.fake.url):
+                enviados = [
+                    send_email_with_fallback(f'c{i}@example.com', 'Hola', '<p>hola</p>', 'prueba')
+                    for i in range(cantidad)
+                ]
+            return enviados, perf_counter() - inicio
+
+        # Sin circuito serían 10 × 2 intentos × 0,3 s (+ backoff): acá sólo los 2 primeros llegan.
+        enviados, segundos = enviar(10)
+        self.assertEqual(enviados, [False] * 10)
+        self.assertEqual(len(self.fake.pedidos), 2)
+        self.assertLess(segundos, 1.5)
+        self.assertEqual(EmailFailureLog.objects.count(), 10)
+        self.assertEqual(pidgeon.resumen()['rechazadas_por_circuito'], 9)
+
+        # Pidgeon vuelve: vencido el plazo pasa una sonda y el circuito se cierra.
+        self.fake.status, self.fake.demora = 200, 0
+        sleep(1.05)
+        enviados, _ = enviar(3)
+        self.assertEqual(enviados, [True] * 3)
+        self.assertFalse(pidgeon.circuito_abierto())
+
+
+@override_settings(PIDGEON_WAKE_BEFORE_SEND=False, PIDGEON_SEND_ATTEMPTS=1, EMAIL_RETRY_MAX_COUNT=3)
+class ReintentoEmailsFallidosTests(ConFakePidgeonTestCase):
+    def fallido(self, recipient, event_type='booking_confirmation', key='', **extra):
+        return EmailFailureLog.objects.create(
+            event_type=event_type, recipient=recipient, subject='Asunto', html_content=f'<p>{recipient}</p>',
+            error_message='HTTP 502', retry_count=1, idempotency_key=key, **extra,
+        )
+
+    def reintentar(self):
+        salida = StringIO()
+        with self.settings(PIDGEON_URL=self.fake.url):
+            call_command('retry_failed_emails', lote=2, stdout=salida)
+        return salida.getvalue()
+
+    def test_colapsa_duplicados_y_reenvia_con_su_idempotency_key(self):
+        viejo = self.fallido('a@example.com', key='book-client-1')
+        nuevo = self.fallido('a@example.com', key='book-client-1')
+        otro_turno = self.fallido('a@example.com', key='book-client-2')
+        self.fallido('b@example.com', 'verification', key='verify-1-x')
+        verificacion = self.fallido('b@example.com', 'verification', key='verify-1-y')
+        sin_clave = self.fallido('c@example.com')
+        despues = self.fallido('d@example.com', next_retry_at=timezone.now() + timedelta(hours=1))
+
+        salida = self.reintentar()
+        self.assertIn('Revisados: 4 | reenviados: 4', salida)
+        self.assertIn('duplicados: 2', salida)
+        enviados = sorted((cuerpo['to'], cuerpo.get('idempotencyKey') or '') for _, _, cuerpo in self.fake.pedidos)
+        self.assertEqual(enviados, [
+            ('a@example.com', 'book-client-1'), ('a@example.com', 'book-client-2'),
+            ('b@example.com', 'verify-1-y'), ('c@example.com', ''),
+        ])
+        resoluciones = dict(EmailFailureLog.objects.values_list('id', 'resolution'))
+        self.assertEqual(resoluciones[viejo.id], 'duplicate')
+        self.assertEqual(
+            {resoluciones[f.id] for f in (nuevo, otro_turno, verificacion, sin_clave)}, {'resent'},
+        )
+        self.assertEqual(resoluciones[despues.id], '')
+        # Una segunda corrida no tiene nada que hacer.
+        self.assertIn('Revisados: 0', self.reintentar())
+
+    def test_no_reenvia_recordatorios_de_turnos_que_ya_empezaron(self):
+        servicio, _, (profesional,) = crear_negocio()
+        ahora = timezone.localtime()
+
+        def turno(minutos, estado='confirmado'):
+            inicio = ahora + timedelta(minutes=minutos)
+            return Turno.objects.create(
+                servicio=servicio, profesional=profesional, cliente=crear_usuario(f'cliente{minutos}{estado}'),
+                estado=estado, fecha=inicio.date(), hora=inicio.time(), duracion_total=30,
+            )
+
+        proximo, empezado, cancelado = turno(10), turno(-5), turno(20, 'cancelado')
+        vigente = self.fallido('a@example.com', 'reminder_client', key=f'reminder-client-{proximo.id}')
+        vencidas = [
+            self.fallido('b@example.com', 'reminder_client', key=f'reminder-client-{empezado.id}'),
+            self.fallido('c@example.com', 'reminder_pro', key=f'reminder-pro-{empezado.id}'),
+            self.fallido('d@example.com', 'reminder_client', key=f'reminder-client-{cancelado.id}'),
+            self.fallido('e@example.com', 'reminder_client', key='reminder-client-999999'),
+        ]
+
+        salida = self.reintentar()
+        self.assertIn('Revisados: 1 | reenviados: 1', salida)
+        self.assertIn('vencidos: 4', salida)
+        self.assertEqual([cuerpo['to'] for _, _, cuerpo in self.fake.pedidos], ['a@example.com'])
+        resoluciones = dict(EmailFailureLog.objects.values_list('id', 'resolution'))
+        self.assertEqual(resoluciones[vigente.id], 'resent')
+        self.assertEqual({resoluciones[fila.id] for fila in vencidas}, {'expired'})
+
+    def test_falla_otra_vez_con_backoff_hasta_agotarse(self):
+        self.fake.status = 502
+        fila = self.fallido('a@example.com', key='book-client-1')
+        self.assertIn('fallidos: 1', self.reintentar())
+        fila.refresh_from_db()
+        self.assertFalse(fila.resolved)
+        self.assertEqual(fila.retry_count, 2)
+        self.assertGreater(fila.next_retry_at, timezone.now() + timedelta(seconds=40))
+        self.assertIn('Revisados: 0', self.reintentar())
+
+        EmailFailureLog.objects.update(next_retry_at=timezone.now())
+        self.assertIn('agotados: 1', self.reintentar())
+        EmailFailureLog.objects.update(next_retry_at=timezone.now())
+        self.assertIn('Revisados: 0', self.reintentar())
+        self.assertEqual(len(self.fake.pedidos), 2)
+
+
+class GenerarDatasetTests(TestCase):
+    def generar(self, prefijo, semilla=7):
+        call_command(
+            'generate_dataset', prefijo=prefijo, semilla=semilla, hoy=date(2025, 3, 10), usuarios=20,
+            servicios=6, profesionales=3, turnos=600, anios=1, stdout=StringIO(),
+        )
+        turnos = Turno.objects.filter(servicio__slug__startswith=f'{prefijo}-').order_by('id')
+        return turnos, [
+            (t.fecha, t.hora, t.estado, t.duracion_total, t.ingreso_real, t.sub_servicios_solicitados.count())
+            for t in turnos.prefetch_related('sub_servicios_solicitados')
+        ]
+
+    def test_misma_semilla_mismos_datos(self):
+        turnos, primera = self.generar('uno')
+        _, segunda = self.generar('dos')
+        _, otra_semilla = self.generar('tres', semilla=8)
+        self.assertEqual(len(primera), 600)
+        self.assertEqual(primera, segunda)
+        self.assertNotEqual(primera, otra_semilla)
+
+        bloqueados = [
+            turno for turno in turnos.select_related('profesional')
+            if turno.profesional.dias_no_disponibles.filter(
+                hora_inicio__isnull=True, fecha_inicio__lte=turno.fecha, fecha_fin__gte=turno.fecha,
+            ).exists()
+        ]
+        self.assertEqual(bloqueados, [])
+        self.assertTrue(Reseña.objects.filter(servicio__slug__startswith='uno-').exists())
+        # Los rollups quedan como si se hubieran rearmado desde cero.
+        filas = OcupacionDiaria.objects.count()
+        reconstruir_ocupacion()
+        self.assertEqual(OcupacionDiaria.objects.count(), filas)
+
+
+def sembrar_volumen(escala=1):
+    """
+    Negocio Prime con 3 profesionales, 12 clientes y 6 turnos por cliente y ``escala``
+    (historial completado con reseñas, por finalizar, cancelados y próximos).
+    """
+    propietario = crear_usuario('propietario', plan_slug='prime')
+    categoria, _ = Categoria.objects.get_or_create(slug='peluquerias', defaults={'nombre': 'Peluquerías'})
+    servicio = Servicio.objects.create(propietario=propietario, nombre='Peluquería Ñandú', categoria=categoria)
+    servicio.medios_de_pago_aceptados.set(MedioDePago.objects.all())
+    sub_servicios = [
+        SubServicio.objects.create(servicio_padre=servicio, nombre=nombre, duracion=30, precio=precio)
+        for nombre, precio in (('Corte', 100), ('Color', 250), ('Peinado', 80), ('Barba', 60))
+    ]
+    profesionales = []
+    for i in range(3):
+        profesional = Profesional.objects.create(servicio=servicio, nombre=f'Profesional {i}')
+        profesional.sub_servicios_ofrecidos.set(sub_servicios)
+        HorarioLaboral.objects.create(
+            profesional=profesional,
+            lunes=True, martes=True, miercoles=True, jueves=True, viernes=True, sabado=True, domingo=True,
+            horario_apertura=time(9), horario_cierre=time(18),
+        )
+        profesionales.append(profesional)
+    hoy = timezone.localdate()
+    DiaNoDisponible.objects.create(profesional=profesionales[2], fecha_inicio=hoy + timedelta(days=40), motivo='Vacaciones')
+
+    clientes = [crear_usuario(f'cliente{i}') for i in range(12)]
+    # (días desde hoy, estado): pasados y futuros; los futuros arrancan en +2 para no caer en recordatorios.
+    tipos = [(-1, 'completado'), (-1, 'completado'), (-1, 'pendiente'), (-1, 'cancelado'), (2, 'pendiente'), (2, 'confirmado')]
+    turnos = []
+    k = 0
+    for _ in range(escala):
+        for cliente in clientes:
+            for signo, estado in tipos:
+                dias = signo * (abs(signo) + k // 8)
+                turno = Turno.objects.create(
+                    servicio=servicio, profesional=profesionales[k % 3], cliente=cliente,
+                    fecha=hoy + timedelta(days=dias), hora=time(9 + k % 8), duracion_total=30,
+                    estado=estado, medio_de_pago='efectivo',
+                    ingreso_real=Decimal('100') if estado == 'completado' else None,
+                )
+                turno.sub_servicios_solicitados.set(sub_servicios[:1 + k % 2])
+                if estado == 'completado' and k % 2 == 0:
+                    Reseña.objects.create(servicio=servicio, turno=turno, usuario=cliente, calificacion=1 + k % 5)
+                turnos.append(turno)
+                k += 1
+    clientes[0].servicios_favoritos.add(servicio)
+    return SimpleNamespace(
+        propietario=propietario, servicio=servicio, profesionales=profesionales,
+        clientes=clientes, cliente=clientes[0], turnos=turnos,
+        turno_sin_reseña=next(t for t in turnos if t.estado == 'completado' and t.cliente == clientes[0] and not hasattr(t, 'reseña')),
+        turno_pendiente=next(t for t in turnos if t.estado == 'pendiente'),
+    )
+
+
+def nuevo_turno(servicio, cliente, fecha, hora, duracion):
+    return Turno(servicio=servicio, cliente=cliente, fecha=fecha, hora=hora, duracion_total=duracion)
+
+
+class ReservarTurnoTests(TestCase):
+    def setUp(self):
+        self.servicio, self.sub_servicio, self.profesionales = crear_negocio(profesionales=2, buffer_minutos=15)
+        self.cliente = User.objects.create_user('cliente', 'cliente@example.com', 'clave')
+        self.fecha = date.today() + timedelta(days=7)
+        self.profesional = self.profesionales[0]
+
+    def reservar(self, hora, duracion, profesional_ids=None):
+        return reservar_turno(
+            nuevo_turno(self.servicio, self.cliente, self.fecha, hora, duracion),
+            profesional_ids or [self.profesional.id],
+            [self.sub_servicio],
+        )
+
+    def test_rechaza_turno_que_se_pisa_con_uno_mas_largo(self):
+        self.reservar(time(10, 0), 60)
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar(time(10, 15), 30)
+        self.assertEqual(Turno.objects.filter(profesional=self.profesional).count(), 1)
+
+    def test_el_buffer_del_servicio_cuenta_como_ocupado(self):
+        self.reservar(time(10, 0), 60)
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar(time(11, 0), 30)
+        turno = self.reservar(time(11, 15), 30)
+        self.assertEqual(list(turno.sub_servicios_solicitados.all()), [self.sub_servicio])
+
+    def test_fuera_del_horario_laboral(self):
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar(time(17, 45), 30)
+
+    def test_cualquier_profesional_usa_el_que_tiene_el_hueco(self):
+        ids = [p.id for p in self.profesionales]
+        primero = self.reservar(time(10, 0), 60, ids)
+        segundo = self.reservar(time(10, 15), 30, ids)
+        self.assertNotEqual(primero.profesional_id, segundo.profesional_id)
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar(time(10, 30), 30, ids)
+
+
+class CacheSlotsTests(TestCase):
+    """Cada escritura que cambia la disponibilidad invalida los inicios cacheados."""
+
+    def setUp(self):
+        cache.clear()
+        self.servicio, _, profesionales = crear_negocio()
+        self.profesional = profesionales[0]
+        self.cliente = crear_usuario('cliente')
+        self.fecha = date.today() + timedelta(days=3)
+
+    def slots(self, fecha=None):
+        return availability.slots_disponibles(self.profesional, fecha or self.fecha, 30, 0)
+
+    def test_turno_nuevo_y_cancelado(self):
+        self.assertIn('10:00', self.slots())
+        with self.captureOnCommitCallbacks(execute=True):
+            turno = Turno.objects.create(
+                servicio=self.servicio, profesional=self.profesional, cliente=self.cliente,
+                fecha=self.fecha, hora=time(10), duracion_total=30,
+            )
+        self.assertNotIn('10:00', self.slots())
+        with self.captureOnCommitCallbacks(execute=True):
+            turno.estado = 'cancelado'
+            turno.save()
+        self.assertIn('10:00', self.slots())
+
+    def test_bloqueos_y_horario(self):
+        otro_dia = self.fecha + timedelta(days=1)
+        self.assertTrue(self.slots())
+        self.assertTrue(self.slots(otro_dia))
+        with self.captureOnCommitCallbacks(execute=True):
+            bloqueo = DiaNoDisponible.objects.create(profesional=self.profesional, fecha_inicio=self.fecha)
+        self.assertEqual(self.slots(), [])
+
+        # Mover el bloqueo libera el día viejo y bloquea el nuevo.
+        with self.captureOnCommitCallbacks(execute=True):
+            bloqueo.fecha_inicio = otro_dia
+            bloqueo.save()
+        self.assertTrue(self.slots())
+        self.assertEqual(self.slots(otro_dia), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            regla = self.profesional.horarios.get()
+            regla.horario_cierre = time(12)
+            regla.save()
+        self.assertEqual(self.slots()[-1], '11:30')
+
+    def test_version_perdida_no_revive_lo_cacheado(self):
+        self.assertIn('10:00', self.slots())
+        with self.captureOnCommitCallbacks(execute=True):
+            Turno.objects.create(
+                servicio=self.servicio, profesional=self.profesional, cliente=self.cliente,
+                fecha=self.fecha, hora=time(10), duracion_total=30,
+            )
+        # La caché descarta las versiones (o se reinicia el proceso con locmem).
+        cache.delete_many([
+            f'slots:v:s:{self.servicio.id}', f'slots:v:p:{self.profesional.id}',
+            f'slots:v:d:{self.profesional.id}:{self.fecha.isoformat()}',
+        ])
+        self.assertNotIn('10:00', self.slots())
+
+
+class DisponibilidadSlotsTests(TestCase):
+    """``obtener_slots_disponibles`` de un profesional sobre el motor de bitmaps."""
+
+    def setUp(self):
+        cache.clear()
+        self.servicio, _, profesionales = crear_negocio(buffer_minutos=15)
+        self.profesional = profesionales[0]
+        self.regla = self.profesional.horarios.get()
+        self.fecha = date.today() + timedelta(days=7)
+        self.client.force_login(crear_usuario('cliente'))
+
+    def slots(self, fecha=None, duracion=30):
+        respuesta = self.client.get(reverse('obtener_slots_disponibles', args=[self.servicio.id]), {
+            'fecha': (fecha or self.fecha).isoformat(), 'duracion': duracion, 'profesional_id': self.profesional.id,
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['slots']
+
+    def test_jornada_con_descanso(self):
+        self.regla.tiene_descanso = True
+        self.regla.descanso_inicio = time(12)
+        self.regla.descanso_fin = time(13, 10)
+        self.regla.save()
+
+        slots = self.slots()
+        self.assertEqual((slots[0], slots[-1]), ('09:00', '17:25'))
+        self.assertIn('11:30', slots)
+        # Un turno no puede cruzar el descanso; después se alinea al fin del descanso.
+        for hora in ('11:45', '12:00', '12:30', '13:00'):
+            self.assertNotIn(hora, slots)
+        self.assertEqual(slots[slots.index('11:30') + 1:][:2], ['13:10', '13:25'])
+
+    def test_turnos_y_buffer(self):
+        Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesional, cliente=crear_usuario('otro'),
+            fecha=self.fecha, hora=time(10), duracion_total=45, estado='confirmado',
+        )
+        Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesional, cliente=crear_usuario('cancelado'),
+            fecha=self.fecha, hora=time(15), duracion_total=60, estado='cancelado',
+        )
+        slots = self.slots()
+        # 10:00 + 45 min + 15 de buffer ocupa hasta las 11:00; el cancelado no ocupa nada.
+        self.assertIn('09:30', slots)
+        for hora in ('09:45', '10:00', '10:45'):
+            self.assertNotIn(hora, slots)
+        self.assertIn('11:00', slots)
+        self.assertIn('15:00', slots)
+
+    def test_bloqueo_parcial_y_de_dias_enteros(self):
+        DiaNoDisponible.objects.create(
+            profesional=self.profesional, fecha_inicio=self.fecha, hora_inicio=time(15), hora_fin=time(16),
+        )
+        slots = self.slots()
+        self.assertIn('14:30', slots)
+        for hora in ('14:45', '15:00', '15:30'):
+            self.assertNotIn(hora, slots)
+        self.assertIn('16:00', slots)
+
+        otro = self.fecha + timedelta(days=1)
+        DiaNoDisponible.objects.create(profesional=self.profesional, fecha_inicio=otro, fecha_fin=otro + timedelta(days=1))
+        self.assertEqual(self.slots(otro), [])
+        self.assertEqual(self.slots(otro + timedelta(days=1)), [])
+        self.assertTrue(self.slots(otro + timedelta(days=2)))
+
+    def test_varias_reglas_el_mismo_dia(self):
+        self.regla.horario_cierre = time(12)
+        self.regla.save()
+        HorarioLaboral.objects.create(
+            profesional=self.profesional, horario_apertura=time(18, 5), horario_cierre=time(20),
+            **{dia: True for dia in availability.DIAS_SEMANA},
+        )
+        # Una regla inactiva no suma horario.
+        HorarioLaboral.objects.create(
+            profesional=self.profesional, horario_apertura=time(13), horario_cierre=time(17), activo=False,
+            **{dia: True for dia in availability.DIAS_SEMANA},
+        )
+        self.assertEqual(self.slots(duracion=60), [
+            '09:00', '09:15', '09:30', '09:45', '10:00', '10:15', '10:30', '10:45', '11:00',
+            '18:05', '18:20', '18:35', '18:50',
+        ])
+
+    def test_hoy_descarta_los_slots_que_ya_empezaron(self):
+        hoy = date.today()
+        ahora = datetime.combine(hoy, time(10, 7))
+        slots = availability.slots_disponibles(self.profesional, hoy, 30, 15, ahora=ahora)
+        self.assertEqual(slots[0], '10:15')
+        ayer = hoy - timedelta(days=1)
+        self.assertEqual(availability.slots_disponibles(self.profesional, ayer, 30, 15, ahora=ahora), [])
+
+    def test_parametros_invalidos(self):
+        url = reverse('obtener_slots_disponibles', args=[self.servicio.id])
+        otro_servicio = Servicio.objects.create(propietario=self.servicio.propietario, nombre='Otro local')
+        ajeno = Profesional.objects.create(servicio=otro_servicio, nombre='Ajeno')
+        for parametros in (
+            {'fecha': self.fecha.isoformat()},
+            {'fecha': '07/01/2026', 'duracion': 30},
+            {'fecha': self.fecha.isoformat(), 'duracion': 'media hora'},
+            {'fecha': self.fecha.isoformat(), 'duracion': 30, 'profesional_id': ajeno.id},
+        ):
+            self.assertEqual(self.client.get(url, parametros).status_code, 400, parametros)
+
+    def test_ventanas_libres_igual_que_recorrer_minuto_a_minuto(self):
+        azar = random.Random(1)
+        for _ in range(50):
+            libres = 0
+            for _ in range(azar.randint(1, 6)):
+                inicio = azar.randrange(availability.MINUTOS_DIA)
+                libres |= availability.mascara_rango(inicio, inicio + azar.randint(1, 300))
+            duracion = azar.randint(1, 240)
+            esperado = sum(
+                1 << minuto for minuto in range(availability.MINUTOS_DIA - duracion + 1)
+                if all(libres >> m & 1 for m in range(minuto, minuto + duracion))
+            )
+            self.assertEqual(availability.ventanas_libres(libres, duracion), esperado)
+
+
+class RangoSlotsTests(TestCase):
+    """``obtener_slots_rango``: todo el calendario en una respuesta y con consultas fijas."""
+
+    def setUp(self):
+        cache.clear()
+        self.servicio, _, self.profesionales = crear_negocio(profesionales=2)
+        self.desde = date.today() + timedelta(days=1)
+        self.client.force_login(crear_usuario('cliente'))
+
+    def pedir(self, dias, profesional_id=None, **extra):
+        return self.client.get(reverse('obtener_slots_rango', args=[self.servicio.id]), {
+            'desde': self.desde.isoformat(),
+            'hasta': (self.desde + timedelta(days=dias - 1)).isoformat(),
+            'duracion': 30,
+            'profesional_id': profesional_id or ','.join(str(p.id) for p in self.profesionales),
+            **extra,
+        })
+
+    def test_un_dia_por_fecha_y_por_profesional(self):
+        uno, dos = self.profesionales
+        fecha = self.desde + timedelta(days=2)
+        Turno.objects.create(
+            servicio=self.servicio, profesional=uno, cliente=crear_usuario('otro'),
+            fecha=fecha, hora=time(10), duracion_total=30, estado='confirmado',
+        )
+        for profesional in self.profesionales:
+            DiaNoDisponible.objects.create(profesional=profesional, fecha_inicio=self.desde + timedelta(days=4))
+
+        dias = self.pedir(7).json()['dias']
+        self.assertEqual(list(dias), [(self.desde + timedelta(days=i)).isoformat() for i in range(7)])
+        del_turno = dias[fecha.isoformat()]['slots']
+        self.assertNotIn('10:00', del_turno[str(uno.id)])
+        self.assertIn('10:00', del_turno[str(dos.id)])
+        self.assertIn('10:00', dias[self.desde.isoformat()]['slots'][str(uno.id)])
+        bloqueado = dias[(self.desde + timedelta(days=4)).isoformat()]
+        self.assertEqual(bloqueado, {'slots': {str(uno.id): [], str(dos.id): []}, 'disponible': False})
+
+    def test_consultas_fijas_sin_importar_el_largo(self):
+        consultas = []
+        for dias in (1, 7, availability.MAX_DIAS_RANGO):
+            cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.pedir(dias)
+            self.assertEqual(len(respuesta.json()['dias']), dias)
+            consultas.append(len(capturadas))
+        self.assertEqual(len(set(consultas)), 1, consultas)
+
+        # Con la caché caliente no vuelve a leer reglas, bloqueos ni turnos.
+        with CaptureQueriesContext(connection) as capturadas:
+            self.pedir(availability.MAX_DIAS_RANGO)
+        tablas = ('myapp_horariolaboral', 'myapp_dianodisponible', 'myapp_turno')
+        self.assertFalse([q['sql'] for q in capturadas.captured_queries if any(t in q['sql'] for t in tablas)])
+
+    def test_tope_de_dias_y_parametros_invalidos(self):
+        self.assertEqual(self.pedir(availability.MAX_DIAS_RANGO).status_code, 200)
+        self.assertEqual(self.pedir(availability.MAX_DIAS_RANGO + 1).status_code, 400)
+        self.assertEqual(self.pedir(0).status_code, 400)
+
+        otro_servicio = Servicio.objects.create(propietario=self.servicio.propietario, nombre='Otro local')
+        ajeno = Profesional.objects.create(servicio=otro_servicio, nombre='Ajeno')
+        self.assertEqual(self.pedir(7, profesional_id=f'{self.profesionales[0].id},{ajeno.id}').status_code, 400)
+        self.assertEqual(self.pedir(7, profesional_id='uno').status_code, 400)
+        self.assertEqual(self.pedir(7, duracion='media hora').status_code, 400)
+        self.assertEqual(self.pedir(7, desde='mañana').status_code, 400)
+
+
+class CualquierProfesionalTests(TestCase):
+    """Unión de los candidatos ("cualquiera") y asignación del menos cargado al reservar."""
+
+    def setUp(self):
+        cache.clear()
+        self.servicio, self.corte, (self.uno, self.dos, self.inactivo) = crear_negocio(profesionales=3)
+        self.color = SubServicio.objects.create(servicio_padre=self.servicio, nombre='Color', duracion=30, precio=200)
+        # uno: mañana, sin sub-servicios cargados (ofrece todo). dos: tarde, sólo corte.
+        self.uno.horarios.update(horario_cierre=time(13))
+        self.dos.horarios.update(horario_apertura=time(14))
+        self.dos.sub_servicios_ofrecidos.set([self.corte])
+        self.inactivo.activo = False
+        self.inactivo.save()
+        self.fecha = date.today() + timedelta(days=7)
+        self.cliente = crear_usuario('cliente')
+        self.client.force_login(self.cliente)
+
+    def slots(self, **parametros):
+        respuesta = self.client.get(
+            reverse('obtener_slots_disponibles', args=[self.servicio.id]),
+            {'fecha': self.fecha.isoformat(), 'duracion': 30, **parametros},
+        )
+        return respuesta.json()['slots']
+
+    def test_union_de_los_que_ofrecen_lo_pedido(self):
+        union = self.slots()
+        self.assertEqual(union, self.slots(profesional_id='cualquiera'))
+        self.assertEqual((union[0], union[-1]), ('09:00', '17:30'))
+        self.assertIn('12:30', union)
+        # Nadie activo tiene 13:00-14:00 (el inactivo sí, pero no cuenta).
+        self.assertNotIn('13:00', union)
+        self.assertNotIn('13:30', union)
+
+        solo_color = self.slots(sub_servicios=f'{self.color.id}')
+        self.assertEqual(solo_color[-1], '12:30')
+        self.assertEqual(self.slots(sub_servicios=f'{self.corte.id},{self.color.id}'), solo_color)
+
+        dias = self.client.get(reverse('obtener_slots_rango', args=[self.servicio.id]), {
+            'desde': self.fecha.isoformat(), 'hasta': self.fecha.isoformat(), 'duracion': 30,
+            'profesional_id': f'cualquiera,{self.dos.id}',
+        }).json()['dias']
+        slots = dias[self.fecha.isoformat()]['slots']
+        self.assertEqual(set(slots), {'cualquiera', str(self.dos.id)})
+        self.assertEqual(slots['cualquiera'], union)
+        self.assertEqual(slots[str(self.dos.id)][0], '14:00')
+
+    def reservar(self, hora, sub_servicio=None):
+        sub_servicio = sub_servicio or self.corte
+        candidatos = availability.profesionales_candidatos(self.servicio, [sub_servicio.id])
+        turno = nuevo_turno(self.servicio, self.cliente, self.fecha, hora, 30)
+        return reservar_turno(turno, candidatos, [sub_servicio]).profesional
+
+    def test_asigna_al_menos_cargado_que_tiene_el_hueco(self):
+        self.dos.horarios.update(horario_apertura=time(9))
+        Turno.objects.create(
+            servicio=self.servicio, profesional=self.uno, cliente=crear_usuario('otro'),
+            fecha=self.fecha, hora=time(9), duracion_total=60, estado='confirmado',
+        )
+        self.assertEqual(self.reservar(time(10)), self.dos)
+        self.assertEqual(self.reservar(time(11)), self.dos)
+        # Empatados en 60 minutos: el de menor id.
+        self.assertEqual(self.reservar(time(12)), self.uno)
+        # Sólo uno hace color, aunque esté más cargado; a la tarde sólo atiende dos.
+        self.assertEqual(self.reservar(time(12, 30), self.color), self.uno)
+        self.assertEqual(self.reservar(time(15)), self.dos)
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar(time(15), self.color)
+
+
+class OcupacionDiariaTests(TestCase):
+    campos = (
+        'servicio_id', 'profesional_id', 'fecha', 'minutos_reservados', 'minutos_capacidad',
+        'conteo_pendiente', 'conteo_confirmado', 'conteo_rechazado', 'conteo_cancelado', 'conteo_completado',
+    )
+
+    def setUp(self):
+        self.servicio, _, self.profesionales = crear_negocio(profesionales=2)
+        self.cliente = User.objects.create_user('cliente', 'cliente@example.com', 'clave')
+        self.fecha = date.today() + timedelta(days=7)
+
+    def filas(self):
+        return sorted(OcupacionDiaria.objects.values_list(*self.campos), key=str)
+
+    def assertIgualAReconstruir(self):
+        incremental = self.filas()
+        reconstruir_ocupacion()
+        self.assertEqual(incremental, self.filas())
+
+    def test_altas_y_cambios_de_estado(self):
+        turno = Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesionales[0], cliente=self.cliente,
+            fecha=self.fecha, hora=time(10), duracion_total=60,
+        )
+        fila = OcupacionDiaria.objects.get()
+        self.assertEqual((fila.minutos_reservados, fila.minutos_capacidad, fila.conteo_pendiente), (60, 540, 1))
+
+        turno.estado = 'cancelado'
+        turno.save()
+        fila = OcupacionDiaria.objects.get()
+        self.assertEqual((fila.minutos_reservados, fila.conteo_pendiente, fila.conteo_cancelado), (0, 0, 1))
+        self.assertIgualAReconstruir()
+
+    def test_mover_turno_y_cambiar_horario(self):
+        turno = Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesionales[0], cliente=self.cliente,
+            fecha=self.fecha, hora=time(10), duracion_total=30, estado='confirmado',
+        )
+        turno.profesional = self.profesionales[1]
+        turno.fecha = self.fecha + timedelta(days=1)
+        turno.save()
+        self.assertEqual(OcupacionDiaria.objects.get().profesional_id, self.profesionales[1].id)
+
+        regla = self.profesionales[1].horarios.get()
+        regla.horario_cierre = time(13)
+        regla.save()
+        self.assertEqual(OcupacionDiaria.objects.get().minutos_capacidad, 240)
+
+        self.profesionales[1].delete()
+        self.assertIsNone(OcupacionDiaria.objects.get().profesional_id)
+        self.assertIgualAReconstruir()
+
+    def test_borrar_la_regla_deja_sin_capacidad(self):
+        Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesionales[0], cliente=self.cliente,
+            fecha=self.fecha, hora=time(10), duracion_total=30,
+        )
+        self.profesionales[0].horarios.get().delete()
+        self.assertEqual(OcupacionDiaria.objects.get().minutos_capacidad, 0)
+        self.assertIgualAReconstruir()
+
+    def test_sin_profesional_una_fila_por_dia(self):
+        OcupacionDiaria.objects.create(servicio=self.servicio, fecha=self.fecha)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OcupacionDiaria.objects.create(servicio=self.servicio, fecha=self.fecha)
+
+    def test_turnos_del_dia_no_dependen_del_resumen(self):
+        Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesionales[0], cliente=self.cliente,
+            fecha=self.fecha, hora=time(10), duracion_total=30,
+        )
+        # Resumen desincronizado: el listado igual sale de Turno.
+        OcupacionDiaria.objects.all().delete()
+        cache.clear()
+        propietario = self.servicio.propietario
+        propietario.perfil.email_verified = True
+        propietario.perfil.save()
+        self.client.force_login(propietario)
+        respuesta = self.client.get(reverse('api_turnos_por_dia'), {'fecha': self.fecha.isoformat()})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([t['hora'] for t in respuesta.json()['turnos']], ['10:00'])
+
+
+class CalendarioMesTests(TestCase):
+    """``dashboard_calendario``: navegación con ``?mes=`` y ocupación del mes pedido."""
+
+    def setUp(self):
+        cache.clear()
+        self.servicio, _, self.profesionales = crear_negocio(profesionales=2)
+        propietario = self.servicio.propietario
+        propietario.perfil.email_verified = True
+        propietario.perfil.save()
+        self.client.force_login(propietario)
+
+    def contexto(self, mes=None):
+        respuesta = self.client.get(reverse('dashboard_calendario'), {'mes': mes} if mes is not None else {})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.context
+
+    def test_navega_entre_meses(self):
+        contexto = self.contexto('2028-02')
+        self.assertEqual((contexto['año'], contexto['calendar_data']['mes']), (2028, 2))
+        self.assertEqual(len(contexto['rango_dias']), 29)
+        self.assertEqual(len(contexto['offset_dias']), 1)  # 1/2/2028 es martes.
+        self.assertEqual((contexto['mes_anterior'], contexto['mes_siguiente']), ('2028-01', '2028-03'))
+        self.assertFalse(contexto['es_mes_actual'])
+
+        self.assertEqual(self.contexto('2028-01')['mes_anterior'], '2027-12')
+        self.assertEqual(self.contexto('2027-12')['mes_siguiente'], '2028-01')
+
+    def test_mes_invalido_muestra_el_actual(self):
+        hoy = timezone.localdate()
+        for mes in (None, '', 'marzo', '2028', '2028-13', '2028-00', '2028-02-01', '0-05'):
+            contexto = self.contexto(mes)
+            self.assertEqual((contexto['año'], contexto['calendar_data']['mes']), (hoy.year, hoy.month), mes)
+            self.assertTrue(contexto['es_mes_actual'])
+
+    def test_ocupacion_del_mes_pedido(self):
+        fecha = date(2028, 3, 15)
+        for profesional, hora in ((self.profesionales[0], time(10)), (self.profesionales[1], time(11))):
+            Turno.objects.create(
+                servicio=self.servicio, profesional=profesional, cliente=crear_usuario(f'cliente{profesional.id}'),
+                fecha=fecha, hora=hora, duracion_total=60, estado='confirmado',
+            )
+        dias = self.contexto('2028-03')['estado_dias']
+        self.assertEqual(len(dias), 31)
+        self.assertEqual(
+            (dias[15]['conteo'], dias[15]['minutos_reservados'], dias[15]['minutos_capacidad']), (2, 120, 1080),
+        )
+        self.assertEqual((dias[16]['conteo'], dias[16]['minutos_reservados']), (0, 0))
+        # El mismo día de otro mes no se cuela.
+        self.assertEqual(self.contexto('2028-04')['estado_dias'][15]['conteo'], 0)
+
+
+class MetricasDiariasTests(TestCase):
+    """IngresoDiario y SubServicioDiario contra la agregación en crudo de Turno (``check_metrics``)."""
+
+    def setUp(self):
+        self.servicio, self.sub_servicio, self.profesionales = crear_negocio(profesionales=2)
+        self.servicio.medios_de_pago_aceptados.set(
+            MedioDePago.objects.filter(slug__in=('efectivo', 'transferencia')),
+        )
+        propietario = self.servicio.propietario
+        propietario.perfil.email_verified = True
+        propietario.perfil.save()
+        self.client.force_login(propietario)
+        self.fecha = date.today() - timedelta(days=1)
+        self.turno = self.crear_turno(time(10))
+
+    def crear_turno(self, hora, **campos):
+        turno = Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesionales[0], cliente=crear_usuario(f'cliente{hora.hour}'),
+            fecha=self.fecha, hora=hora, duracion_total=30, estado='confirmado', **campos,
+        )
+        turno.sub_servicios_solicitados.set([self.sub_servicio])
+        return turno
+
+    def finalizar(self, turno, ingreso, medio):
+        respuesta = self.client.post(
+            reverse('finalizar_turno', args=[turno.id]), {'ingreso_real': ingreso, 'medio_de_pago_final': medio},
+        )
+        self.assertRedirects(respuesta, reverse('dashboard_turnos'), fetch_redirect_response=False)
+        turno.refresh_from_db()
+
+    def ingresos(self):
+        return sorted(IngresoDiario.objects.values_list('profesional_id', 'medio_de_pago_final', 'ingresos', 'turnos'))
+
+    def assertCoincideConTurno(self):
+        self.assertEqual(diferencias_metricas(), [])
+        salida = StringIO()
+        call_command('check_metrics', stdout=salida)
+        self.assertIn('coinciden', salida.getvalue())
+
+    def test_finalizar_editar_y_borrar(self):
+        self.assertFalse(IngresoDiario.objects.exists())
+        profesional_id = self.profesionales[0].id
+
+        self.finalizar(self.turno, '150.00', 'efectivo')
+        self.assertEqual(self.ingresos(), [(profesional_id, 'efectivo', Decimal('150.00'), 1)])
+        self.assertEqual(SubServicioDiario.objects.get().cantidad, 1)
+        self.assertCoincideConTurno()
+
+        # Editar el ingreso y el medio mueve la fila de medio de pago.
+        self.finalizar(self.turno, '200.00', 'transferencia')
+        self.assertEqual(self.ingresos(), [(profesional_id, 'transferencia', Decimal('200.00'), 1)])
+        self.assertCoincideConTurno()
+
+        otro = self.crear_turno(time(11))
+        self.finalizar(otro, '50.00', 'transferencia')
+        self.assertEqual(self.ingresos(), [(profesional_id, 'transferencia', Decimal('250.00'), 2)])
+        self.assertEqual(SubServicioDiario.objects.get().cantidad, 2)
+
+        self.turno.delete()
+        self.assertEqual(self.ingresos(), [(profesional_id, 'transferencia', Decimal('50.00'), 1)])
+        self.assertEqual(SubServicioDiario.objects.get().cantidad, 1)
+        self.assertCoincideConTurno()
+
+    def test_salir_de_completado_sub_servicios_y_profesional(self):
+        self.finalizar(self.turno, '100.00', 'efectivo')
+        extra = SubServicio.objects.create(servicio_padre=self.servicio, nombre='Color', duracion=30, precio=300)
+        self.turno.sub_servicios_solicitados.add(extra)
+        self.assertEqual(SubServicioDiario.objects.count(), 2)
+
+        self.turno.profesional = self.profesionales[1]
+        self.turno.save()
+        self.assertEqual(set(IngresoDiario.objects.values_list('profesional_id', flat=True)), {self.profesionales[1].id})
+        self.assertCoincideConTurno()
+
+        self.profesionales[1].delete()
+        self.assertIsNone(IngresoDiario.objects.get().profesional_id)
+        self.assertCoincideConTurno()
+
+        self.turno.refresh_from_db()
+        self.turno.estado = 'cancelado'
+        self.turno.save()
+        self.assertFalse(IngresoDiario.objects.exists())
+        self.assertFalse(SubServicioDiario.objects.exists())
+        self.assertCoincideConTurno()
+
+    def test_check_metrics_detecta_y_repara(self):
+        self.finalizar(self.turno, '100.00', 'efectivo')
+        IngresoDiario.objects.update(ingresos=Decimal('1.00'))
+        SubServicioDiario.objects.all().delete()
+        salida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_metrics', stdout=salida)
+        self.assertIn('esperado=', salida.getvalue())
+
+        call_command('check_metrics', reparar=True, stdout=StringIO())
+        self.assertEqual(IngresoDiario.objects.get().ingresos, Decimal('100.00'))
+        self.assertCoincideConTurno()
+
+    def test_sin_profesional_una_fila_por_clave(self):
+        IngresoDiario.objects.create(servicio=self.servicio, fecha=self.fecha)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            IngresoDiario.objects.create(servicio=self.servicio, fecha=self.fecha)
+
+
+class MetricasGraficoCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.servicio, self.sub_servicio, self.profesionales = crear_negocio()
+        self.servicio.medios_de_pago_aceptados.set(MedioDePago.objects.filter(slug='efectivo'))
+        propietario = self.servicio.propietario
+        propietario.perfil.email_verified = True
+        propietario.perfil.save()
+        self.client.force_login(propietario)
+        self.fecha = date.today() - timedelta(days=1)
+        self.turno = Turno.objects.create(
+            servicio=self.servicio, profesional=self.profesionales[0], cliente=crear_usuario('cliente'),
+            fecha=self.fecha, hora=time(10), duracion_total=30, estado='completado',
+            ingreso_real=Decimal('100.00'), medio_de_pago_final='efectivo',
+        )
+
+    def grafico(self, etag=None, **parametros):
+        cabeceras = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('api_metricas_grafico'), parametros, **cabeceras)
+
+    def test_etag_304_e_invalidacion_al_editar(self):
+        parametros = {'agrupar_por': 'mes', 'mes': self.fecha.strftime('%Y-%m')}
+        respuesta = self.grafico(**parametros)
+        self.assertEqual(respuesta.json()['datasets'][0]['data'], [100.0])
+        etag = respuesta['ETag']
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.grafico(etag, **parametros).status_code, 304)
+        self.assertFalse([c for c in consultas.captured_queries if 'ingresodiario' in c['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.turno.ingreso_real = Decimal('250.00')
+            self.turno.save()
+        respuesta = self.grafico(etag, **parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.json()['datasets'][0]['data'], [250.0])
+
+        # Otro mes no cambia: su ETag sigue sirviendo.
+        otro = {'agrupar_por': 'mes', 'mes': (self.fecha.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')}
+        etag_otro = self.grafico(**otro)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.turno.ingreso_real = Decimal('300.00')
+            self.turno.save()
+        self.assertEqual(self.grafico(etag_otro, **otro).status_code, 304)
+
+    def test_cambiar_la_hora_invalida_el_grafico_por_hora(self):
+        parametros = {'agrupar_por': 'dia', 'fecha': self.fecha.isoformat()}
+        respuesta = self.grafico(**parametros)
+        self.assertEqual(respuesta.json()['labels'], ['10:00 hs'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.turno.hora = time(15)
+            self.turno.save()
+        respuesta = self.grafico(respuesta['ETag'], **parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['labels'], ['15:00 hs'])
+
+    def test_misses_concurrentes_calculan_una_vez(self):
+        calculos = []
+
+        def calcular():
+            calculos.append(1)
+            sleep(0.2)
+            return {'ok': True}
+
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(obtener_o_calcular('prueba:juntar', calcular, 60)))
+            for _ in range(5)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(calculos), 1)
+        self.assertEqual(resultados, [{'ok': True}] * 5)
+
+    def test_esperar_a_otro_proceso_no_traba_la_franja(self):
+        # Otro proceso está calculando 'prueba:a' (tiene la marca).
+        cache.add('prueba:a:calculando', 1, 60)
+        franja = hash('prueba:a') % 32
+        vecina = next(f'prueba:b{i}' for i in range(1000) if hash(f'prueba:b{i}') % 32 == franja)
+        resultados = []
+        hilo = threading.Thread(
+            target=lambda: resultados.append(obtener_o_calcular('prueba:a', lambda: 'propio', 60, espera=5)),
+        )
+        hilo.start()
+        sleep(0.1)
+        inicio = perf_counter()
+        self.assertEqual(obtener_o_calcular(vecina, lambda: 'vecina', 60), 'vecina')
+        self.assertLess(perf_counter() - inicio, 0.5)
+
+        # Termina el otro proceso: el que esperaba usa su resultado sin calcular.
+        cache.set('prueba:a', 'del otro', 60)
+        hilo.join(5)
+        self.assertEqual(resultados, ['del otro'])
+
+
+class EstadoUsuarioTests(TestCase):
+    tablas_estado = ('myapp_suscripcion', 'myapp_perfilusuario', 'socialaccount_socialaccount')
+
+    def setUp(self):
+        cache.clear()
+        self.servicio, _, _ = crear_negocio()
+        self.propietario = self.servicio.propietario
+        self.propietario.perfil.email_verified = True
+        self.propietario.perfil.save()
+        self.client.force_login(self.propietario)
+
+    def consultas_dashboard(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('dashboard_turnos'))
+        self.assertEqual(respuesta.status_code, 200)
+        return [c['sql'] for c in consultas.captured_queries]
+
+    def de_estado(self, consultas):
+        # Los listados de turnos traen cliente__perfil (teléfono) con JOIN: no son del estado de cuenta.
+        return [
+            sql for sql in consultas
+            if any(tabla in sql for tabla in self.tablas_estado) and 'FROM "myapp_turno"' not in sql
+        ]
+
+    def test_middlewares_y_context_processors_comparten_una_consulta(self):
+        # Antes: exists() de Suscripcion, SocialAccount, perfil y Suscripcion+Plan por cada context processor.
+        primera = self.consultas_dashboard()
+        self.assertEqual(len(self.de_estado(primera)), 1)
+
+        segunda = self.consultas_dashboard()
+        self.assertEqual(self.de_estado(segunda), [])
+        self.assertEqual(len(segunda), len(primera) - 1)
+
+    def test_cambio_de_plan_invalida_estado_y_capacidades(self):
+        self.assertEqual(estado_de_usuario(self.propietario.pk).plan_slug, 'free')
+        self.assertFalse(self.servicio.permite_multiples_profesionales)
+        suscripcion = self.propietario.suscripcion
+        suscripcion.plan = Plan.objects.get(slug='prime')
+        suscripcion.is_active = True
+        with self.captureOnCommitCallbacks(execute=True):
+            suscripcion.save()
+        self.assertEqual(estado_de_usuario(self.propietario.pk).plan_slug, 'prime')
+        with self.assertNumQueries(0):
+            self.assertTrue(self.servicio.permite_multiples_profesionales)
+            self.assertTrue(capacidades(self.propietario.pk).emails_propietario)
+
+    def test_capacidades_se_resuelven_una_vez_por_request(self):
+        cliente = crear_usuario('cliente')
+        for i in range(5):
+            Turno.objects.create(
+                servicio=self.servicio, profesional=self.servicio.profesionales.first(), cliente=cliente,
+                fecha=date.today() + timedelta(days=1), hora=time(9 + i), duracion_total=30, estado='confirmado',
+            )
+        self.consultas_dashboard()
+        with mock.patch('myapp.entitlements.user_state.version_usuario', wraps=user_state.version_usuario) as version:
+            respuesta = self.client.get(reverse('dashboard_turnos'))
+        self.assertContains(respuesta, 'data-es-prime="false"', count=5)
+        # La del estado de la request; ni el layout ni cada fila vuelven a mirar la caché.
+        self.assertEqual(version.call_count, 1)
+
+    def test_memo_del_proceso_vence(self):
+        olvidar_capacidades()
+        with override_settings(CAPACIDADES_MEMO_SECONDS=60):
+            self.assertEqual(capacidades(self.propietario.pk).plan_slug, 'free')
+            with mock.patch('myapp.entitlements.user_state.version_usuario') as version:
+                capacidades(self.propietario.pk)
+            version.assert_not_called()
+
+            # Cambio hecho en otro proceso: acá no corre la señal, sólo sube la versión compartida.
+            Suscripcion.objects.filter(usuario=self.propietario).update(
+                plan=Plan.objects.get(slug='prime'), is_active=True,
+            )
+            cache.set(f'usuario:v:{self.propietario.pk}', time_ns(), None)
+            self.assertEqual(capacidades(self.propietario.pk).plan_slug, 'free')
+            with mock.patch('myapp.entitlements.time.monotonic', return_value=monotonic() + 61):
+                self.assertEqual(capacidades(self.propietario.pk).plan_slug, 'prime')
+
+
+class SchedulerRecordatoriosTests(TestCase):
+    def setUp(self):
+        servicio, _, profesionales = crear_negocio()
+        self.cliente = crear_usuario('cliente')
+        self.ahora = timezone.now().replace(microsecond=0)
+        self.inicio = timezone.localtime(self.ahora + timedelta(hours=2)).replace(second=0)
+        self.turno = Turno.objects.create(
+            servicio=servicio, profesional=profesionales[0], cliente=self.cliente, estado='confirmado',
+            fecha=self.inicio.date(), hora=self.inicio.time(), duracion_total=30,
+        )
+        self.otro = Turno.objects.create(
+            servicio=servicio, profesional=profesionales[0], cliente=self.cliente, estado='confirmado',
+            fecha=self.inicio.date(), hora=(self.inicio + timedelta(minutes=30)).time(), duracion_total=30,
+        )
+
+    def test_carga_una_vez_sigue_los_cambios_y_dispara_en_el_momento(self):
+        scheduler = Scheduler(recarga=7200)
+        self.assertEqual(scheduler.paso(self.ahora), [])
+        self.assertEqual(len(scheduler.agenda), 2)
+        self.assertEqual(scheduler.agenda.proximo(), self.inicio - timedelta(minutes=15))
+
+        # Se corre 10 minutos y el otro se cancela: el sondeo sólo lee esos dos turnos.
+        self.turno.hora = (self.inicio + timedelta(minutes=10)).time()
+        self.turno.save()
+        self.otro.estado = 'cancelado'
+        self.otro.save()
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(scheduler.paso(self.ahora + timedelta(seconds=5)), [])
+        self.assertEqual(len(consultas), 1)
+        self.assertNotIn(self.otro.id, scheduler.agenda)
+        momento = self.inicio - timedelta(minutes=5)
+        self.assertEqual(scheduler.agenda.proximo(), momento)
+
+        self.assertEqual(scheduler.paso(momento - timedelta(seconds=1)), [])
+        self.assertEqual(scheduler.paso(momento), [self.turno.id])
+        self.turno.refresh_from_db()
+        self.assertTrue(self.turno.recordatorio_enviado)
+        self.assertEqual(Tarea.objects.get().argumentos, {'turno_id': self.turno.id})
+        self.assertEqual(len(scheduler.agenda), 0)
+
+    def test_no_dispara_lo_que_ya_mando_el_cron(self):
+        scheduler = Scheduler(recarga=7200)
+        scheduler.paso(self.ahora)
+        Turno.objects.filter(pk=self.turno.pk).update(recordatorio_enviado=True)
+        self.assertEqual(scheduler.paso(self.inicio - timedelta(minutes=15)), [])
+        self.assertFalse(Tarea.objects.exists())
+
+
+class EnvioRecordatoriosTests(TestCase):
+    def setUp(self):
+        servicio, _, profesionales = crear_negocio()
+        ahora = timezone.localtime().replace(second=0, microsecond=0)
+        self.turnos = []
+        for i, minutos in enumerate((14, 15, 16, 40)):
+            inicio = ahora + timedelta(minutes=minutos)
+            self.turnos.append(Turno.objects.create(
+                servicio=servicio, profesional=profesionales[0], cliente=crear_usuario(f'cliente{i}'),
+                estado='confirmado', fecha=inicio.date(), hora=inicio.time(), duracion_total=1,
+            ))
+
+    def test_toma_cada_turno_antes_de_mandar_y_no_reenvia_los_fallidos(self):
+        def enviar(destinatario, *args, **kwargs):
+            return destinatario != 'cliente1@example.com'
+
+        salida = StringIO()
+        with mock.patch('myapp.reminders.send_email_with_fallback', side_effect=enviar) as enviar_mock:
+            with CaptureQueriesContext(connection) as consultas:
+                call_command('send_reminders', concurrencia=1, lote=2, stdout=salida)
+        self.assertEqual(enviar_mock.call_count, 3)
+        self.assertIn('Procesados recordatorios: 2', salida.getvalue())
+        self.assertIn('Candidatos: 3 | fallidos: 1', salida.getvalue())
+        marcados = [t.recordatorio_enviado for t in Turno.objects.order_by('id')]
+        # El que falló queda tomado (lo reintenta EmailFailureLog); el de +40 min todavía no entra.
+        self.assertEqual(marcados, [True, True, True, False])
+        updates = [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('UPDATE "myapp_turno"')]
+        # Un UPDATE condicional por turno y ninguno más.
+        self.assertEqual(len(updates), 3)
+
+        # La corrida siguiente no vuelve a mandar nada.
+        with mock.patch('myapp.reminders.send_email_with_fallback') as enviar_mock:
+            call_command('send_reminders', concurrencia=1, stdout=StringIO())
+        enviar_mock.assert_not_called()
+
+    def test_no_manda_lo_que_el_scheduler_disparo_despues_de_leer(self):
+        candidatos_cron = reminders.candidatos_cron
+
+        def leer_y_disparar(ahora):
+            candidatos = candidatos_cron(ahora)
+            # El scheduler dispara el primero entre la lectura del cron y el envío.
+            self.assertTrue(disparar(self.turnos[0].id, self.turnos[0].inicio_en_timezone() - timedelta(minutes=5)))
+            return candidatos
+
+        with mock.patch('myapp.reminders.candidatos_cron', side_effect=leer_y_disparar), \
+                mock.patch('myapp.reminders.send_email_with_fallback', return_value=True) as enviar_mock:
+            contadores = enviar_recordatorios_pendientes(concurrencia=1)
+        destinatarios = [llamada.args[0] for llamada in enviar_mock.call_args_list]
+        self.assertNotIn('cliente0@example.com', destinatarios)
+        self.assertEqual((contadores['enviados'], contadores['omitidos']), (2, 1))
+        self.assertEqual(Tarea.objects.filter(nombre='recordatorios.enviar').count(), 1)
+
+    def test_con_el_scheduler_vivo_el_cron_solo_levanta_atrasados(self):
+        lease = adquirir(reminders.CANDADO_SCHEDULER)
+        ids = sorted(turno.id for turno in reminders.candidatos_cron(timezone.now()))
+        # +14 y +15 ya debieron dispararse; +16 todavía le toca al scheduler.
+        self.assertEqual(ids, [turno.id for turno in self.turnos[:2]])
+        lease.liberar()
+        ids = sorted(turno.id for turno in reminders.candidatos_cron(timezone.now()))
+        self.assertEqual(ids, [turno.id for turno in self.turnos[:3]])
+
+
+@override_settings(REMINDER_CRON_SECRET='secreto')
+class CronRecordatoriosHttpTests(TestCase):
+    def test_responde_202_sin_mandar_y_expone_el_progreso(self):
+        servicio, _, profesionales = crear_negocio()
+        inicio = timezone.localtime().replace(second=0, microsecond=0) + timedelta(minutes=15)
+        Turno.objects.create(
+            servicio=servicio, profesional=profesionales[0], cliente=crear_usuario('cliente'),
+            estado='confirmado', fecha=inicio.date(), hora=inicio.time(), duracion_total=1,
+        )
+        url = reverse('cron_send_reminders')
+        with mock.patch('myapp.reminders.send_email_with_fallback', return_value=True) as enviar:
+            respuesta = self.client.post(url, HTTP_X_CRON_SECRET='secreto')
+            self.assertEqual(respuesta.status_code, 202)
+            enviar.assert_not_called()
+            datos = respuesta.json()
+            self.assertEqual((datos['estado'], datos['nueva']), (CorridaRecordatorios.PENDIENTE, True))
+            self.assertEqual(respuesta['Location'], datos['estado_url'])
+
+            # Un segundo disparo mientras la primera sigue activa no encola otra.
+            repetido = self.client.post(url, {'secret': 'secreto'}).json()
+            self.assertEqual((repetido['corrida'], repetido['nueva']), (datos['corrida'], False))
+            self.assertEqual(Tarea.objects.filter(nombre='recordatorios.corrida').count(), 1)
+
+            procesar_lote(10)
+        self.assertEqual(enviar.call_count, 1)
+
+        estado = self.client.get(datos['estado_url'], HTTP_X_CRON_SECRET='secreto').json()
+        self.assertEqual(estado['estado'], CorridaRecordatorios.HECHA)
+        self.assertEqual((estado['procesados'], estado['enviados'], estado['fallidos']), (1, 1, 0))
+        self.assertIsNotNone(estado['duracion_segundos'])
+        self.assertEqual(self.client.get(datos['estado_url']).status_code, 403)
+
+        # Terminada la anterior, el próximo disparo crea una nueva.
+        self.assertTrue(self.client.post(url, {'secret': 'secreto'}).json()['nueva'])
+
+    def test_omitida_si_send_reminders_ya_esta_corriendo_y_descarta_las_colgadas(self):
+        url = reverse('cron_send_reminders')
+        colgada = self.client.post(url, {'secret': 'secreto'}).json()['corrida']
+        CorridaRecordatorios.objects.filter(pk=colgada).update(creada=timezone.now() - timedelta(hours=2))
+        corrida = self.client.post(url, {'secret': 'secreto'}).json()['corrida']
+        self.assertNotEqual(corrida, colgada)
+        self.assertEqual(CorridaRecordatorios.objects.get(pk=colgada).estado, CorridaRecordatorios.FALLIDA)
+
+        with candado('send_reminders'):
+            procesar_lote(10)
+        self.assertEqual(CorridaRecordatorios.objects.get(pk=corrida).estado, CorridaRecordatorios.OMITIDA)
+
+
+class WebhookMercadoPagoTests(TestCase):
+    def setUp(self):
+        self.mp = FakeMercadoPago().iniciar()
+        self.addCleanup(self.mp.cerrar)
+        self.addCleanup(mp_gateway.cerrar)
+        ajustes = override_settings(MERCADOPAGO_API_URL=self.mp.url, MERCADOPAGO_WEBHOOK_DEMORA_SECONDS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.usuario = crear_usuario('pagador', plan_slug='prime')
+        self.suscripcion = self.usuario.suscripcion
+        Suscripcion.objects.filter(pk=self.suscripcion.pk).update(is_active=False, mp_subscription_id='pre-2')
+
+    def notificar(self, notificacion_id, preapproval_id='pre-2', accion='updated'):
+        return self.client.post(
+            reverse('webhook_mp'),
+            json.dumps({
+                'id': notificacion_id, 'type': 'subscription_preapproval', 'action': accion,
+                'data': {'id': preapproval_id},
+            }),
+            content_type='application/json',
+        )
+
+    def test_responde_sin_esperar_a_mp_y_colapsa_las_repetidas(self):
+        self.mp.demora = 1.0
+        self.mp.preaprobaciones['pre-2'] = {'id': 'pre-2', 'status': 'authorized', 'external_reference': str(self.suscripcion.pk)}
+        inicio = perf_counter()
+        # MP reenvía la 1 y avisa dos veces más por la misma suscripción.
+        for notificacion_id in (1, 1, 2, 3):
+            self.assertEqual(self.notificar(notificacion_id).status_code, 200)
+        self.assertLess(perf_counter() - inicio, 1.0)
+        self.assertEqual(self.mp.rutas(), [])
+        self.assertEqual(NotificacionMP.objects.count(), 3)
+        self.assertEqual(Tarea.objects.filter(nombre='mercadopago.notificaciones').count(), 1)
+
+        procesar_lote(10)
+        self.assertEqual(self.mp.rutas(), ['/preapproval/pre-2'])
+        self.suscripcion.refresh_from_db()
+        self.assertTrue(self.suscripcion.is_active)
+        self.assertEqual(set(NotificacionMP.objects.values_list('estado', flat=True)), {NotificacionMP.PROCESADA})
+
+        # Repetir la ráfaga no cambia nada (ni guarda la suscripción de nuevo).
+        NotificacionMP.objects.update(estado=NotificacionMP.PENDIENTE)
+        self.assertEqual(procesar_pendientes()['actualizadas'], 0)
+
+    def test_mp_caido_deja_pendiente_y_reintenta(self):
+        self.mp.status = 503
+        self.notificar(7)
+        procesar_lote(10)
+        notificacion = NotificacionMP.objects.get()
+        self.assertEqual((notificacion.estado, notificacion.intentos), (NotificacionMP.PENDIENTE, 1))
+        self.assertEqual(Tarea.objects.get().estado, Tarea.PENDIENTE)
+
+        self.mp.status = None
+        self.mp.preaprobaciones['pre-2'] = {'id': 'pre-2', 'status': 'authorized', 'external_reference': str(self.suscripcion.pk)}
+        Tarea.objects.update(disponible_desde=timezone.now())
+        procesar_lote(10)
+        self.assertEqual(NotificacionMP.objects.get().estado, NotificacionMP.PROCESADA)
+        self.assertTrue(Suscripcion.objects.get(pk=self.suscripcion.pk).is_active)
+
+    def test_la_baja_de_una_preaprobacion_vieja_no_pisa_la_nueva(self):
+        referencia = str(self.suscripcion.pk)
+        self.mp.preaprobaciones['pre-1'] = {'id': 'pre-1', 'status': 'cancelled', 'external_reference': referencia}
+        self.mp.preaprobaciones['pre-2'] = {'id': 'pre-2', 'status': 'authorized', 'external_reference': referencia}
+        self.notificar(8, 'pre-2')
+        self.notificar(9, 'pre-1', accion='cancelled')
+        procesar_lote(10)
+        self.assertEqual(sorted(self.mp.rutas()), ['/preapproval/pre-1', '/preapproval/pre-2'])
+        self.suscripcion.refresh_from_db()
+        self.assertEqual((self.suscripcion.plan.slug, self.suscripcion.is_active), ('prime', True))
+
+        self.mp.preaprobaciones['pre-2']['status'] = 'cancelled'
+        self.notificar(10, 'pre-2', accion='cancelled')
+        procesar_lote(10)
+        self.suscripcion.refresh_from_db()
+        self.assertEqual(self.suscripcion.plan.slug, 'free')
+
+    def test_el_pago_procesado_en_el_worker_cambia_las_capacidades(self):
+        cache.clear()
+        olvidar_capacidades()
+        self.assertFalse(capacidades(self.usuario.pk).plan_de_pago)
+        self.mp.preaprobaciones['pre-2'] = {'id': 'pre-2', 'status': 'authorized', 'external_reference': str(self.suscripcion.pk)}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notificar(11)
+            procesar_lote(10)
+        self.assertTrue(capacidades(self.usuario.pk).plan_de_pago)
+
+
+class CacheCompartidaCheckTests(TestCase):
+    def test_exige_cache_compartida_si_el_worker_corre_aparte(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+        with self.settings(CACHES=locmem, CACHE_COMPARTIDA_REQUERIDA=True):
+            self.assertEqual([error.id for error in cache_compartida(None)], ['myapp.E001'])
+        with self.settings(CACHES=redis, CACHE_COMPARTIDA_REQUERIDA=True):
+            self.assertEqual(cache_compartida(None), [])
+        with self.settings(CACHES=locmem, CACHE_COMPARTIDA_REQUERIDA=False):
+            self.assertEqual(cache_compartida(None), [])
+
+
+class MercadoPagoGatewayTests(TestCase):
+    def setUp(self):
+        self.mp = FakeMercadoPago().iniciar()
+        self.addCleanup(self.mp.cerrar)
+        ajustes = override_settings(MERCADOPAGO_API_URL=self.mp.url, MERCADOPAGO_WEBHOOK_DEMORA_SECONDS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        mp_gateway.cerrar()
+        mp_gateway.reiniciar_metricas()
+        self.addCleanup(mp_gateway.cerrar)
+
+    def test_reusa_la_conexion_y_reintenta_el_post_con_la_misma_clave(self):
+        for _ in range(3):
+            self.assertEqual(mp_gateway.obtener_preapproval('no-existe')['status'], 404)
+        self.mp.fallas = 1
+        resultado = mp_gateway.crear_preapproval({'reason': 'Plan prime', 'external_reference': '1'})
+        self.assertEqual(resultado['status'], 201)
+
+        posts = [pedido for pedido in self.mp.pedidos if pedido[0] == 'POST']
+        self.assertEqual(len(posts), 2)
+        self.assertEqual(len({clave for *_, clave in posts}), 1)
+        self.assertEqual(len(self.mp.preaprobaciones), 1)
+        self.assertEqual(self.mp.conexiones, 1)
+        resumen = mp_gateway.resumen()
+        self.assertEqual((resumen['llamadas'], resumen['reintentos'], resumen['conexiones_nuevas']), (4, 1, 1))
+
+    @override_settings(MERCADOPAGO_TIMEOUT=0.1, MERCADOPAGO_RETRIES=1)
+    def test_mp_lento_corta_por_timeout(self):
+        mp_gateway.cerrar()
+        self.mp.demora = 1.0
+        inicio = perf_counter()
+        with self.assertRaises(mp_gateway.ErrorMP):
+            mp_gateway.obtener_preapproval('pre-1')
+        self.assertLess(perf_counter() - inicio, 1.0)
+        self.assertEqual(len(self.mp.pedidos), 2)
+        self.assertEqual(mp_gateway.resumen()['errores'], 1)
+
+    @override_settings(MERCADOPAGO_TIMEOUT=5.0, MERCADOPAGO_TOTAL_TIMEOUT=0.3)
+    def test_el_tope_total_corta_antes_de_reintentar(self):
+        mp_gateway.cerrar()
+        self.mp.demora = 1.0
+        inicio = perf_counter()
+        with self.assertRaises(mp_gateway.ErrorMP):
+            mp_gateway.crear_preapproval({'reason': 'Plan prime'})
+        self.assertLess(perf_counter() - inicio, 0.8)
+        self.assertEqual(len(self.mp.pedidos), 1)
+
+    @override_settings(MERCADOPAGO_RETRIES=0)
+    def test_la_clave_del_alta_cambia_solo_con_una_respuesta_definitiva(self):
+        usuario = crear_usuario('suscriptor')
+        self.client.force_login(usuario)
+        self.mp.status = 503
+        self.client.get(reverse('crear_suscripcion', args=['prime']))
+        self.mp.status = None
+        self.client.get(reverse('crear_suscripcion', args=['prime']))
+        self.client.get(reverse('crear_suscripcion', args=['prime']))
+
+        suscripcion = Suscripcion.objects.get(usuario=usuario)
+        claves = [clave for metodo, _, _, clave in self.mp.pedidos if metodo == 'POST']
+        self.assertEqual(claves, [
+            mp_gateway.clave_preapproval(suscripcion.pk, 'prime', 0),
+            mp_gateway.clave_preapproval(suscripcion.pk, 'prime', 0),
+            mp_gateway.clave_preapproval(suscripcion.pk, 'prime', 1),
+        ])
+        self.assertEqual(len(self.mp.preaprobaciones), 2)
+        self.assertEqual(suscripcion.intento_checkout, 2)
+
+    def test_alta_autorizacion_y_baja_contra_el_fake(self):
+        usuario = crear_usuario('suscriptor')
+        self.client.force_login(usuario)
+        respuesta = self.client.get(reverse('crear_suscripcion', args=['prime']))
+        suscripcion = Suscripcion.objects.get(usuario=usuario)
+        self.assertEqual(respuesta.url, f'{self.mp.url}/checkout/{suscripcion.mp_subscription_id}')
+        self.assertEqual(
+            self.mp.preaprobaciones[suscripcion.mp_subscription_id]['external_reference'], str(suscripcion.pk),
+        )
+
+        # El usuario paga en MP y llega el aviso.
+        self.mp.preaprobaciones[suscripcion.mp_subscription_id]['status'] = 'authorized'
+        self.client.post(
+            reverse('webhook_mp'),
+            json.dumps({'id': 1, 'type': 'subscription_preapproval', 'data': {'id': suscripcion.mp_subscription_id}}),
+            content_type='application/json',
+        )
+        procesar_lote(10)
+        suscripcion.refresh_from_db()
+        self.assertEqual((suscripcion.plan.slug, suscripcion.is_active), ('prime', True))
+
+        self.client.post(reverse('cancelar_suscripcion'))
+        self.assertEqual(self.mp.preaprobaciones[suscripcion.mp_subscription_id]['status'], 'cancelled')
+        suscripcion.refresh_from_db()
+        self.assertEqual(suscripcion.plan.slug, 'free')
+
+
+class CandadosTests(TestCase):
+    def test_un_solo_titular_con_vencimiento_y_fencing(self):
+        primero = adquirir('trabajo', 60)
+        self.assertIsNotNone(primero)
+        self.assertIsNone(adquirir('trabajo', 60))
+        primero.renovar()
+
+        # El primero se cuelga y su lease vence: lo toma otro con un token mayor.
+        Candado.objects.filter(nombre='trabajo').update(vence=timezone.now() - timedelta(seconds=1))
+        segundo = adquirir('trabajo', 60)
+        self.assertEqual(segundo.token, primero.token + 1)
+        with self.assertRaises(CandadoPerdido):
+            primero.renovar()
+        primero.liberar()
+        self.assertIsNone(adquirir('trabajo', 60))
+
+        segundo.liberar()
+        self.assertIsNotNone(adquirir('trabajo', 60))
+
+    def test_el_envio_no_escribe_con_un_token_vencido(self):
+        servicio, _, profesionales = crear_negocio()
+        inicio = timezone.localtime() + timedelta(minutes=15)
+        turno = Turno.objects.create(
+            servicio=servicio, profesional=profesionales[0], cliente=crear_usuario('cliente'),
+            estado='confirmado', fecha=inicio.date(), hora=inicio.time(), duracion_total=1,
+        )
+        viejo = adquirir('send_reminders', 60)
+        # Se cuelga más que el lease justo después de renovar; otra instancia lo toma.
+        Candado.objects.filter(nombre='send_reminders').update(vence=timezone.now() - timedelta(seconds=1))
+        nuevo = adquirir('send_reminders', 60)
+        with mock.patch.object(viejo, 'renovar'), \
+                mock.patch('myapp.reminders.send_email_with_fallback') as enviar_mock, \
+                self.assertRaises(CandadoPerdido):
+            enviar_recordatorios_pendientes(concurrencia=1, lease=viejo)
+        enviar_mock.assert_not_called()
+        turno.refresh_from_db()
+        self.assertFalse(turno.recordatorio_enviado)
+        self.assertTrue(reminders.tomar(turno.id, nuevo))
+
+    def test_send_reminders_no_corre_dos_veces_a_la_vez(self):
+        with candado('send_reminders'):
+            salida = StringIO()
+            with mock.patch('myapp.management.commands.send_reminders.enviar_recordatorios_pendientes') as enviar:
+                call_command('send_reminders', stdout=salida)
+            enviar.assert_not_called()
+            self.assertIn('Otra instancia', salida.getvalue())
+        with self.assertRaises(CandadoOcupado):
+            with candado('otro'):
+                with candado('otro'):
+                    pass
+
+
+fallas_de_prueba = []
+
+
+@tarea('tests.falla')
+def tarea_que_falla(motivo):
+    fallas_de_prueba.append(motivo)
+    raise RuntimeError(motivo)
+
+
+@override_settings(TAREAS_MAX_INTENTOS=2, TAREAS_BACKOFF_BASE=60)
+class ColaDeTareasTests(TestCase):
+    def setUp(self):
+        fallas_de_prueba.clear()
+
+    def test_confirmar_turno_encola_el_correo_y_el_worker_lo_manda(self):
+        servicio, _, profesionales = crear_negocio()
+        cliente = crear_usuario('cliente')
+        turno = Turno.objects.create(
+            servicio=servicio, profesional=profesionales[0], cliente=cliente,
+            fecha=timezone.localdate() + timedelta(days=2), hora=time(10), duracion_total=30,
+        )
+        servicio.propietario.perfil.email_verified = True
+        servicio.propietario.perfil.save()
+        self.client.force_login(servicio.propietario)
+        with mock.patch('myapp.email_service.send_email_with_fallback') as enviar:
+            self.client.post(reverse('confirmar_turno', args=[turno.id]))
+            # La request sólo deja la tarea; nada sale hasta que corre el worker.
+            enviar.assert_not_called()
+            tarea_encolada = Tarea.objects.get(nombre='emails.turno_confirmado')
+            self.assertEqual(tarea_encolada.argumentos['turno_id'], turno.id)
+
+            self.assertEqual(len(procesar_lote(10)), 1)
+        self.assertEqual(enviar.call_args.args[0], 'cliente@example.com')
+        self.assertEqual(enviar.call_args.kwargs['idempotency_key'], f'accept-{turno.id}')
+        tarea_encolada.refresh_from_db()
+        self.assertEqual((tarea_encolada.estado, tarea_encolada.intentos), (Tarea.HECHA, 1))
+
+    def test_verificacion_repetida_no_invalida_el_link_ya_mandado(self):
+        usuario = crear_usuario('nuevo')
+        schedule_verification_email(usuario)
+        token = EmailVerificationToken.objects.get(user=usuario)
+        tarea_encolada = Tarea.objects.get(nombre='emails.verificacion')
+        with mock.patch('myapp.email_service.send_email_with_fallback') as enviar:
+            procesar_lote(10)
+            # El worker murió tras mandar: la misma tarea corre otra vez.
+            Tarea.objects.filter(pk=tarea_encolada.pk).update(estado=Tarea.PENDIENTE)
+            procesar_lote(10)
+        links = [llamada.kwargs['template_data']['link'] for llamada in enviar.call_args_list]
+        self.assertEqual(len(links), 2)
+        self.assertEqual(set(links), {verification_link_for_token(token.token)})
+        self.assertEqual(list(EmailVerificationToken.objects.filter(user=usuario)), [token])
+
+    def test_reintenta_con_backoff_y_termina_fallida(self):
+        encolar('tests.falla', motivo='pidgeon caído')
+        self.assertEqual(len(procesar_lote(10)), 1)
+        fallida = Tarea.objects.get(nombre='tests.falla')
+        self.assertEqual((fallida.estado, fallida.intentos), (Tarea.PENDIENTE, 1))
+        self.assertGreater(fallida.disponible_desde, timezone.now() + timedelta(seconds=40))
+        self.assertIn('pidgeon caído', fallida.ultimo_error)
+        # Durante el backoff no se vuelve a tomar.
+        self.assertEqual(procesar_lote(10), [])
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        procesar_lote(10)
+        fallida.refresh_from_db()
+        self.assertEqual((fallida.estado, fallida.intentos), (Tarea.FALLIDA, 2))
+        self.assertEqual(fallas_de_prueba, ['pidgeon caído', 'pidgeon caído'])
+        self.assertEqual(procesar_lote(10), [])
+
+    def test_bloqueo_vencido_se_retoma_y_el_worker_viejo_no_pisa(self):
+        encolar('tests.falla', motivo='lento')
+        viejo, = tomar_lote(10)
+        self.assertEqual(tomar_lote(10), [])
+
+        Tarea.objects.update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        nuevo, = tomar_lote(10)
+        self.assertNotEqual(nuevo.tomada_por, viejo.tomada_por)
+        self.assertEqual(nuevo.intentos, 2)
+
+        ejecutar(viejo)
+        self.assertEqual(Tarea.objects.get().estado, Tarea.EN_CURSO)
+        self.assertEqual(ejecutar(nuevo), Tarea.FALLIDA)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ReservasConcurrentesTests(TransactionTestCase):
+    hilos = 8
+
+    def test_un_solo_turno_gana_el_mismo_hueco(self):
+        servicio, sub_servicio, (profesional,) = crear_negocio()
+        cliente = User.objects.create_user('cliente', 'cliente@example.com', 'clave')
+        fecha = date.today() + timedelta(days=7)
+        largada = threading.Barrier(self.hilos)
+        resultados = []
+
+        def intentar(hora):
+            try:
+                largada.wait()
+                reservar_turno(nuevo_turno(servicio, cliente, fecha, hora, 60), [profesional.id])
+                resultados.append('ok')
+            except TurnoNoDisponible:
+                resultados.append('ocupado')
+            finally:
+                connection.close()
+
+        # Horarios distintos pero solapados: el unique_together solo no alcanzaría.
+        horas = [time(10, 15 * (i % 4)) for i in range(self.hilos)]
+        hilos = [threading.Thread(target=intentar, args=(hora,)) for hora in horas]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(resultados.count('ok'), 1)
+        self.assertEqual(resultados.count('ocupado'), self.hilos - 1)
+        self.assertEqual(Turno.objects.filter(profesional=profesional, fecha=fecha).count(), 1)
+
+
+class BusquedaServiciosTests(TestCase):
+    def setUp(self):
+        self.propietario = User.objects.create_user('propietario', 'propietario@example.com', 'clave')
+
+    def servicio(self, nombre, **campos):
+        return Servicio.objects.create(propietario=self.propietario, nombre=nombre, **campos)
+
+    def buscar(self, consulta, pagina=None):
+        parametros = {'q': consulta, **({'page': pagina} if pagina else {})}
+        return self.client.get(reverse('index'), parametros).context['servicios']
+
+    def nombres(self, consulta):
+        return [servicio.nombre for servicio in self.buscar(consulta)]
+
+    def test_ignora_tildes_mayusculas_y_espacios(self):
+        categoria = Categoria.objects.create(nombre='Estética', slug='estetica')
+        self.servicio(
+            'Peluquería Ñandú', categoria=categoria, descripcion='Cortes y COLOR', direccion='Av. Córdoba 1234',
+        )
+        self.servicio('Gomería')
+
+        for consulta in ('PELUQUERIA nandu', '  peluquería   ÑANDÚ ', 'cordoba', 'color', 'estetica'):
+            self.assertEqual(self.nombres(consulta), ['Peluquería Ñandú'], consulta)
+        self.assertEqual(self.nombres('peluqueria gomeria'), [])
+
+        # Renombrar la categoría reindexa sus servicios.
+        categoria.nombre = 'Barbería'
+        categoria.save()
+        self.assertEqual(self.nombres('barberia'), ['Peluquería Ñandú'])
+        self.assertEqual(self.nombres('estetica'), [])
+
+    def test_ordena_por_relevancia_en_el_nombre(self):
+        self.servicio('Barbería', descripcion='Atiende Ñandú')
+        self.servicio('Anandu Spa')
+        self.servicio('Peluquería Ñandú')
+        self.servicio('Ñandú')
+
+        self.assertEqual(self.nombres('nandu'), ['Ñandú', 'Peluquería Ñandú', 'Anandu Spa', 'Barbería'])
+
+    def test_pagina_los_resultados(self):
+        for i in range(search.RESULTADOS_POR_PAGINA + 1):
+            self.servicio(f'Spa {i:02d}')
+        self.servicio('Gomería')
+
+        primera = self.buscar('spa')
+        self.assertEqual((len(primera), primera.paginator.count, primera.has_next()), (12, 13, True))
+        segunda = self.buscar('spa', pagina=2)
+        self.assertEqual([servicio.nombre for servicio in segunda], ['Spa 12'])
+        # Una página fuera de rango muestra la última.
+        self.assertEqual(self.buscar('spa', pagina=99).number, 2)
+
+    def test_save_parcial_sin_campos_de_busqueda_no_los_recalcula(self):
+        categoria = Categoria.objects.create(nombre='Estética', slug='estetica')
+        servicio = Servicio.objects.get(pk=self.servicio('Spa', categoria=categoria).pk)
+
+        servicio.footer_telefono = '1234'
+        with mock.patch.object(search, 'texto_de_busqueda', wraps=search.texto_de_busqueda) as texto:
+            with CaptureQueriesContext(connection) as consultas:
+                servicio.save(update_fields=['footer_telefono'])
+            texto.assert_not_called()
+            # No lee la categoría para rearmar el texto de búsqueda.
+            self.assertFalse([q['sql'] for q in consultas if 'myapp_categoria' in q['sql']])
+
+            servicio.nombre = 'Spa Ñandú'
+            servicio.save(update_fields=['nombre'])
+        texto.assert_called_once()
+        self.assertEqual(self.nombres('nandu'), ['Spa Ñandú'])
+
+    def test_la_migracion_no_depende_del_modulo_de_busqueda(self):
+        migracion = importlib.import_module('myapp.migrations.0031_busqueda_servicios')
+        self.servicio('Peluquería Ñandú', direccion='Av. Córdoba 1234')
+        Servicio.objects.update(busqueda_nombre='', busqueda_texto='')
+
+        with mock.patch.object(search, 'normalizar', side_effect=AssertionError('usa el módulo vivo')):
+            migracion.poblar_busqueda(django_apps, None)
+        self.assertEqual(
+            Servicio.objects.values_list('busqueda_nombre', 'busqueda_texto').get(),
+            ('peluqueria nandu', 'peluqueria nandu sin descripcion av. cordoba 1234'),
+        )
+
+
+# (nombre de la URL, quién pide, método, kwargs de la URL, parámetros, status esperado, máximo de
+# consultas). Se mide con la caché vacía (peor caso) sobre sembrar_volumen(). El status asegura
+# que se mide el camino real y no una redirección al login o un 403.
+PRESUPUESTOS = [
+    ('index', None, 'get', {}, {}, 200, 2),
+    ('index', 'cliente', 'get', {}, {}, 200, 7),
+    ('index', 'cliente', 'get', {}, {'q': 'nandu'}, 200, 7),
+    ('about', 'cliente', 'get', {}, {}, 200, 3),
+    ('terminos', None, 'get', {}, {}, 200, 0),
+    ('privacidad', None, 'get', {}, {}, 200, 0),
+    ('precios', 'cliente', 'get', {}, {}, 200, 6),
+    ('verify_email', None, 'get', {'token': uuid.uuid4()}, {}, 302, 1),
+    ('resend_verification_email', None, 'get', {}, {}, 200, 0),
+    ('activate', None, 'get', lambda d: {'uidb64': urlsafe_base64_encode(force_bytes(d.cliente.pk)), 'token': 'x-y'}, {}, 200, 1),
+    # Descartar colgadas + buscar activa + savepoint, corrida y tarea: el envío va por la cola.
+    ('cron_send_reminders', None, 'post', {}, {'secret': 'presupuesto'}, 202, 6),
+    ('cron_send_reminders_estado', None, 'get', lambda d: {'corrida_id': d.corrida.id}, {}, 200, 1),
+    ('webhook_mp', None, 'post', {}, {}, 200, 0),
+    ('servicio_detail', 'cliente', 'get', lambda d: {'servicio_slug': d.servicio.slug}, {}, 200, 19),
+    ('api_get_reseñas', 'cliente', 'get', lambda d: {'servicio_slug': d.servicio.slug}, {}, 200, 6),
+    ('obtener_slots_disponibles', 'cliente', 'get', lambda d: {'servicio_id': d.servicio.id},
+     lambda d: {'fecha': (timezone.localdate() + timedelta(days=3)).isoformat(), 'duracion': 30}, 200, 8),
+    ('obtener_slots_rango', 'cliente', 'get', lambda d: {'servicio_id': d.servicio.id},
+     lambda d: {
+         'desde': (timezone.localdate() + timedelta(days=1)).isoformat(),
+         'hasta': (timezone.localdate() + timedelta(days=14)).isoformat(),
+         'duracion': 30, 'profesional_id': 'cualquiera',
+     }, 200, 8),
+    ('api_get_horario_profesional', 'cliente', 'get', lambda d: {'profesional_id': d.profesionales[0].id}, {}, 200, 5),
+    ('mis_turnos', 'cliente', 'get', {}, {}, 200, 9),
+    ('mis_favoritos', 'cliente', 'get', {}, {}, 200, 5),
+    ('toggle_favorito', 'cliente', 'get', lambda d: {'servicio_id': d.servicio.id}, {}, 302, 6),
+    ('crear_reseña', 'cliente', 'get', lambda d: {'turno_id': d.turno_sin_reseña.id}, {}, 200, 6),
+    ('obtener_notificaciones', 'cliente', 'get', {}, {}, 200, 4),
+    ('editar_perfil', 'cliente', 'get', {}, {}, 200, 4),
+    ('crear_servicio_paso1', 'cliente', 'get', {}, {}, 302, 3),
+    ('crear_servicio_paso2', 'cliente', 'get', {}, {}, 200, 6),
+    ('crear_suscripcion', 'propietario', 'get', {'plan_slug': 'free'}, {}, 302, 4),
+    ('pago_exitoso', 'propietario', 'get', {}, {}, 302, 4),
+    ('cancelar_suscripcion', 'cliente', 'post', {}, {}, 302, 6),
+    ('dashboard_suscripcion', 'propietario', 'get', {}, {}, 200, 6),
+    ('dashboard_propietario', 'propietario', 'get', {}, {}, 200, 14),
+    ('dashboard_turnos', 'propietario', 'get', {}, {}, 200, 14),
+    ('dashboard_turnos', 'propietario', 'get', {}, {'filtro_historial': 'finalizados'}, 200, 14),
+    ('dashboard_horarios', 'propietario', 'get', {}, {}, 200, 9),
+    ('dashboard_metricas', 'propietario', 'get', {}, {}, 200, 11),
+    ('api_metricas_grafico', 'propietario', 'get', {}, {'agrupar_por': 'mes'}, 200, 6),
+    ('dashboard_servicios', 'propietario', 'get', {}, {}, 200, 6),
+    ('dashboard_catalogo', 'propietario', 'get', {}, {}, 200, 7),
+    ('dashboard_detalles_negocio', 'propietario', 'get', {}, {}, 200, 9),
+    ('dashboard_calendario', 'propietario', 'get', {}, {}, 200, 8),
+    ('api_turnos_por_dia', 'propietario', 'get', {}, lambda d: {'fecha': d.turno_pendiente.fecha.isoformat()}, 200, 8),
+    ('obtener_notificaciones_propietario', 'propietario', 'get', {}, {}, 200, 4),
+    ('marcar_onboarding_completo', 'propietario', 'post', {}, {}, 200, 7),
+    ('marcar_animacion_premium_vista', 'propietario', 'post', {}, {}, 200, 6),
+    ('gestionar_equipo', 'propietario', 'get', lambda d: {'servicio_id': d.servicio.id}, {}, 200, 6),
+    ('crear_profesional', 'propietario', 'get', lambda d: {'servicio_id': d.servicio.id}, {}, 200, 6),
+    ('editar_profesional', 'propietario', 'get', lambda d: {'profesional_id': d.profesionales[0].id}, {}, 200, 9),
+    # Cascada más el recálculo de las filas sin profesional (ocupación y métricas) de sus turnos.
+    ('eliminar_profesional', 'propietario', 'post', lambda d: {'profesional_id': d.profesionales[0].id}, {}, 302, 36),
+    ('confirmar_turno', 'propietario', 'get', lambda d: {'turno_id': d.turno_pendiente.id}, {}, 302, 4),
+    ('cancelar_turno', 'propietario', 'get', lambda d: {'turno_id': d.turno_pendiente.id}, {}, 302, 4),
+    ('finalizar_turno', 'propietario', 'get', lambda d: {'turno_id': d.turno_pendiente.id}, {}, 200, 10),
+    ('api-root', 'cliente', 'get', {}, {}, 200, 3),
+    ('servicios-list', 'cliente', 'get', {}, {}, 200, 6),
+    ('servicios-detail', 'cliente', 'get', lambda d: {'pk': d.servicio.id}, {}, 200, 6),
+    ('turnos-list', 'cliente', 'get', {}, {}, 200, 4),
+    ('turnos-detail', 'cliente', 'get', lambda d: {'pk': d.turno_pendiente.id}, {}, 200, 4),
+]
+
+
+def _vista_de(nombre, quien, parametros):
+    partes = [nombre.replace('-', '_'), quien or 'anonimo', *parametros]
+    return '_'.join(partes)
+
+
+@override_settings(REMINDER_CRON_SECRET='presupuesto')
+class PresupuestoConsultasTests(TestCase):
+    """
+    Un test por URL de myapp/urls.py (``test_<nombre>_<quién>``) con un máximo de consultas
+    SQL. Si una vista empieza a hacer N+1, el test de esa vista falla mostrando las consultas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.datos = sembrar_volumen()
+        cls.datos.corrida = CorridaRecordatorios.objects.create(estado=CorridaRecordatorios.HECHA, activa=False)
+
+    def setUp(self):
+        cache.clear()
+        # Los endpoints de cron piden el secreto por cabecera; al resto no le afecta.
+        self.client = self.client_class(HTTP_X_CRON_SECRET='presupuesto')
+
+    def usuario(self, quien):
+        return {'propietario': self.datos.propietario, 'cliente': self.datos.cliente}.get(quien)
+
+    def assertPresupuesto(self, nombre, quien, metodo, kwargs, parametros, status, maximo):
+        usuario = self.usuario(quien)
+        if usuario:
+            self.client.force_login(usuario)
+        url = reverse(nombre, kwargs=kwargs(self.datos) if callable(kwargs) else kwargs)
+        parametros = parametros(self.datos) if callable(parametros) else parametros
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = getattr(self.client, metodo)(url, parametros)
+        self.assertEqual(respuesta.status_code, status, nombre)
+        if len(consultas) > maximo:
+            detalle = '\n'.join(f'{i}. {c["sql"]}' for i, c in enumerate(consultas.captured_queries, 1))
+            self.fail(f'{nombre}: {len(consultas)} consultas (máximo {maximo})\n{detalle}')
+
+    def test_listados_del_admin(self):
+        admin = User.objects.create_superuser('admin-presupuesto', 'admin@example.com', 'x')
+        self.client.force_login(admin)
+        presupuestos = {
+            'turno': 7, 'reseña': 6, 'servicio': 6, 'suscripcion': 6,
+            'profesional': 6, 'dianodisponible': 5,
+        }
+        for modelo, maximo in presupuestos.items():
+            with self.subTest(modelo=modelo), CaptureQueriesContext(connection) as consultas:
+                respuesta = self.client.get(reverse(f'admin:myapp_{modelo}_changelist'))
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertLessEqual(len(consultas), maximo)
+
+    def test_todas_las_urls_tienen_presupuesto(self):
+        con_presupuesto = {nombre for nombre, *_ in PRESUPUESTOS}
+        self.assertEqual(set(_nombres_de_urls(get_resolver('myapp.urls').url_patterns)) - con_presupuesto, set())
+
+
+def _nombres_de_urls(patrones):
+    for patron in patrones:
+        if isinstance(patron, URLResolver):
+            yield from _nombres_de_urls(patron.url_patterns)
+        elif isinstance(patron, URLPattern) and patron.name:
+            yield patron.name
+
+
+def _test_presupuesto(*presupuesto):
+    def test(self):
+        self.assertPresupuesto(*presupuesto)
+    return test
+
+
+for _presupuesto in PRESUPUESTOS:
+    setattr(
+        PresupuestoConsultasTests,
+        f'test_{_vista_de(_presupuesto[0], _presupuesto[1], _presupuesto[4] if isinstance(_presupuesto[4], dict) else {})}',
+        _test_presupuesto(*_presupuesto),
+    )
+
+
+@override_settings(CONTAR_CONSULTAS=True)
+class BenchHttpTests(LiveServerTestCase):
+    escenarios = ['index_busqueda', 'servicio_detail', 'slots_rango', 'dashboard_turnos', 'notificaciones_propietario']
+
+    def setUp(self):
+        self.datos = sembrar_volumen()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+
+    def bench(self, **opciones):
+        call_command(
+            'bench_http', url=self.live_server_url, servicio=self.datos.servicio.slug, escenarios=self.escenarios,
+            # El live server comparte una sola conexión SQLite en memoria: sin concurrencia.
+            peticiones=4, concurrencia=1, calentamiento=1, stdout=StringIO(), stderr=StringIO(), **opciones,
+        )
+
+    def test_reporta_latencias_y_consultas_y_compara_contra_baseline(self):
+        salida = os.path.join(self.directorio, 'base.json')
+        self.bench(salida=salida)
+        with open(salida, encoding='utf-8') as archivo:
+            resultado = json.load(archivo)
+        self.assertEqual(list(resultado['escenarios']), self.escenarios)
+        for nombre, medido in resultado['escenarios'].items():
+            with self.subTest(escenario=nombre):
+                self.assertEqual((medido['peticiones'], medido['errores']), (4, 0))
+                self.assertLessEqual(medido['p50_ms'], medido['p95_ms'])
+                self.assertLessEqual(medido['p95_ms'], medido['p99_ms'])
+                self.assertGreater(medido['consultas_por_request'], 0)
+
+        # Un baseline con menos consultas que las actuales es una regresión.
+        resultado['escenarios']['dashboard_turnos']['consultas_por_request'] -= 3
+        for medido in resultado['escenarios'].values():
+            medido['p95_ms'] = 10 ** 6
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo)
+        with self.assertRaisesMessage(CommandError, 'dashboard_turnos consultas_por_request'):
+            self.bench(baseline=salida)
@@ -14,6 +14,7 @@ urlpatterns = [
     path('verify-email/<uuid:token>/', views.verify_email_view, name='verify_email'),
     path('resend-verification-email/', views.resend_verification_email_view, name='resend_verification_email'),
     path('internal/cron/send-reminders/', views.cron_send_reminders_http, name='cron_send_reminders'),
+    path('internal/cron/send-reminders/<int:corrida_id>/', views.cron_send_reminders_estado, name='cron_send_reminders_estado'),
     path('about/', views.about, name='about'),
     path('s/<slug:servicio_slug>/', views.servicio_detail, name='servicio_detail'),
     path('api/reseñas/<slug:servicio_slug>/', views.api_get_reseñas, name='api_get_reseñas'),
@@ -61,4 +62,5 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path('api/notificaciones/', views.obtener_notificaciones, name='obtener_notificaciones'),
     path('api/slots-disponibles/<int:servicio_id>/', views.obtener_slots_disponibles, name='obtener_slots_disponibles'),
+    path('api/slots-disponibles/<int:servicio_id>/rango/', views.obtener_slots_rango, name='obtener_slots_rango'),
 ]
\ No newline at end of file
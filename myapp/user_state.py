@@ -0,0 +1,128 @@
+"""
+Estado de la cuenta del usuario logueado, resuelto una sola vez por request.
+
+Los middlewares (suscripción gratuita, email verificado), los context processors y la
+navbar necesitan lo mismo: suscripción + plan, perfil, si tiene cuenta social y si ya tiene
+un negocio. ``estado_usuario(request)`` lo trae en una sola consulta, lo guarda en la
+request y en la caché compartida. La clave lleva la versión del usuario y una versión
+global de planes; las señales las suben cuando cambian Suscripcion, PerfilUsuario,
+SocialAccount o Plan, o cuando se crea/borra un Servicio, así que una request con la caché
+caliente no consulta la base para esto.
+"""
+from dataclasses import dataclass
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+
+from . import cache_versions
+from .models import Plan, Servicio
+
+_ATRIBUTO_REQUEST = '_estado_usuario'
+_CLAVE_VERSION_PLANES = 'usuario:v:planes'
+
+
+@dataclass(frozen=True)
+class EstadoUsuario:
+    tiene_suscripcion: bool = False
+    suscripcion_activa: bool = False
+    plan_slug: str = ''
+    plan_nombre: str = ''
+    plan_allow_metrics: bool = False
+    plan_allow_customization: bool = False
+    ha_visto_animacion_premium: bool = False
+    email_verificado: bool = False
+    tiene_cuenta_social: bool = False
+    tiene_servicios: bool = False
+
+    @property
+    def plan_de_pago_activo(self):
+        return bool(self.suscripcion_activa and self.plan_slug and self.plan_slug != 'free')
+
+
+ANONIMO = EstadoUsuario()
+
+
+def _clave_version_usuario(usuario_id):
+    return f'usuario:v:{usuario_id}'
+
+
+def invalidar_usuario(usuario_id):
+    if usuario_id:
+        cache_versions.subir([_clave_version_usuario(usuario_id)])
+
+
+def invalidar_planes():
+    """Un cambio en un Plan afecta a todos sus suscriptos."""
+    cache_versions.subir([_CLAVE_VERSION_PLANES])
+
+
+def version_usuario(usuario_id):
+    """Versión vigente del estado de ``usuario_id`` (la del usuario más la de planes)."""
+    claves = [_clave_version_usuario(usuario_id), _CLAVE_VERSION_PLANES]
+    versiones = cache_versions.vigentes(claves)
+    return '.'.join(str(versiones.get(clave, 0)) for clave in claves)
+
+
+def cargar_estado(usuario_id):
+    """Arma el estado desde la base en una consulta (LEFT JOIN a suscripción, plan y perfil)."""
+    fila = User.objects.filter(pk=usuario_id).values(
+        'suscripcion__id',
+        'suscripcion__is_active',
+        'suscripcion__ha_visto_animacion_premium',
+        'suscripcion__plan__slug',
+        'suscripcion__plan__nombre',
+        'suscripcion__plan__allow_metrics',
+        'suscripcion__plan__allow_customization',
+        'perfil__email_verified',
+    ).annotate(
+        cuenta_social=Exists(SocialAccount.objects.filter(user_id=OuterRef('pk'))),
+        servicios=Exists(Servicio.objects.filter(propietario_id=OuterRef('pk'))),
+    ).first()
+    if fila is None:
+        return ANONIMO
+    return EstadoUsuario(
+        tiene_suscripcion=fila['suscripcion__id'] is not None,
+        suscripcion_activa=bool(fila['suscripcion__is_active']),
+        plan_slug=fila['suscripcion__plan__slug'] or '',
+        plan_nombre=dict(Plan.PLAN_CHOICES).get(fila['suscripcion__plan__nombre'], fila['suscripcion__plan__nombre'] or ''),
+        plan_allow_metrics=bool(fila['suscripcion__plan__allow_metrics']),
+        plan_allow_customization=bool(fila['suscripcion__plan__allow_customization']),
+        ha_visto_animacion_premium=bool(fila['suscripcion__ha_visto_animacion_premium']),
+        email_verificado=bool(fila['perfil__email_verified']),
+        tiene_cuenta_social=fila['cuenta_social'],
+        tiene_servicios=fila['servicios'],
+    )
+
+
+def estado_de_usuario(usuario_id, version=None):
+    """Estado de ``usuario_id`` desde la caché compartida o, si no está, desde la base."""
+    if version is None:
+        version = version_usuario(usuario_id)
+    clave = f'usuario:estado:{usuario_id}:{version}'
+    estado = cache.get(clave)
+    if estado is None:
+        estado = cargar_estado(usuario_id)
+        cache.set(clave, estado, settings.ESTADO_USUARIO_CACHE_TIMEOUT)
+    return estado
+
+
+def estado_usuario(request):
+    """Estado del usuario de la request; se resuelve la primera vez y queda guardado en ella."""
+    estado = getattr(request, _ATRIBUTO_REQUEST, None)
+    if estado is None:
+        usuario = getattr(request, 'user', None)
+        if usuario is None or not usuario.is_authenticated:
+            estado = ANONIMO
+        else:
+            estado = estado_de_usuario(usuario.pk)
+        setattr(request, _ATRIBUTO_REQUEST, estado)
+    return estado
+
+
+def olvidar_estado_usuario(request):
+    """Descarta el estado guardado en la request (p. ej. después de crearle la suscripción)."""
+    if hasattr(request, _ATRIBUTO_REQUEST):
+        delattr(request, _ATRIBUTO_REQUEST)
@@ -2,20 +2,14 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login
 from django.contrib import messages
 from django.forms import inlineformset_factory, modelformset_factory
-from .models import PerfilUsuario, Servicio, Profesional , Turno, HorarioLaboral, SubServicio, Categoria, Plan, Suscripcion, DiaNoDisponible, EmailVerificationToken
+from .models import PerfilUsuario, Servicio, Profesional , Turno, HorarioLaboral, SubServicio, Categoria, Plan, Suscripcion, DiaNoDisponible, EmailVerificationToken, CorridaRecordatorios
 from .email_service import (
-    send_email_with_fallback,
-    send_verification_email,
-    html_booking_accepted_client,
-    html_booking_rejected_client,
-    html_booking_cancelled_owner,
-    template_data_booking_accepted_client,
-    template_data_booking_rejected_client,
-    template_data_booking_cancelled_owner,
+    schedule_verification_email,
     dashboard_turnos_link,
     mis_turnos_link,
     schedule_turno_booking_emails,
-    schedule_background,
+    schedule_booking_accepted_email,
+    schedule_booking_cancel_emails,
 )
 from .forms import BloqueoForm, ProfesionalForm, HorarioLaboralFormSet , HorarioLaboralForm, TurnoForm, UserUpdateForm, IngresoTurnoForm, ReseñaForm, ServicioPersonalizacionForm, ServicioUpdateForm, ServicioCreateForm
 from django.contrib.auth.decorators import login_required
@@ -26,23 +20,50 @@ from datetime import datetime, timedelta
 import calendar
 import itertools
 from collections import defaultdict
-from django.db.models import Count, Sum,Avg, Q
+from django.db.models import Count, F, Sum,Avg, Q
 from django.db.models.functions import TruncDay, TruncMonth, TruncHour
 from django.utils.http import urlsafe_base64_decode
 from django.utils.encoding import force_str
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.models import User
 import json
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.views.decorators.http import require_POST
 from django.core.mail import send_mail
 from django.contrib.auth.views import LoginView
 from django.urls import reverse_lazy, reverse
 from django.conf import settings
 import logging
-import mercadopago
 from django.views.decorators.csrf import csrf_exempt
 
 from .subscription_utils import url_checkout_desde_respuesta_preapproval
+from .availability import (
+    MAX_DIAS_RANGO,
+    PROFESIONAL_CUALQUIERA,
+    profesionales_candidatos,
+    slots_disponibles,
+    slots_rango,
+    unir_slots,
+)
+from .booking import TurnoNoDisponible, reservar_turno
+from .entitlements import capacidades, capacidades_request
+from .metrics import (
+    ingresos_por_profesional,
+    obtener_o_calcular,
+    resumen_periodo,
+    serie_ingresos,
+    sub_servicios_populares,
+    timeout_grafico,
+    version_datos,
+)
+from . import mp_gateway
+from .mp_notifications import registrar as registrar_notificacion_mp
+from .occupancy import ocupacion_del_dia, ocupacion_mes
+from .reminders import pedir_corrida
+from .search import RESULTADOS_POR_PAGINA, buscar_servicios
+from .user_state import estado_usuario
 
 logger = logging.getLogger(__name__)
 
@@ -63,10 +84,16 @@ def index(request):
         servicios = servicios.filter(categoria__slug=categoria_seleccionada_slug)
 
     if search_query:
-        servicios = servicios.filter(nombre__icontains=search_query)
+        servicios = buscar_servicios(servicios, search_query)
+    else:
+        servicios = servicios.order_by('id')
+
+    paginator = Paginator(servicios, RESULTADOS_POR_PAGINA)
+    page_obj = paginator.get_page(request.GET.get('page'))
 
     context = {
-        'servicios': servicios,
+        'servicios': page_obj,
+        'page_obj': page_obj,
         'categorias': categorias_con_servicios,
         'categoria_activa': categoria_seleccionada_slug,
         'search_query': search_query,
@@ -217,16 +244,16 @@ def crear_suscripcion_mp(request, plan_slug):
 
     # Hasta autorización en MP las funciones de pago quedan bloqueadas (webhook marca is_active).
     suscripcion_usuario.is_active = False
-    suscripcion_usuario.save()
+    # update_fields: no pisar el intento_checkout que suma otra request en paralelo.
+    suscripcion_usuario.save(update_fields=['plan', 'is_active'])
 
     def _rollback_a_gratis(subs):
         if not plan_gratuito:
             return
         subs.plan = plan_gratuito
         subs.mp_subscription_id = None
-        subs.save()
+        subs.save(update_fields=['plan', 'is_active', 'mp_subscription_id'])
 
-    sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
     base_url = "https://turnosok.com"
     if settings.DEBUG:
         base_url = "http://127.0.0.1:8000"
@@ -247,7 +274,16 @@ def crear_suscripcion_mp(request, plan_slug):
         "notification_url": f"{base_url}{reverse('webhook_mp')}",
     }
 
-    result = sdk.preapproval().create(preapproval_data)
+    # Un doble submit (o volver a intentar tras un timeout o un 5xx) repite la clave y MP
+    # devuelve la misma preaprobación; con una respuesta definitiva el próximo intento usa otra.
+    clave = mp_gateway.clave_preapproval(suscripcion_usuario.id, plan.slug, suscripcion_usuario.intento_checkout)
+    try:
+        result = mp_gateway.crear_preapproval(preapproval_data, idempotency_key=clave)
+    except mp_gateway.ErrorMP as exc:
+        logger.error('Mercado Pago preapproval sin respuesta: %s', exc)
+        result = {'status': None, 'response': {'message': 'Mercado Pago no respondió; probá de nuevo en unos minutos.'}}
+    if result.get('status') is not None and result['status'] < 500 and result['status'] != 429:
+        Suscripcion.objects.filter(pk=suscripcion_usuario.pk).update(intento_checkout=F('intento_checkout') + 1)
 
     if result and result.get("status") == 201:
         resp_raw = result.get("response") or {}
@@ -286,14 +322,13 @@ def cancelar_suscripcion(request):
         return redirect('dashboard_propietario')
     
     if request.method == 'POST':
-        sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
-        
         # Cancelar en Mercado Pago
         if suscripcion.mp_subscription_id:
-            result = sdk.preapproval().update(
-                suscripcion.mp_subscription_id,
-                {"status": "cancelled"}
-            )
+            try:
+                result = mp_gateway.actualizar_preapproval(suscripcion.mp_subscription_id, {"status": "cancelled"})
+            except mp_gateway.ErrorMP as exc:
+                logger.error('Mercado Pago: cancelación sin respuesta: %s', exc)
+                result = {'status': None}
             
             if result.get("status") == 200:
                 # Actualizar en tu base de datos
@@ -346,66 +381,21 @@ def cancelar_suscripcion(request):
 
 @csrf_exempt
 def webhook_mp(request):
+    """
+    Guarda la notificación y responde enseguida: la consulta a MP y la actualización de la
+    suscripción van por la cola (ver myapp/mp_notifications.py).
+    """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            
-            # Log para debugging
-            print(f"Webhook recibido: Type={data.get('type')}, Action={data.get('action')}")
-            
-            sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
-            
-            # Manejar diferentes tipos de notificaciones
-            if data.get("type") == "subscription_preapproval":
-                mp_subscription_id = data.get("data", {}).get("id")
-                
-                # Obtener detalles de la suscripción
-                subscription_info = sdk.preapproval().get(mp_subscription_id)
-                
-                if subscription_info.get("status") == 200:
-                    response_data = subscription_info.get("response", {})
-                    external_ref = response_data.get("external_reference")
-                    
-                    try:
-                        suscripcion = Suscripcion.objects.get(id=external_ref)
-                        
-                        # Actualizar estado según el estado en MP
-                        mp_status = response_data.get("status")
-                        
-                        if mp_status == "authorized":
-                            suscripcion.is_active = True
-                            suscripcion.mp_subscription_id = mp_subscription_id
-                            # Eliminada la línea suscripcion.proxima_fecha_cobro = ... ya que el campo no existe
-                            
-                        elif mp_status in ["cancelled", "paused"]:
-                            suscripcion.is_active = False
-                            suscripcion.fecha_cancelacion = timezone.now()
-                            # Asignar plan gratuito al cancelar por webhook
-                            try:
-                                plan_gratuito = Plan.objects.get(slug='free')
-                                suscripcion.plan = plan_gratuito
-                            except Plan.DoesNotExist:
-                                print("ADVERTENCIA: El Plan 'free' no existe al cancelar suscripción por webhook.")
-                            
-                        suscripcion.save()
-                        
-                    except Suscripcion.DoesNotExist:
-                        print(f"Suscripción no encontrada: {external_ref}")
-                        
-            elif data.get("type") == "payment":
-                # Manejar notificaciones de pagos individuales
-                payment_id = data.get("data", {}).get("id")
-                payment_info = sdk.payment().get(payment_id)
-                
-                if payment_info.get("status") == 200:
-                    payment_data = payment_info.get("response", {})
-                    
-                    # Registrar el pago si lo deseas
-                    # Puedes crear un modelo HistorialPagos para trackear esto
-                    
-        except Exception as e:
-            print(f"Error procesando webhook: {e}")
-            
+        except ValueError:
+            # Las notificaciones IPN vienen sólo en el query string.
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        if not registrar_notificacion_mp(data, request.GET.dict()):
+            logger.warning('Webhook de MP sin tópico o recurso: %s', request.body[:500])
+
     return JsonResponse({"status": "received"})
 
 
@@ -424,25 +414,30 @@ def servicio_detail(request, servicio_slug):
     if request.method == 'POST':
         form = TurnoForm(request.POST, servicio=servicio)
         if form.is_valid():
-            profesional_id = request.POST.get('profesional_id')
-            profesional_asignado = None
-            if profesional_id:
+            profesional_id = request.POST.get('profesional_id') or PROFESIONAL_CUALQUIERA
+            sub_servicios = form.cleaned_data['sub_servicios_solicitados']
+            if profesional_id == PROFESIONAL_CUALQUIERA:
+                # "Cualquier profesional": se elige dentro de la reserva al menos cargado que tenga el hueco.
+                profesional_ids = profesionales_candidatos(servicio, [sub.pk for sub in sub_servicios])
+            else:
                 try:
-                    profesional_asignado = Profesional.objects.get(id=profesional_id, servicio=servicio)
-                except Profesional.DoesNotExist:
+                    profesional_ids = [Profesional.objects.get(id=profesional_id, servicio=servicio).id]
+                except (Profesional.DoesNotExist, ValueError):
                     messages.error(request, 'El profesional seleccionado no es válido.')
                     return redirect('servicio_detail', servicio_slug=servicio_slug)
-            
-            if not profesional_asignado:
+
+            if not profesional_ids:
                 messages.error(request, 'No se pudo asignar un profesional al turno. Por favor, contacte a soporte.')
                 return redirect('servicio_detail', servicio_slug=servicio_slug)
 
             turno = form.save(commit=False)
             turno.cliente = request.user
             turno.servicio = servicio
-            turno.profesional = profesional_asignado
-            turno.save()
-            form.save_m2m()
+            try:
+                reservar_turno(turno, profesional_ids, sub_servicios)
+            except TurnoNoDisponible:
+                messages.error(request, 'Ese horario ya no está disponible. Por favor, elegí otro.')
+                return redirect('servicio_detail', servicio_slug=servicio_slug)
 
             propietario = servicio.propietario
             cancel_url = mis_turnos_link(request)
@@ -499,6 +494,8 @@ def servicio_detail(request, servicio_slug):
     
     context = {
         'servicio': servicio,
+        # Una vez por request: el template las mira en cada bloque de estilos y del formulario.
+        'capacidades_servicio': capacidades(servicio.propietario_id),
         'form': form,
         'profesionales': profesionales,
         'calificacion_promedio': calificacion_promedio,
@@ -526,7 +523,10 @@ def dashboard_turnos(request):
         }
         return render(request, 'servicio_suspendido.html', context)
     
-    turnos = Turno.objects.filter(servicio=servicio_activo).select_related('cliente', 'profesional').prefetch_related('sub_servicios_solicitados')
+    # El template lee turno.servicio (plan) y turno.cliente.perfil (teléfono) en cada fila.
+    turnos = Turno.objects.filter(servicio=servicio_activo).select_related(
+        'servicio', 'cliente__perfil', 'profesional'
+    ).prefetch_related('sub_servicios_solicitados')
     ahora = timezone.now()
     hoy = ahora.date()
     turnos_proximos = turnos.filter(Q(fecha__gt=hoy) | Q(fecha=hoy, hora__gte=ahora.time()))
@@ -543,7 +543,9 @@ def dashboard_turnos(request):
     turnos_pasados_base = Turno.objects.filter(
         servicio=servicio_activo,
         fecha__lte=hoy
-    ).exclude(fecha=hoy, hora__gt=ahora.time()).select_related('cliente', 'profesional')
+    ).exclude(fecha=hoy, hora__gt=ahora.time()).select_related(
+        'servicio', 'cliente__perfil', 'profesional'
+    ).prefetch_related('sub_servicios_solicitados')
 
     # 3. Aplicamos el filtro de cliente si se ha seleccionado uno
     if cliente_id_seleccionado and cliente_id_seleccionado.isdigit():
@@ -571,7 +573,7 @@ def dashboard_turnos(request):
 
     # --- FIN DE LA LÓGICA DEL HISTORIAL MEJORADA ---
 
-    es_propietario_prime = servicio_activo.permite_multiples_profesionales
+    es_propietario_prime = capacidades_request(request).multiples_profesionales
         
     context = {
         'servicio_activo': servicio_activo,
@@ -600,62 +602,19 @@ def dashboard_calendario(request):
         return render(request, 'servicio_suspendido.html', context)
     
     hoy = timezone.localdate()
-    año = hoy.year
-    mes = hoy.month
+    año, mes = hoy.year, hoy.month
+    # ?mes=AAAA-MM para navegar a otros meses; si viene mal, se muestra el actual.
+    mes_param = request.GET.get('mes', '')
+    try:
+        año_param, mes_num = (int(parte) for parte in mes_param.split('-'))
+        if 1 <= mes_num <= 12 and 1 < año_param < 9999:
+            año, mes = año_param, mes_num
+    except ValueError:
+        pass
     primer_dia_semana, num_dias = calendar.monthrange(año, mes)
-    
-    turnos_del_mes = Turno.objects.filter(
-        servicio=servicio_activo,
-        fecha__year=año,
-        fecha__month=mes,
-        estado__in=['confirmado', 'pendiente']
-    ).prefetch_related('sub_servicios_solicitados')
-    profesionales_del_servicio = servicio_activo.profesionales.all()
-
-    estado_dias = {}
-    for dia_num in range(1, num_dias + 1):
-        fecha_actual = datetime(año, mes, dia_num).date()
-        turnos_del_dia = [t for t in turnos_del_mes if t.fecha == fecha_actual]
-        conteo_turnos_dia = len(turnos_del_dia)
-
-        if not turnos_del_dia:
-            estado_dias[dia_num] = {'estado': 'vacio', 'conteo': 0}
-            continue
-
-        # Calculamos los minutos laborales totales de TODOS los profesionales para ese día
-        minutos_laborales_totales_del_dia = 0
-        for prof in profesionales_del_servicio:
-            try:
-                dia_de_la_semana_num = fecha_actual.weekday()
-                dia_map = {0: 'lunes', 1: 'martes', 2: 'miercoles', 3: 'jueves', 4: 'viernes', 5: 'sabado', 6: 'domingo'}
-                campo_dia_a_filtrar = dia_map.get(dia_de_la_semana_num)
-                
-                # ¡Buscamos la regla del PROFESIONAL!
-                regla_horario = prof.horarios.filter(activo=True, **{campo_dia_a_filtrar: True}).first()
-
-                if regla_horario:
-                    minutos_jornada = (datetime.combine(datetime.min, regla_horario.horario_cierre) - 
-                                           datetime.combine(datetime.min, regla_horario.horario_apertura)).seconds / 60
-                    minutos_descanso = 0
-                    if regla_horario.tiene_descanso and regla_horario.descanso_inicio and regla_horario.descanso_fin:
-                        minutos_descanso = (datetime.combine(datetime.min, regla_horario.descanso_fin) -
-                                            datetime.combine(datetime.min, regla_horario.descanso_inicio)).seconds / 60
-                    minutos_laborales_totales_del_dia += (minutos_jornada - minutos_descanso)
-            except HorarioLaboral.DoesNotExist:
-                continue # Este profesional no trabaja ese día
-        
-        # El resto de tu lógica de cálculo de porcentaje de ocupación usa el nuevo total
-        if minutos_laborales_totales_del_dia > 0:
-            minutos_reservados = sum(turno.duracion_total for turno in turnos_del_dia)
-            porcentaje_ocupacion = (minutos_reservados / minutos_laborales_totales_del_dia) * 100
-        else:
-            porcentaje_ocupacion = 100
-        estado_css = 'con-turnos'
-        if porcentaje_ocupacion >= 90:
-            estado_css = 'lleno'
-        elif porcentaje_ocupacion >= 50:
-            estado_css = 'casi-lleno'
-        estado_dias[dia_num] = {'estado': estado_css, 'conteo': conteo_turnos_dia}
+    estado_dias = ocupacion_mes(servicio_activo, año, mes)
+    mes_anterior = (año, mes - 1) if mes > 1 else (año - 1, 12)
+    mes_siguiente = (año, mes + 1) if mes < 12 else (año + 1, 1)
     nombre_del_mes = calendar.month_name[mes].capitalize()
     calendar_data_for_js = {
         'año': año,
@@ -671,6 +630,9 @@ def dashboard_calendario(request):
         'offset_dias': range(primer_dia_semana),
         'estado_dias': estado_dias,
         'calendar_data': calendar_data_for_js,
+        'mes_anterior': '%04d-%02d' % mes_anterior,
+        'mes_siguiente': '%04d-%02d' % mes_siguiente,
+        'es_mes_actual': (año, mes) == (hoy.year, hoy.month),
     }
     return render(request, 'dashboard_calendario.html', context)
 
@@ -684,7 +646,8 @@ def api_turnos_por_dia(request):
         fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
     except ValueError:
         return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
-    
+
+    ocupacion = ocupacion_del_dia(servicio_activo, fecha)
     turnos = Turno.objects.filter(
         servicio=servicio_activo,
         fecha=fecha,
@@ -694,7 +657,7 @@ def api_turnos_por_dia(request):
         'profesional'
     ).prefetch_related('sub_servicios_solicitados').order_by('hora')
 
-    es_servicio_prime = servicio_activo.permite_multiples_profesionales
+    es_servicio_prime = capacidades_request(request).multiples_profesionales
     
     datos_turnos = []
     for turno in turnos:
@@ -718,7 +681,8 @@ def api_turnos_por_dia(request):
     
     return JsonResponse({
         'turnos': datos_turnos,
-        'es_servicio_prime': es_servicio_prime
+        'es_servicio_prime': es_servicio_prime,
+        'ocupacion': ocupacion,
     })
 
 @login_required
@@ -844,11 +808,7 @@ def dashboard_horarios(request):
 
 @login_required
 def dashboard_metricas(request):
-    try:
-        suscripcion = request.user.suscripcion
-        tiene_acceso = suscripcion.is_active and suscripcion.plan.allow_metrics
-    except (Suscripcion.DoesNotExist, AttributeError):
-        tiene_acceso = False
+    tiene_acceso = capacidades_request(request).metricas
         
     servicio_activo = get_servicio_activo(request)
     if not servicio_activo:
@@ -873,15 +833,11 @@ def dashboard_metricas(request):
         fecha_inicio = hoy - timedelta(days=29)
         titulo_periodo = "Últimos 30 días"
         
-    # Queryset base filtrado
+    # KPIs, sub-servicios y profesionales salen de las tablas diarias de myapp/metrics.py.
+    resumen = resumen_periodo(servicio_activo, fecha_inicio, hoy)
     turnos_completados_periodo = Turno.objects.filter(
         servicio=servicio_activo, estado='completado', fecha__gte=fecha_inicio, fecha__lte=hoy
     )
-    
-    # Calcular KPIs
-    agregados = turnos_completados_periodo.aggregate(
-        ingresos_totales=Sum('ingreso_real'), turnos_totales=Count('id'), ingreso_promedio=Avg('ingreso_real')
-    )
     cliente_top = turnos_completados_periodo.values(
         'cliente__id', # Añadimos el ID para poder buscar su perfil
         'cliente__first_name', 
@@ -898,17 +854,14 @@ def dashboard_metricas(request):
         except PerfilUsuario.DoesNotExist:
             cliente_top['cliente__telefono'] = 'No especificado'
     
-    subservicios_populares_data = turnos_completados_periodo.values('sub_servicios_solicitados__nombre').annotate(
-        cantidad=Count('sub_servicios_solicitados__nombre')).exclude(sub_servicios_solicitados__nombre=None).order_by('-cantidad')[:5]
-
-    labels_servicios = [item['sub_servicios_solicitados__nombre'] for item in subservicios_populares_data]
-    data_servicios = [item['cantidad'] for item in subservicios_populares_data]
+    subservicios_populares_data = sub_servicios_populares(servicio_activo, fecha_inicio, hoy)
+    labels_servicios = [nombre for nombre, _ in subservicios_populares_data]
+    data_servicios = [cantidad for _, cantidad in subservicios_populares_data]
     
-    es_propietario_prime = servicio_activo.permite_multiples_profesionales
+    es_propietario_prime = capacidades_request(request).multiples_profesionales
     metricas_por_profesional = None
     if es_propietario_prime:
-        metricas_por_profesional = turnos_completados_periodo.filter(profesional__isnull=False).values(
-            'profesional__nombre').annotate(total_ingresos=Sum('ingreso_real'), cantidad_turnos=Count('id')).order_by('-total_ingresos')
+        metricas_por_profesional = ingresos_por_profesional(servicio_activo, fecha_inicio, hoy)
         
     context = {
         'servicio_activo': servicio_activo,
@@ -916,9 +869,9 @@ def dashboard_metricas(request):
         'periodo_seleccionado': periodo,
         'titulo_periodo': titulo_periodo,
         'onboarding_completo': True,
-        'ingresos_totales': agregados['ingresos_totales'] or 0,
-        'turnos_totales': agregados['turnos_totales'] or 0,
-        'ingreso_promedio': agregados['ingreso_promedio'] or 0,
+        'ingresos_totales': resumen['ingresos_totales'],
+        'turnos_totales': resumen['turnos_totales'],
+        'ingreso_promedio': resumen['ingreso_promedio'],
         'cliente_top': cliente_top,
         'labels_servicios_json': labels_servicios,
         'data_servicios_json': data_servicios,
@@ -939,54 +892,84 @@ def api_metricas_grafico(request):
     vista = request.GET.get('vista', 'total')
     
     hoy = timezone.localdate()
-    qs_base = Turno.objects.filter(servicio=servicio_activo, estado='completado')
+    por_profesional = vista != 'total' and capacidades_request(request).multiples_profesionales
 
-    # Filtramos el queryset base por el rango de fechas seleccionado
+    # Rango de fechas del período seleccionado
+    try:
+        if agrupar_por == 'dia':
+            fecha_str = request.GET.get('fecha', hoy.strftime('%Y-%m-%d'))
+            desde = hasta = datetime.strptime(fecha_str, '%Y-%m-%d').date()
+        elif agrupar_por == 'mes':
+            mes_str = request.GET.get('mes', hoy.strftime('%Y-%m'))
+            mes = datetime.strptime(mes_str, '%Y-%m')
+            ultimo_dia = calendar.monthrange(mes.year, mes.month)[1]
+            desde, hasta = mes.date(), mes.replace(day=ultimo_dia).date()
+        else: # año
+            agrupar_por = 'año'
+            año = int(request.GET.get('año', str(hoy.year)))
+            desde, hasta = datetime(año, 1, 1).date(), datetime(año, 12, 31).date()
+    except ValueError:
+        return JsonResponse({'error': 'Período inválido'}, status=400)
+
+    # ETag = versión de los datos del período; si el navegador ya la tiene, 304 sin tocar la base.
+    version = version_datos(servicio_activo.id, desde, hasta)
+    clave = f'metricas:grafico:{servicio_activo.id}:{agrupar_por}:{desde.isoformat()}:{int(por_profesional)}:{version}'
+    etag = quote_etag(hashlib.md5(clave.encode()).hexdigest())
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        return no_modificado
+
+    datos = obtener_o_calcular(
+        clave,
+        lambda: _grafico_ingresos(servicio_activo, agrupar_por, desde, hasta, por_profesional),
+        timeout_grafico(hasta, hoy),
+    )
+    response = JsonResponse(datos)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _grafico_ingresos(servicio_activo, agrupar_por, desde, hasta, por_profesional):
+    """Labels y datasets de Chart.js para el gráfico de ingresos de api_metricas_grafico."""
     if agrupar_por == 'dia':
-        fecha_str = request.GET.get('fecha', hoy.strftime('%Y-%m-%d'))
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-        qs = qs_base.filter(fecha=fecha)
-        trunc_func = TruncHour('hora')
+        # Por hora sale de Turno: es un solo día y las tablas diarias no guardan la hora.
+        qs = Turno.objects.filter(servicio=servicio_activo, estado='completado', fecha=desde)
+        campos, orden = ['periodo'], ['periodo']
+        if por_profesional:
+            qs = qs.filter(profesional__isnull=False)
+            campos, orden = ['periodo', 'profesional__nombre'], ['profesional__nombre', 'periodo']
+        datos = qs.annotate(periodo=TruncHour('hora')).values(*campos).annotate(
+            total=Sum('ingreso_real')
+        ).order_by(*orden)
         label_format = '%H:%M hs'
     elif agrupar_por == 'mes':
-        mes_str = request.GET.get('mes', hoy.strftime('%Y-%m'))
-        mes = datetime.strptime(mes_str, '%Y-%m')
-        qs = qs_base.filter(fecha__year=mes.year, fecha__month=mes.month)
-        trunc_func = TruncDay('fecha')
+        datos = serie_ingresos(servicio_activo, desde, hasta, por_profesional=por_profesional)
         label_format = '%d/%m'
     else: # año
-        año_str = request.GET.get('año', str(hoy.year))
-        año = int(año_str)
-        qs = qs_base.filter(fecha__year=año)
-        trunc_func = TruncMonth('fecha')
+        datos = serie_ingresos(
+            servicio_activo, desde, hasta, agrupar_por_mes=True, por_profesional=por_profesional,
+        )
         label_format = '%b %Y'
 
     # Si la vista es "total" o el usuario no es prime
-    if vista == 'total' or not servicio_activo.permite_multiples_profesionales:
-        datos = qs.annotate(periodo=trunc_func).values('periodo').annotate(
-            total=Sum('ingreso_real')
-        ).order_by('periodo')
-        
+    if not por_profesional:
         labels = [d['periodo'].strftime(label_format) for d in datos]
         datasets = [{
             'label': 'Ingresos Totales',
             'data': [float(d['total']) if d['total'] else 0 for d in datos],
         }]
-        return JsonResponse({'labels': labels, 'datasets': datasets})
+        return {'labels': labels, 'datasets': datasets}
     
     # Si la vista es "profesional" Y el usuario es prime
     else:
-        datos_crudos = qs.filter(profesional__isnull=False).annotate(periodo=trunc_func).values(
-            'periodo', 'profesional__nombre'
-        ).annotate(
-            total=Sum('ingreso_real')
-        ).order_by('profesional__nombre', 'periodo')
+        datos_crudos = datos
 
         datos_por_profesional = defaultdict(dict)
         todos_los_periodos = sorted(list(set(d['periodo'] for d in datos_crudos)))
         
         for d in datos_crudos:
-            datos_por_profesional[d['profesional__nombre']][d['periodo']] = float(d['total'])
+            datos_por_profesional[d['profesional__nombre']][d['periodo']] = float(d['total'] or 0)
 
         labels = [p.strftime(label_format) for p in todos_los_periodos]
         datasets = []
@@ -1001,15 +984,11 @@ def api_metricas_grafico(request):
                 'backgroundColor': color + '33', # '33' añade transparencia en hexadecimal
             })
         
-        return JsonResponse({'labels': labels, 'datasets': datasets})
+        return {'labels': labels, 'datasets': datasets}
 
 @login_required
 def dashboard_servicios(request): # Apariencia
-    try:
-        suscripcion = request.user.suscripcion
-        tiene_acceso = suscripcion.is_active and suscripcion.plan.allow_customization
-    except (Suscripcion.DoesNotExist, AttributeError):
-        tiene_acceso = False
+    tiene_acceso = capacidades_request(request).personalizacion
     
     if not tiene_acceso and request.method == 'POST':
         messages.error(request, "Necesitas un plan activo para realizar esta acción.")
@@ -1144,26 +1123,7 @@ def confirmar_turno(request, turno_id):
         turno.estado = 'confirmado'
         turno.visto_por_cliente = False
         turno.save()
-        negocio = turno.servicio.nombre
-        tid = turno.id
-        mis_url = mis_turnos_link(request)
-
-        def dispatch_confirm_email():
-            t = Turno.objects.select_related('servicio').get(pk=tid)
-            cliente_mail = (t.cliente.email or '').strip()
-            if not cliente_mail:
-                return
-            send_email_with_fallback(
-                cliente_mail,
-                f'Tu turno ha sido confirmado por {negocio}',
-                html_booking_accepted_client(t, negocio, mis_url),
-                'booking_accepted',
-                idempotency_key=f'accept-{tid}',
-                template_id='turno-aceptado-cliente',
-                template_data=template_data_booking_accepted_client(t, negocio, mis_url),
-            )
-
-        schedule_background(dispatch_confirm_email)
+        schedule_booking_accepted_email(turno.id, turno.servicio.nombre, mis_turnos_link(request))
 
         messages.success(request, f"Turno confirmado. Se notificó a {turno.cliente.first_name or 'el cliente'} por correo si el envío estuvo disponible.")
     return redirect('dashboard_propietario')
@@ -1181,41 +1141,7 @@ def cancelar_turno(request, turno_id):
         turno.save()
 
         servicio_abs = request.build_absolute_uri(reverse('servicio_detail', args=[turno.servicio.slug]))
-        fue_pendiente_flag = fue_pendiente
-        tid = turno.id
-        nombre_servicio = turno.servicio.nombre
-
-        def dispatch_cancel_emails():
-            t = Turno.objects.select_related('servicio').get(pk=tid)
-            cliente_mail = (t.cliente.email or '').strip()
-            if not cliente_mail:
-                return
-            if fue_pendiente_flag:
-                send_email_with_fallback(
-                    cliente_mail,
-                    'Tu turno fue rechazado, puedes reagendar',
-                    html_booking_rejected_client(t, nombre_servicio, servicio_abs),
-                    'booking_rejected',
-                    idempotency_key=f'reject-{tid}',
-                    template_id='turno-rechazado-cliente',
-                    template_data=template_data_booking_rejected_client(
-                        t, nombre_servicio, servicio_abs,
-                    ),
-                )
-            else:
-                send_email_with_fallback(
-                    cliente_mail,
-                    f'Información sobre tu turno en {nombre_servicio}',
-                    html_booking_cancelled_owner(nombre_servicio, servicio_abs),
-                    'booking_cancelled_owner',
-                    idempotency_key=f'cancel-owner-{tid}',
-                    template_id='turno-cancelado-cliente',
-                    template_data=template_data_booking_cancelled_owner(
-                        t.cliente.first_name, nombre_servicio, servicio_abs,
-                    ),
-                )
-
-        schedule_background(dispatch_cancel_emails)
+        schedule_booking_cancel_emails(turno.id, fue_pendiente, turno.servicio.nombre, servicio_abs)
         messages.info(request, "Actualizamos el turno y al cliente si el correo pudo enviarse.")
     return redirect('dashboard_propietario')
 
@@ -1233,6 +1159,8 @@ def finalizar_turno(request, turno_id):
         if form.is_valid():
             instancia_turno = form.save(commit=False)
             instancia_turno.estado = 'completado'
+            # No está en Meta.fields del form: hay que copiarlo a mano.
+            instancia_turno.medio_de_pago_final = form.cleaned_data['medio_de_pago_final']
             instancia_turno.save()
             if turno.ingreso_real is None:
                 messages.success(request, f"¡Turno de {turno.cliente.username} finalizado con éxito!")
@@ -1269,101 +1197,105 @@ def obtener_notificaciones(request):
 
     return JsonResponse({'conteo': conteo_notificaciones})
 
+def _valores_de_parametro(request, nombre):
+    """Valores de un parámetro GET que puede repetirse o venir separado por comas."""
+    return [
+        valor.strip()
+        for parametro in request.GET.getlist(nombre)
+        for valor in parametro.split(',')
+        if valor.strip()
+    ]
+
 @login_required
 def obtener_slots_disponibles(request, servicio_id):
-    # --- Obtención de parámetros (tu código está bien) ---
+    """
+    Slots libres de un día. Sin ``profesional_id`` (o con ``cualquiera``) devuelve la unión
+    de todos los profesionales activos que ofrecen los ``sub_servicios`` pedidos.
+    """
     fecha_str = request.GET.get('fecha')
     duracion_str = request.GET.get('duracion')
-    profesional_id_str = request.GET.get('profesional_id')
+    profesional_id_str = request.GET.get('profesional_id') or PROFESIONAL_CUALQUIERA
     
-    if not all([fecha_str, duracion_str, profesional_id_str]):
+    if not all([fecha_str, duracion_str]):
         return JsonResponse({'error': 'Faltan parámetros.'}, status=400)
 
     try:
         fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
         servicio = get_object_or_404(Servicio, id=servicio_id)
         duracion_requerida = int(duracion_str)
-        profesional_id = int(profesional_id_str)
-        profesional_a_consultar = Profesional.objects.get(id=profesional_id, servicio=servicio, activo=True)
+        sub_servicio_ids = [int(valor) for valor in _valores_de_parametro(request, 'sub_servicios')]
+        if profesional_id_str == PROFESIONAL_CUALQUIERA:
+            profesional_a_consultar = None
+        else:
+            profesional_a_consultar = Profesional.objects.get(id=int(profesional_id_str), servicio=servicio, activo=True)
     except (ValueError, TypeError, Servicio.DoesNotExist, Profesional.DoesNotExist):
         return JsonResponse({'error': 'Parámetros inválidos o recurso no encontrado.'}, status=400)
 
-    # --- Obtención de reglas y datos existentes (tu código está bien) ---
-    dia_de_la_semana_num = fecha.weekday()
-    dia_map = {0: 'lunes', 1: 'martes', 2: 'miercoles', 3: 'jueves', 4: 'viernes', 5: 'sabado', 6: 'domingo'}
-    nombre_dia_semana = dia_map.get(dia_de_la_semana_num)
+    if profesional_a_consultar is not None:
+        slots = slots_disponibles(
+            profesional_a_consultar, fecha, duracion_requerida, servicio.duracion_buffer_minutos,
+        )
+        return JsonResponse({'slots': slots})
 
-    try:
-        regla_horario = profesional_a_consultar.horarios.get(activo=True, **{nombre_dia_semana: True})
-    except (HorarioLaboral.DoesNotExist, HorarioLaboral.MultipleObjectsReturned):
-        return JsonResponse({'slots': []})
+    candidatos = profesionales_candidatos(servicio, sub_servicio_ids)
+    por_profesional = slots_rango(
+        servicio.id, candidatos, fecha, fecha, duracion_requerida, servicio.duracion_buffer_minutos,
+    )[fecha]
+    return JsonResponse({'slots': unir_slots(por_profesional)})
 
-    turnos_ocupados = Turno.objects.filter(
-        profesional=profesional_a_consultar, fecha=fecha, estado__in=['pendiente', 'confirmado']
-    )
-    bloqueos_del_dia = DiaNoDisponible.objects.filter(
-        profesional=profesional_a_consultar,
-        fecha_inicio__lte=fecha, fecha_fin__gte=fecha
-    )
+@login_required
+def obtener_slots_rango(request, servicio_id):
+    """
+    Slots libres de uno o más profesionales para todos los días de ``desde``..``hasta``
+    (máx. MAX_DIAS_RANGO días) en una sola respuesta y con un número fijo de consultas.
+    ``profesional_id`` puede repetirse o venir separado por comas; con ``cualquiera``
+    se agrega la clave ``cualquiera`` con la unión de los candidatos para ``sub_servicios``.
+    """
+    desde_str = request.GET.get('desde')
+    hasta_str = request.GET.get('hasta')
+    duracion_str = request.GET.get('duracion')
+    ids_crudos = _valores_de_parametro(request, 'profesional_id')
 
-    # =======================================================
-    # ========= INICIO DE LA LÓGICA CORREGIDA Y FINAL =========
-    # =======================================================
-    
-    slots_disponibles = []
-    duracion_requerida_td = timedelta(minutes=duracion_requerida)
-    ahora_dt = timezone.localtime()
-    
-    periodos_de_trabajo = []
-    apertura, cierre = regla_horario.horario_apertura, regla_horario.horario_cierre
-    if regla_horario.tiene_descanso and regla_horario.descanso_inicio and regla_horario.descanso_fin:
-        periodos_de_trabajo.append((apertura, regla_horario.descanso_inicio))
-        periodos_de_trabajo.append((regla_horario.descanso_fin, cierre))
-    else:
-        periodos_de_trabajo.append((apertura, cierre))
-        
-    for inicio_periodo, fin_periodo in periodos_de_trabajo:
-        
-        # 1. Empezamos a generar slots desde el inicio del período de trabajo
-        slot_actual_dt = datetime.combine(fecha, inicio_periodo)
-        fin_periodo_dt = datetime.combine(fecha, fin_periodo)
+    if not all([desde_str, hasta_str, duracion_str, ids_crudos]):
+        return JsonResponse({'error': 'Faltan parámetros.'}, status=400)
 
-        # 2. Bucle principal para generar y validar slots
-        while slot_actual_dt + duracion_requerida_td <= fin_periodo_dt:
-            
-            # === CORRECCIÓN CLAVE: La comprobación de la hora se hace DENTRO del bucle ===
-            # Si el slot que estamos evaluando (ej: 08:00) es anterior a la hora actual,
-            # simplemente lo ignoramos y pasamos al siguiente.
-            if fecha == ahora_dt.date() and slot_actual_dt.time() < ahora_dt.time():
-                slot_actual_dt += timedelta(minutes=15)
-                continue # Salta a la siguiente iteración del bucle
-            
-            slot_fin_dt = slot_actual_dt + duracion_requerida_td
-            slot_esta_disponible = True
-
-            # Comprobación de bloqueos y turnos (tu lógica aquí es correcta)
-            for bloqueo in bloqueos_del_dia:
-                if bloqueo.hora_inicio is None: slot_esta_disponible = False; break
-                if slot_actual_dt.time() < bloqueo.hora_fin and slot_fin_dt.time() > bloqueo.hora_inicio:
-                    slot_esta_disponible = False
-                    break
-            if not slot_esta_disponible:
-                slot_actual_dt += timedelta(minutes=15)
-                continue
-
-            for turno in turnos_ocupados:
-                turno_inicio_dt = datetime.combine(fecha, turno.hora)
-                turno_fin_dt = turno_inicio_dt + timedelta(minutes=turno.duracion_total + servicio.duracion_buffer_minutos)
-                if slot_actual_dt < turno_fin_dt and slot_fin_dt > turno_inicio_dt:
-                    slot_esta_disponible = False
-                    break
-            
-            if slot_esta_disponible:
-                slots_disponibles.append(slot_actual_dt.strftime('%H:%M'))
-            
-            slot_actual_dt += timedelta(minutes=15)
+    agregar_cualquiera = PROFESIONAL_CUALQUIERA in ids_crudos
+    try:
+        desde = datetime.strptime(desde_str, '%Y-%m-%d').date()
+        hasta = datetime.strptime(hasta_str, '%Y-%m-%d').date()
+        duracion_requerida = int(duracion_str)
+        profesional_ids = {int(valor) for valor in ids_crudos if valor != PROFESIONAL_CUALQUIERA}
+        sub_servicio_ids = [int(valor) for valor in _valores_de_parametro(request, 'sub_servicios')]
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Parámetros inválidos.'}, status=400)
+
+    if hasta < desde or (hasta - desde).days >= MAX_DIAS_RANGO:
+        return JsonResponse(
+            {'error': f'El rango debe ser de 1 a {MAX_DIAS_RANGO} días.'}, status=400,
+        )
 
-    return JsonResponse({'slots': sorted(list(set(slots_disponibles)))})
+    servicio = get_object_or_404(Servicio, id=servicio_id)
+    profesionales_validos = list(
+        servicio.profesionales.filter(id__in=profesional_ids, activo=True).values_list('id', flat=True)
+    )
+    if len(profesionales_validos) != len(profesional_ids):
+        return JsonResponse({'error': 'Profesional inválido.'}, status=400)
+
+    candidatos = profesionales_candidatos(servicio, sub_servicio_ids) if agregar_cualquiera else []
+    a_calcular = sorted(set(profesionales_validos) | set(candidatos))
+    por_fecha = slots_rango(
+        servicio.id, a_calcular, desde, hasta, duracion_requerida, servicio.duracion_buffer_minutos,
+    )
+    dias = {}
+    for fecha, slots_por_prof in por_fecha.items():
+        slots = {str(prof_id): slots_por_prof[prof_id] for prof_id in profesionales_validos}
+        if agregar_cualquiera:
+            slots[PROFESIONAL_CUALQUIERA] = unir_slots({pid: slots_por_prof[pid] for pid in candidatos})
+        dias[fecha.strftime('%Y-%m-%d')] = {
+            'slots': slots,
+            'disponible': any(slots.values()),
+        }
+    return JsonResponse({'desde': desde_str, 'hasta': hasta_str, 'dias': dias})
 
 @login_required
 def editar_perfil(request):
@@ -1454,7 +1386,7 @@ class CustomLoginView(LoginView):
 @login_required
 def gestionar_equipo(request, servicio_id):
     servicio = get_object_or_404(Servicio, id=servicio_id, propietario=request.user)
-    tiene_acceso_prime = servicio.permite_multiples_profesionales
+    tiene_acceso_prime = capacidades_request(request).multiples_profesionales
     
     profesionales = servicio.profesionales.all().order_by('nombre')
     
@@ -1470,7 +1402,7 @@ def gestionar_equipo(request, servicio_id):
 @login_required
 def crear_profesional(request, servicio_id):
     servicio = get_object_or_404(Servicio, id=servicio_id, propietario=request.user)
-    if not servicio.permite_multiples_profesionales:
+    if not capacidades_request(request).multiples_profesionales:
         messages.error(request, "Esta función requiere un plan Prime.")
         return redirect('dashboard_propietario')
 
@@ -1586,15 +1518,12 @@ def eliminar_profesional(request, profesional_id):
 
 @login_required
 def obtener_notificaciones_propietario(request):
-    if not request.user.is_authenticated or not request.user.servicios_propios.exists():
+    if not estado_usuario(request).tiene_servicios:
         return JsonResponse({'conteo': 0})
 
-    total_pendientes = 0
-    servicios_del_propietario = request.user.servicios_propios.all()
-    
-    for servicio in servicios_del_propietario:
-        total_pendientes += Turno.objects.filter(servicio=servicio, estado='pendiente').count()
-
+    total_pendientes = Turno.objects.filter(
+        servicio__propietario=request.user, estado='pendiente'
+    ).count()
     return JsonResponse({'conteo': total_pendientes})
 
 def get_horario_profesional_api(request, profesional_id):
@@ -1649,20 +1578,17 @@ def resend_verification_email_view(request):
             messages.info(request, 'Esa cuenta ya está verificada. Podés iniciar sesión.')
             return redirect('account_login')
         if user:
-            send_verification_email(user, request)
+            schedule_verification_email(user)
         messages.success(request, ok_msg)
         return redirect('account_login')
 
     return render(request, 'resend_verification.html')
 
 
-@csrf_exempt
-@require_POST
-def cron_send_reminders_http(request):
+def _cron_no_autorizado(request):
     """
-    Dispara el mismo trabajo que ``manage.py send_reminders``.
-    Protección: cabecera ``X-Cron-Secret`` igual a ``REMINDER_CRON_SECRET`` en el entorno.
-    Alternativa gratuita al cron nativo de Render: https://cron-job.org u otro llamando a esta URL cada 5 minutos.
+    Protección de los endpoints de cron: cabecera ``X-Cron-Secret`` (o ``secret`` por POST) igual a
+    ``REMINDER_CRON_SECRET`` en el entorno. Devuelve la respuesta de error, o None si pasa.
     """
     secret = (getattr(settings, 'REMINDER_CRON_SECRET', None) or '').strip()
     if not secret:
@@ -1676,11 +1602,52 @@ def cron_send_reminders_http(request):
 
     if len(got) != len(secret) or not constant_time_compare(got, secret):
         return HttpResponse('Forbidden', status=403, content_type='text/plain; charset=utf-8')
+    return None
+
+
+def _corrida_json(request, corrida, **extra):
+    estado_url = request.build_absolute_uri(reverse('cron_send_reminders_estado', args=[corrida.pk]))
+    contadores = corrida.contadores or {}
+    return {
+        'corrida': corrida.pk,
+        'estado': corrida.estado,
+        'estado_url': estado_url,
+        'creada': corrida.creada.isoformat(),
+        'iniciada': corrida.iniciada.isoformat() if corrida.iniciada else None,
+        'terminada': corrida.terminada.isoformat() if corrida.terminada else None,
+        'duracion_segundos': corrida.duracion,
+        'candidatos': contadores.get('candidatos'),
+        'procesados': contadores.get('procesados', 0),
+        'enviados': contadores.get('enviados', 0),
+        'fallidos': contadores.get('fallidos', 0),
+        'omitidos': contadores.get('omitidos', 0),
+        'error': corrida.error,
+        **extra,
+    }
 
-    from io import StringIO
-    from django.core.management import call_command
 
-    buf = StringIO()
-    call_command('send_reminders', stdout=buf)
-    body = buf.getvalue()
-    return HttpResponse(body, content_type='text/plain; charset=utf-8')
+@csrf_exempt
+@require_POST
+def cron_send_reminders_http(request):
+    """
+    Pide una corrida de ``send_reminders`` y responde 202 al instante con su id; la ejecuta
+    ``process_tasks``. Si ya hay una activa (disparos que se pisan) devuelve esa con ``nueva: false``.
+    Alternativa gratuita al cron nativo de Render: https://cron-job.org u otro llamando a esta URL cada 5 minutos.
+    """
+    error = _cron_no_autorizado(request)
+    if error is not None:
+        return error
+    corrida, nueva = pedir_corrida()
+    datos = _corrida_json(request, corrida, nueva=nueva)
+    respuesta = JsonResponse(datos, status=202)
+    respuesta['Location'] = datos['estado_url']
+    return respuesta
+
+
+def cron_send_reminders_estado(request, corrida_id):
+    """Progreso de una corrida pedida por ``cron_send_reminders_http`` (misma protección)."""
+    error = _cron_no_autorizado(request)
+    if error is not None:
+        return error
+    corrida = get_object_or_404(CorridaRecordatorios, pk=corrida_id)
+    return JsonResponse(_corrida_json(request, corrida))
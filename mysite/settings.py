@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.ContarConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,6 +84,28 @@ DATABASES = {
     )
 }
 
+# Caché compartida (slots, estado de cuenta, versiones, circuit breaker de Pidgeon). start.sh corre
+# Gunicorn, process_tasks y run_reminder_scheduler en procesos separados: lo que uno invalida lo
+# tienen que ver los otros, así que en producción la caché tiene que ser compartida (Redis con
+# CACHE_URL=redis://..., o la base: start.sh crea la tabla de dbcache). locmem sólo sirve con un
+# único proceso (desarrollo, tests); el check myapp.E001 lo exige con CACHE_COMPARTIDA_REQUERIDA.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://cache_compartida' if IS_PRODUCTION else 'locmemcache://'),
+}
+CACHE_COMPARTIDA_REQUERIDA = env.bool('CACHE_COMPARTIDA_REQUERIDA', default=IS_PRODUCTION)
+# Segundos que vive una entrada de slots; la invalidación por signals es exacta,
+# el TTL sólo acota memoria y desfasajes entre procesos con caché local.
+SLOTS_CACHE_TIMEOUT = env.int('SLOTS_CACHE_TIMEOUT', default=300)
+# Respuestas de api_metricas_grafico (versionadas por mes): período en curso y períodos cerrados.
+METRICAS_CACHE_TIMEOUT = env.int('METRICAS_CACHE_TIMEOUT', default=300)
+METRICAS_CACHE_TIMEOUT_HISTORICO = env.int('METRICAS_CACHE_TIMEOUT_HISTORICO', default=7 * 24 * 3600)
+# Estado de cuenta por usuario (suscripción, plan, email verificado) que leen middlewares y context processors.
+ESTADO_USUARIO_CACHE_TIMEOUT = env.int('ESTADO_USUARIO_CACHE_TIMEOUT', default=600)
+# Cuánto confía cada proceso en las capacidades que ya resolvió antes de volver a mirar la versión.
+CAPACIDADES_MEMO_SECONDS = env.float('CAPACIDADES_MEMO_SECONDS', default=5.0)
+# Cabeceras X-Consultas / Server-Timing por request (para `manage.py bench_http`); apagado en producción.
+CONTAR_CONSULTAS = env.bool('CONTAR_CONSULTAS', default=False)
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -126,6 +149,19 @@ else:
 GOOGLE_MAPS_API_KEY = env('GOOGLE_MAPS_API_KEY')
 
 MERCADOPAGO_ACCESS_TOKEN = env('MERCADOPAGO_ACCESS_TOKEN')
+# Cliente de la API de MP (myapp/mp_gateway.py). En pruebas y benchmarks la URL apunta al
+# MP falso (`manage.py fake_mercadopago`).
+MERCADOPAGO_API_URL = env('MERCADOPAGO_API_URL', default='https://api.mercadopago.com')
+MERCADOPAGO_CONNECT_TIMEOUT = env.float('MERCADOPAGO_CONNECT_TIMEOUT', default=3.05)
+MERCADOPAGO_TIMEOUT = env.float('MERCADOPAGO_TIMEOUT', default=10.0)
+# Reintentos ante errores de red, 429 y 5xx (corren dentro de la request del usuario: pocos).
+MERCADOPAGO_RETRIES = env.int('MERCADOPAGO_RETRIES', default=2)
+# Tope de cada llamada contando reintentos y backoff: por debajo de los 30 s de Gunicorn.
+MERCADOPAGO_TOTAL_TIMEOUT = env.float('MERCADOPAGO_TOTAL_TIMEOUT', default=20.0)
+MERCADOPAGO_POOL_MAXSIZE = env.int('MERCADOPAGO_POOL_MAXSIZE', default=10)
+# El webhook encola el procesamiento con esta demora: las notificaciones repetidas de la
+# ráfaga se colapsan en una sola consulta por suscripción.
+MERCADOPAGO_WEBHOOK_DEMORA_SECONDS = env.int('MERCADOPAGO_WEBHOOK_DEMORA_SECONDS', default=5)
 
 ACCOUNT_ADAPTER = 'myapp.adapters.MyAccountAdapter'
 
@@ -185,6 +221,41 @@ PIDGEON_API_VERSION = env('PIDGEON_API_VERSION', default='v2')
 SITE_BASE_URL = env('SITE_BASE_URL', default='https://turnosok.com')
 # Despertar Pidgeon (GET /health) antes del primer POST /send por intento reduce cold-starts en Render free.
 PIDGEON_WAKE_BEFORE_SEND = env.bool('PIDGEON_WAKE_BEFORE_SEND', default=True)
+# El GET /health de despertar se hace a lo sumo una vez por esta ventana (segundos).
+PIDGEON_HEALTH_CACHE_SECONDS = env.int('PIDGEON_HEALTH_CACHE_SECONDS', default=300)
+# Conexiones keep-alive por host en la sesión compartida (≥ TAREAS_CONCURRENCIA).
+PIDGEON_POOL_MAXSIZE = env.int('PIDGEON_POOL_MAXSIZE', default=10)
+# Circuit breaker: tras N fallas seguidas (red o 5xx) no se llama a Pidgeon durante X segundos.
+# El estado vive en la caché: entre procesos sólo se comparte con CACHE_URL (check myapp.E001).
+PIDGEON_CIRCUIT_FAILURES = env.int('PIDGEON_CIRCUIT_FAILURES', default=5)
+PIDGEON_CIRCUIT_OPEN_SECONDS = env.float('PIDGEON_CIRCUIT_OPEN_SECONDS', default=60.0)
+# Reintento de EmailFailureLog (`manage.py retry_failed_emails`, y process_tasks cada intervalo).
+EMAIL_RETRY_INTERVAL_SECONDS = env.int('EMAIL_RETRY_INTERVAL_SECONDS', default=300)
+EMAIL_RETRY_BACKOFF_BASE = env.float('EMAIL_RETRY_BACKOFF_BASE', default=60.0)
+EMAIL_RETRY_BACKOFF_MAX = env.float('EMAIL_RETRY_BACKOFF_MAX', default=6 * 3600.0)
+# Con retry_count en este valor la fila deja de reintentarse sola (queda para el admin).
+EMAIL_RETRY_MAX_COUNT = env.int('EMAIL_RETRY_MAX_COUNT', default=10)
+# Recordatorios: minutos antes del inicio del turno, y el scheduler residente
+# (`manage.py run_reminder_scheduler`): sondeo de cambios y recarga completa, en segundos.
+REMINDER_OFFSET_MINUTES = env.int('REMINDER_OFFSET_MINUTES', default=15)
+REMINDER_SCHEDULER_POLL_SECONDS = env.float('REMINDER_SCHEDULER_POLL_SECONDS', default=5.0)
+REMINDER_SCHEDULER_RELOAD_SECONDS = env.int('REMINDER_SCHEDULER_RELOAD_SECONDS', default=3600)
+# send_reminders: envíos en paralelo y turnos por lote (el avance de la corrida se guarda por lote).
+REMINDER_SEND_CONCURRENCY = env.int('REMINDER_SEND_CONCURRENCY', default=8)
+REMINDER_SEND_BATCH = env.int('REMINDER_SEND_BATCH', default=50)
+# Plazo (segundos) de los candados de trabajos (myapp/locks.py); se renuevan mientras corren.
+LOCK_LEASE_SECONDS = env.int('LOCK_LEASE_SECONDS', default=120)
+
+# Cola de tareas (myapp/tasks.py): las vistas encolan y `manage.py process_tasks` ejecuta.
+TAREAS_CONCURRENCIA = env.int('TAREAS_CONCURRENCIA', default=4)
+TAREAS_LOTE = env.int('TAREAS_LOTE', default=20)
+TAREAS_MAX_INTENTOS = env.int('TAREAS_MAX_INTENTOS', default=6)
+# Backoff entre reintentos: base · 2^(intento-1) segundos, con tope.
+TAREAS_BACKOFF_BASE = env.float('TAREAS_BACKOFF_BASE', default=30.0)
+TAREAS_BACKOFF_MAX = env.float('TAREAS_BACKOFF_MAX', default=3600.0)
+# Segundos que una tarea tomada queda reservada; si el worker muere, después se retoma.
+TAREAS_BLOQUEO = env.int('TAREAS_BLOQUEO', default=300)
+TAREAS_RETENCION_DIAS = env.int('TAREAS_RETENCION_DIAS', default=7)
 
 
 if IS_PRODUCTION:
@@ -1,7 +1,18 @@
 #!/usr/bin/env bash
 # Render (Linux): usá esto como Start Command →  bash start.sh
-# Aplica migraciones sin shell manual y levanta Gunicorn.
+# Aplica migraciones sin shell manual, levanta el worker de tareas, el scheduler de
+# recordatorios y Gunicorn.
+# Con un Background Worker aparte (`python manage.py process_tasks`) poné TAREAS_WORKER_EMBEBIDO=0.
 set -o errexit
 
 python manage.py migrate --noinput
+# Tabla de la caché compartida si CACHE_URL es dbcache:// (no hace nada con Redis).
+python manage.py createcachetable
+if [ "${TAREAS_WORKER_EMBEBIDO:-1}" = "1" ]; then
+  python manage.py process_tasks &
+fi
+# Recordatorios en el minuto exacto; con esto el cron de send_reminders queda sólo de respaldo.
+if [ "${RECORDATORIOS_SCHEDULER_EMBEBIDO:-1}" = "1" ]; then
+  python manage.py run_reminder_scheduler &
+fi
 exec gunicorn mysite.wsgi:application --bind "0.0.0.0:${PORT}"